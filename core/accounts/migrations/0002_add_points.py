@@ -9,10 +9,17 @@ class Migration(migrations.Migration):
         ('accounts', '0001_initial'),
     ]
 
+    # 0001_initial already creates Profile.points. SQLite tolerated adding it
+    # again by rebuilding the table; other databases reject the duplicate
+    # column, so this only restates the field.
     operations = [
-        migrations.AddField(
-            model_name='profile',
-            name='points',
-            field=models.IntegerField(default=0),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='profile',
+                    name='points',
+                    field=models.IntegerField(default=0),
+                ),
+            ],
         ),
     ]
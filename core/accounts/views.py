@@ -5,7 +5,8 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import update_session_auth_hash
 from django.conf import settings
-from django.core.mail import EmailMessage
+from jobs.queue import enqueue
+from jobs.tasks import send_email
 from django.utils import timezone
 from django.urls import reverse
 from .models import PasswordReset 
@@ -82,12 +83,13 @@ def ForgotPassword(request):
             # Create new reset request with activation code
             reset = PasswordReset(user=user)
             reset.save()
-            EmailMessage(
+            enqueue(
+                send_email,
                 'Password Reset - Activation Code',
                 f'Your password reset activation code is:\n\n{reset.activation_code}\n\nThis code will expire in 5 minutes.\nEnter this code on the password reset page to continue.',
                 settings.EMAIL_HOST_USER,
                 [email]
-            ).send(fail_silently=False)
+            )
             messages.success(request, f'Activation code sent to {email}. Please check your inbox.')
             return redirect('accounts:enter-activation-code')
         except User.DoesNotExist:
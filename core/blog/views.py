@@ -139,7 +139,11 @@ def public_blog_list(request):
     page_obj = paginator.get_page(page_number)
     page_ids = list(page_obj.object_list)
 
-    products = list(Product.objects.filter(id__in=page_ids).select_related('category_ref', 'subcategory'))
+    products = list(
+        Product.objects.with_discounts()
+        .filter(id__in=page_ids)
+        .select_related('category_ref', 'subcategory')
+    )
     by_id = {p.id: p for p in products}
     ordered_products = [by_id[i] for i in page_ids if i in by_id]
 
@@ -1,16 +1,66 @@
+import time
+
+from django.core.cache import cache
 from django.utils import timezone
-from weather.models import SearchHistory
+from django.utils.functional import SimpleLazyObject
+
 from shop.models import Category
 
+# Header data is cached per source under a version number that is bumped
+# on every change (shop's post_save/post_delete signals, weather/history.py
+# and weather/popular.py), so a change is visible on the next render without
+# waiting for the timeout.
+HEADER_CACHE_TIMEOUT = 60 * 10
+WEATHER = 'weather'
+CATEGORIES = 'categories'
+
+
+def _version_key(group):
+    return f'header:version:{group}'
+
+
+def header_version(group):
+    version = cache.get(_version_key(group))
+    if version is None:
+        # Start from a timestamp so an evicted counter never reuses old keys.
+        cache.add(_version_key(group), time.time_ns(), None)
+        version = cache.get(_version_key(group))
+    return version
+
+
+def bump_header_version(group):
+    try:
+        cache.incr(_version_key(group))
+    except ValueError:
+        cache.set(_version_key(group), time.time_ns(), None)
+
+
+def _cached(group, name, compute):
+    key = f'header:{group}:{name}:{header_version(group)}'
+    hit = cache.get(key)
+    if hit is None:
+        hit = (compute(),)
+        cache.set(key, hit, HEADER_CACHE_TIMEOUT)
+    return hit[0]
+
+
+def _lazy(group, name, compute):
+    return SimpleLazyObject(lambda: _cached(group, name, compute))
+
+
+def _header_weather(count):
+    # Imported here: weather.popular imports this module.
+    from weather.popular import header_weather
+    return header_weather(count)
+
+
 def global_header_data(request):
-    recent_weather = SearchHistory.objects.order_by('-searched_at').first()
-    recent_weather_list = SearchHistory.objects.filter(
-        temperature__isnull=False
-    ).order_by('-searched_at')[:5]
-    categories = Category.objects.all().order_by('name')
     return {
-        'recent_weather': recent_weather,
-        'recent_weather_list': recent_weather_list,
+        'recent_weather': _lazy(WEATHER, 'recent', lambda: next(iter(_header_weather(1)), None)),
+        'recent_weather_list': _lazy(WEATHER, 'recent_list', lambda: _header_weather(5)),
         'now': timezone.now(),
-        'all_categories': categories,
+        'all_categories': _lazy(
+            CATEGORIES, 'all',
+            lambda: list(Category.objects.all().order_by('name')),
+        ),
     }
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class CoreConfig(AppConfig):
+    name = 'core'
+
+    def ready(self):
+        from core import sqlite
+        connection_created.connect(sqlite.configure, dispatch_uid='core.sqlite.configure')
@@ -0,0 +1,150 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.sqlite import apply_pragmas, pragmas
+
+SCHEMA = """
+CREATE TABLE product (id INTEGER PRIMARY KEY, category_id INTEGER, name TEXT, price NUMERIC, description TEXT);
+CREATE INDEX product_category ON product (category_id, id);
+CREATE TABLE cart_item (
+    id INTEGER PRIMARY KEY, cart_id INTEGER, product_id INTEGER, quantity INTEGER,
+    UNIQUE (cart_id, product_id)
+);
+CREATE TABLE session (key TEXT PRIMARY KEY, data TEXT, expire_date TEXT);
+"""
+CATEGORIES = 40
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent requests on SQLite with its default settings and with "
+        "the tuned ones from core/sqlite.py (WAL, busy timeout, immediate transactions). "
+        "Each request saves its session, like SESSION_SAVE_EVERY_REQUEST, and either "
+        "reads a catalog page or adds to a cart. Runs on throwaway database files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16, help="Concurrent clients.")
+        parser.add_argument("--seconds", type=float, default=5, help="Run time per configuration.")
+        parser.add_argument("--products", type=int, default=5000)
+        parser.add_argument("--sessions", type=int, default=500)
+        parser.add_argument("--cart-share", type=float, default=0.2, help="Share of requests adding to a cart.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['threads']} clients, {options['seconds']:g}s each, "
+            f"{options['cart_share']:.0%} cart adds"
+        )
+        self.stdout.write(
+            f"{'settings':<10} {'requests':>9} {'per second':>11} {'p50 ms':>8} {'p99 ms':>8} {'locked':>7}"
+        )
+        for label, tuned in (("default", False), ("tuned", True)):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "benchmark.sqlite3")
+                self._create(path, options["products"], options["sessions"])
+                timings, locked = self._run(path, tuned, options)
+            timings.sort()
+            p99 = timings[int(len(timings) * 0.99) - 1] if timings else 0
+            self.stdout.write(
+                f"{label:<10} {len(timings):>9} {len(timings) / options['seconds']:>11.0f} "
+                f"{statistics.median(timings) if timings else 0:>8.2f} {p99:>8.2f} {locked:>7}"
+            )
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    @staticmethod
+    def _create(path, products, sessions):
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.executescript(SCHEMA)
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO product VALUES (?, ?, ?, ?, ?)",
+            ((i, i % CATEGORIES, f"Product {i}", 10 + i % 90, "x" * 200) for i in range(1, products + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO session VALUES (?, ?, '')", ((f"s{i}", "{}") for i in range(sessions))
+        )
+        conn.execute("COMMIT")
+        conn.close()
+
+    @staticmethod
+    def _connect(path, tuned):
+        # isolation_level=None and explicit BEGINs, as Django drives SQLite.
+        conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        if tuned:
+            apply_pragmas(conn, pragmas())
+        return conn
+
+    def _run(self, path, tuned, options):
+        """Return (request latencies in ms, requests failed with "database is locked")."""
+        begin = "BEGIN IMMEDIATE" if tuned else "BEGIN"
+        products, sessions, cart_share = options["products"], options["sessions"], options["cart_share"]
+        barrier = threading.Barrier(options["threads"] + 1)  # start every client at once
+        results = []
+        lock = threading.Lock()
+
+        def transaction(conn, statements):
+            conn.execute(begin)
+            try:
+                statements()
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+        def add_to_cart(conn, cart, product):
+            row = conn.execute(
+                "SELECT id, quantity FROM cart_item WHERE cart_id = ? AND product_id = ?", (cart, product)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE cart_item SET quantity = ? WHERE id = ?", (row[1] + 1, row[0]))
+            else:
+                conn.execute("INSERT INTO cart_item (cart_id, product_id, quantity) VALUES (?, ?, 1)", (cart, product))
+
+        def client():
+            conn = self._connect(path, tuned)
+            rng = random.Random()
+            timings, locked = [], 0
+            barrier.wait()
+            deadline = time.perf_counter() + options["seconds"]
+            while time.perf_counter() < deadline:
+                session = rng.randrange(sessions)
+                start = time.perf_counter()
+                try:
+                    if rng.random() < cart_share:
+                        product = rng.randrange(1, products + 1)
+                        transaction(conn, lambda: add_to_cart(conn, session, product))
+                    else:
+                        conn.execute(
+                            "SELECT id, name, price, description FROM product WHERE category_id = ? "
+                            "ORDER BY id LIMIT 24 OFFSET ?",
+                            (rng.randrange(CATEGORIES), rng.randrange(0, 100, 24)),
+                        ).fetchall()
+                    transaction(conn, lambda: conn.execute(
+                        "UPDATE session SET data = ?, expire_date = ? WHERE key = ?",
+                        ("{}", str(time.time()), f"s{session}"),
+                    ))
+                except sqlite3.OperationalError as exc:
+                    if "locked" not in str(exc):
+                        raise
+                    locked += 1
+                    continue
+                timings.append((time.perf_counter() - start) * 1000)
+            conn.close()
+            with lock:
+                results.append((timings, locked))
+
+        threads = [threading.Thread(target=client) for _ in range(options["threads"])]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        return [t for timings, _ in results for t in timings], sum(locked for _, locked in results)
@@ -0,0 +1,205 @@
+"""
+Per-request SQL query budget and N+1 detector.
+
+``QueryBudgetMiddleware`` counts the queries each request runs and the time
+spent in the database, adds them to the response as a ``Server-Timing``
+header, and logs a structured warning on the ``querybudget`` logger when a
+view goes over its budget or repeats the same query shape (the same SQL with
+different parameters, the usual N+1 pattern). Each repeated shape is reported
+with the template line, or failing that the project source line, that ran it.
+
+Budgets are configured in settings::
+
+    QUERY_BUDGET = {'queries': 30, 'time_ms': 250, 'repeats': 5}
+    QUERY_BUDGETS = {'shop:view_cart': {'queries': 10}, ...}  # by URL name
+
+``query_budget()`` applies the same checks inside tests.
+"""
+import json
+import logging
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('querybudget')
+
+DEFAULT_BUDGET = {'queries': 30, 'time_ms': 250, 'repeats': 5}
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r'\s+')
+_COLUMNS = re.compile(r'^SELECT (?:DISTINCT )?.+? FROM ', re.S)
+
+_TEMPLATE_FILE = str(Path('django', 'template', 'base.py'))
+_THIS_FILE = __file__
+
+
+def query_shape(sql):
+    """Normalize ``sql`` so queries differing only in their parameters compare equal."""
+    sql = _IN_LIST.sub('(...)', sql)
+    sql = _LITERAL.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _summary(shape):
+    """Shorten a shape for logging: the column list rarely tells two queries apart."""
+    return _COLUMNS.sub('SELECT ... FROM ', shape, count=1)[:300]
+
+
+def _origin():
+    """Return ``'template.html:12'`` or ``'app/views.py:34 in view'`` for the running query."""
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    source = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.endswith(_TEMPLATE_FILE) and frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                return f'{origin.template_name or origin.name}:{token.lineno}'
+        elif (
+            source is None
+            and filename.startswith(base_dir)
+            and filename != _THIS_FILE
+            and 'site-packages' not in filename
+        ):
+            source = f'{Path(filename).relative_to(base_dir)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return source or 'unknown'
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that records each query's shape, duration and origin."""
+
+    def __init__(self, trace=True):
+        self.trace = trace
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            shape = query_shape(sql)
+            self.shapes[shape] += 1
+            if self.trace and self.shapes[shape] == 2:
+                # Only shapes that repeat are reported, so only look them up then.
+                self.origins[shape] = _origin()
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+    @property
+    def time_ms(self):
+        return self.duration * 1000
+
+    def repeated(self, threshold):
+        """``[(count, shape, origin)]`` for shapes run at least ``threshold`` times."""
+        return [
+            (n, shape, self.origins.get(shape, 'unknown'))
+            for shape, n in self.shapes.most_common()
+            if n >= threshold
+        ]
+
+    def report(self, budget):
+        """Return a dict describing every way the recorded queries exceed ``budget``, or ``None``."""
+        problems = {}
+        if self.count > budget['queries']:
+            problems['queries'] = self.count
+        if self.time_ms > budget['time_ms']:
+            problems['time_ms'] = round(self.time_ms, 2)
+        repeated = self.repeated(budget['repeats'])
+        if repeated:
+            problems['repeated'] = [
+                {'count': n, 'origin': origin, 'sql': _summary(shape)} for n, shape, origin in repeated
+            ]
+        if not problems:
+            return None
+        return {
+            'queries': self.count,
+            'time_ms': round(self.time_ms, 2),
+            'budget': budget,
+            'exceeded': problems,
+        }
+
+
+def budget_for(view_name=None, **overrides):
+    """The configured budget for ``view_name`` (a URL name such as ``'shop:view_cart'``)."""
+    budget = {**DEFAULT_BUDGET, **getattr(settings, 'QUERY_BUDGET', {})}
+    if view_name:
+        budget.update(getattr(settings, 'QUERY_BUDGETS', {}).get(view_name, {}))
+    budget.update({k: v for k, v in overrides.items() if v is not None})
+    return budget
+
+
+class QueryBudgetMiddleware:
+    """Count queries per request, warn when over budget and add ``Server-Timing``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_BUDGET_ENABLED', True)
+        self.trace = getattr(settings, 'QUERY_BUDGET_TRACE', True)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(trace=self.trace)
+        start = time.perf_counter()
+        with recorder.record():
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        # Streaming responses run more queries after this point; those are not counted.
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={recorder.time_ms:.2f};desc="{recorder.count} queries"',
+            f'total;dur={total_ms:.2f}',
+        ])
+
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        report = recorder.report(budget_for(view_name))
+        if report is not None:
+            report = {'view': view_name, 'method': request.method, 'path': request.path, **report}
+            logger.warning('Query budget exceeded: %s', json.dumps(report), extra={'query_budget': report})
+        return response
+
+
+@contextmanager
+def query_budget(queries=None, time_ms=None, repeats=None, view_name=None):
+    """
+    Fail with ``AssertionError`` if the block goes over its query budget::
+
+        with query_budget(queries=10):
+            self.client.get(reverse('shop:view_cart'))
+
+    Unspecified limits come from ``budget_for(view_name)``, except time, which
+    is only checked when given so slow test machines do not fail the suite.
+    """
+    budget = budget_for(
+        view_name, queries=queries, repeats=repeats,
+        time_ms=time_ms if time_ms is not None else float('inf'),
+    )
+    recorder = QueryRecorder()
+    with recorder.record():
+        yield recorder
+    report = recorder.report(budget)
+    if report is not None:
+        raise AssertionError(f'Query budget exceeded:\n{json.dumps(report, indent=2)}')
@@ -0,0 +1,107 @@
+"""
+Read replica routing for catalog traffic.
+
+Browsing the catalog (shop, blog and event pages and their JSON APIs) is
+most of the site's load and only reads. When a ``replica`` database is
+configured (``DB_REPLICA_HOST``), ``ReplicaMiddleware`` marks ``GET`` and
+``HEAD`` requests to the views named in ``REPLICA_VIEWS``, and
+``ReplicaRouter`` sends their catalog reads there. Everything else reads and
+writes the primary:
+
+* writes of any kind, and reads inside a transaction;
+* models outside the catalog apps (users, sessions, orders, payments,
+  gifts), and the cart and stock reservations kept in ``shop``;
+* every request of a client that sent a ``POST`` (or other unsafe method)
+  in the last ``REPLICA_STICKY_SECONDS``: the response sets a short-lived
+  cookie, so a user who just changed something is not shown a replica that
+  has not caught up with it yet.
+
+Without a replica the router leaves every query on ``default``.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'db_primary'
+DEFAULT_STICKY_SECONDS = 10
+
+CATALOG_APPS = {'shop', 'blog', 'events'}
+PRIMARY_MODELS = {'shop.cart', 'shop.cartitem', 'shop.stockreservation'}
+SAFE_METHODS = ('GET', 'HEAD')
+
+_reading = ContextVar('replica_reading', default=False)
+
+
+def replica_alias():
+    """The replica's database alias, or ``None`` when none is configured."""
+    return REPLICA if REPLICA in settings.DATABASES else None
+
+
+@contextmanager
+def reading_replica():
+    """Let catalog reads in the block go to the replica (what the middleware does per view)."""
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+class ReplicaRouter:
+    """Route catalog reads to the replica while a ``ReplicaMiddleware`` view runs."""
+
+    def db_for_read(self, model, **hints):
+        if not _reading.get() or model._meta.label_lower in PRIMARY_MODELS:
+            return None
+        if model._meta.app_label not in CATALOG_APPS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Whatever the transaction wrote is only visible on the primary.
+            return None
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA, None}
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica follows the primary's schema through replication.
+        return db != REPLICA
+
+
+class ReplicaMiddleware:
+    """Serve ``REPLICA_VIEWS`` from the replica, except for clients that just wrote."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.views = frozenset(getattr(settings, 'REPLICA_VIEWS', ()))
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            if getattr(request, 'reads_replica', False):
+                _reading.set(False)
+
+        if request.method not in SAFE_METHODS and self.sticky_seconds:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=self.sticky_seconds,
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in SAFE_METHODS
+            and STICKY_COOKIE not in request.COOKIES
+            and request.resolver_match.view_name in self.views
+        ):
+            request.reads_replica = True
+            _reading.set(True)
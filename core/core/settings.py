@@ -75,6 +75,8 @@ INSTALLED_APPS = [
     'events',
     'payments',
     'gift',
+    'jobs.apps.JobsConfig',
+    'core.apps.CoreConfig',
     
 ]
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -106,6 +108,8 @@ STATICFILES_DIRS = [
 STATIC_ROOT = BASE_DIR / "static"
 
 MIDDLEWARE = [
+    'core.querybudget.QueryBudgetMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -142,10 +146,119 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
+#
+# SQLite by default. Set DB_ENGINE=postgres (and DB_NAME, DB_USER, DB_PASSWORD,
+# DB_HOST, DB_PORT) for production:
+#   DB_CONN_MAX_AGE        seconds a connection is reused across requests
+#                          (0 = one per request); checked before reuse
+#   DB_POOL_MAX_SIZE       > 0 uses a psycopg connection pool of this size
+#                          instead (CONN_MAX_AGE must then be 0)
+#   DB_STATEMENT_TIMEOUT   milliseconds before Postgres cancels a statement
+#   DB_CONNECT_TIMEOUT     seconds to wait for a new connection
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=0, cast=int)
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='elostora'),
+            'USER': config('DB_USER', default='elostora'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+                'options': f"-c statement_timeout={config('DB_STATEMENT_TIMEOUT', default=15000, cast=int)}",
+            },
+        }
+    }
+    if DB_POOL_MAX_SIZE:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        }
+else:
+    DB_LOCK_TIMEOUT = config('DB_LOCK_TIMEOUT', default=20, cast=int)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds a writer waits for SQLite's single write lock before failing.
+                'timeout': DB_LOCK_TIMEOUT,
+                # atomic() takes the write lock up front, so it waits for it
+                # rather than failing when a read turns into a write.
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+    # Applied to every new SQLite connection by core/sqlite.py.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'busy_timeout': DB_LOCK_TIMEOUT * 1000,
+        'mmap_size': config('DB_SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+        'cache_size': -64 * 1024,  # KiB
+        'temp_store': 'memory',
+    }
+
+# Read replica (Postgres only): set DB_REPLICA_HOST, and DB_REPLICA_PORT /
+# DB_REPLICA_NAME / DB_REPLICA_USER / DB_REPLICA_PASSWORD where they differ
+# from the primary's, to serve catalog pages from it (see core/replicas.py).
+# Clients that sent a POST in the last REPLICA_STICKY_SECONDS read the primary.
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+
+if DB_REPLICA_HOST and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    primary = DATABASES['default']
+    DATABASES['replica'] = {
+        **primary,
+        'HOST': DB_REPLICA_HOST,
+        'PORT': config('DB_REPLICA_PORT', default=primary['PORT']),
+        'NAME': config('DB_REPLICA_NAME', default=primary['NAME']),
+        'USER': config('DB_REPLICA_USER', default=primary['USER']),
+        'PASSWORD': config('DB_REPLICA_PASSWORD', default=primary['PASSWORD']),
+        'OPTIONS': {**primary['OPTIONS']},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 10
+REPLICA_VIEWS = [
+    'shop:shop_home',
+    'shop:product_detail',
+    'shop:category_list',
+    'shop:category_products',
+    'shop:category_products_api',
+    'shop:global_search',
+    'shop:search_api',
+    'shop:suggestions_api',
+    'shop:random_products_api',
+    'blog:public_list',
+    'blog:public_detail',
+    'blog:public_detail_id',
+    'events:event_list',
+    'events:event_detail',
+    'events:api_featured_events',
+]
+
+
+# Cache
+# Per-process memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) so cached header
+# data and its version counters are shared by every worker. The popular-weather
+# refresher (a separate process) refuses to run without one.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='elostora'),
     }
 }
 
@@ -184,6 +297,67 @@ USE_TZ = True
 # Weather API Key (replace with actual key)
 WEATHER_API_KEY = config('WEATHER_API_KEY', default='7e952d38356d445749098094c23aa2d8')
 
+# Weather lookups (weather/client.py): readings are cached per city for
+# WEATHER_CACHE_TTL seconds, and served up to WEATHER_STALE_TTL seconds old
+# while the service is failing. Upstream requests time out after
+# WEATHER_TIMEOUT (connect, read) seconds; after WEATHER_FAILURE_THRESHOLD
+# failures in a row the service is left alone for WEATHER_FAILURE_COOLDOWN.
+WEATHER_API_URL = config('WEATHER_API_URL', default='https://api.openweathermap.org/data/2.5/weather')
+WEATHER_BACKEND = 'weather.client.OpenWeatherMapBackend'
+WEATHER_TIMEOUT = (3, 5)
+WEATHER_POOL_SIZE = 10
+WEATHER_CACHE_TTL = 600
+WEATHER_STALE_TTL = 6 * 3600
+WEATHER_FAILURE_THRESHOLD = 5
+WEATHER_FAILURE_COOLDOWN = 30
+# Searches are recorded in batches every WEATHER_HISTORY_FLUSH_INTERVAL
+# seconds (0 = one INSERT per search) and rolled up per city and hour; raw
+# rows are deleted by `manage.py prune_weather_history --days N`. While the
+# database is unavailable at most WEATHER_HISTORY_MAX_BUFFER searches are kept.
+WEATHER_HISTORY_FLUSH_INTERVAL = 5
+WEATHER_HISTORY_BATCH_SIZE = 500
+WEATHER_HISTORY_MAX_BUFFER = 10000
+# `manage.py refresh_popular_weather --loop` re-fetches the
+# WEATHER_POPULAR_CITIES cities searched most in the last WEATHER_POPULAR_DAYS
+# days every WEATHER_POPULAR_REFRESH seconds, WEATHER_POPULAR_WORKERS at a
+# time, for the header. It needs a shared CACHE_BACKEND (see Cache above).
+WEATHER_POPULAR_CITIES = 8
+WEATHER_POPULAR_DAYS = 7
+WEATHER_POPULAR_REFRESH = 300
+WEATHER_POPULAR_WORKERS = 4
+
+
+# Seconds a pending order holds its reserved stock before it may be cancelled
+# (by the next checkout or release_expired_reservations) and the stock put back.
+PENDING_ORDER_GRACE_PERIOD = config('PENDING_ORDER_GRACE_PERIOD', default=30, cast=int)
+
+
+# Invoice PDFs are rendered into MEDIA_ROOT/invoices by a pool of worker
+# processes when an order is paid (0 renders inline, e.g. in tests). A
+# download that finds its render still running waits this many seconds
+# before answering 202 and asking the client to retry.
+INVOICE_RENDER_WORKERS = config('INVOICE_RENDER_WORKERS', default=2, cast=int)
+INVOICE_RENDER_WAIT = 2
+# Renders a bulk invoice export (dashboard) keeps queued at once.
+INVOICE_EXPORT_WINDOW = 32
+
+# Shared secret the payment gateway signs webhook bodies with (hex HMAC-SHA256
+# in the X-Signature header). Webhooks are refused while it is unset.
+PAYMENT_WEBHOOK_SECRET = config('PAYMENT_WEBHOOK_SECRET', default='')
+
+
+# Background jobs (jobs app): run them with `manage.py runworkers`. Failed
+# jobs are retried after JOBS_BACKOFF seconds, doubling up to JOBS_MAX_BACKOFF;
+# running jobs not finished within JOBS_LOCK_TIMEOUT are handed to another
+# worker. JOBS_RUN_INLINE runs each job right after its transaction commits
+# instead, for development without a worker.
+JOBS_THREADS = config('JOBS_THREADS', default=4, cast=int)
+JOBS_PROCESSES = config('JOBS_PROCESSES', default=0, cast=int)
+JOBS_BACKOFF = 10
+JOBS_MAX_BACKOFF = 3600
+JOBS_LOCK_TIMEOUT = 600
+JOBS_RUN_INLINE = config('JOBS_RUN_INLINE', default=False, cast=bool)
+
 
 # Order Status Rules (Validation)
 ALLOWED_STATUS_FLOW = {
@@ -192,6 +366,51 @@ ALLOWED_STATUS_FLOW = {
     'completed': [],
 }
 
+# Seconds a computed category -> live event discount map stays valid
+# (changes to events are picked up immediately via signals).
+ACTIVE_DISCOUNT_TTL = config('ACTIVE_DISCOUNT_TTL', default=60, cast=int)
+
+# Random homepage products: largest sample a client may request, and how
+# often each process reloads its in-memory product id pool.
+RANDOM_PRODUCTS_MAX = 48
+SAMPLER_REFRESH_INTERVAL = 300
+
+# Products per page on the global search results page.
+SEARCH_PAGE_SIZE = 24
+
+# Products per cursor page on category pages and their infinite-scroll API
+# (clients may ask for fewer or more via ?per_page=, up to 96), and how far
+# their product count is counted exactly before showing "over N".
+CATEGORY_PAGE_SIZE = 24
+PRODUCT_COUNT_CAP = 1000
+
+# Orders per page on the dashboard order list and its JSON API, and how far
+# its total is counted exactly before showing "over N" (see dashboard/orders.py).
+DASHBOARD_ORDER_PAGE_SIZE = 50
+DASHBOARD_ORDER_COUNT_CAP = 10000
+
+# Per-request SQL budget (see core/querybudget.py): requests running more
+# queries, spending more DB time or repeating one query shape more often than
+# this are logged on the 'querybudget' logger. QUERY_BUDGETS tightens or
+# loosens it per URL name.
+QUERY_BUDGET_ENABLED = config('QUERY_BUDGET_ENABLED', default=True, cast=bool)
+QUERY_BUDGET = {
+    'queries': config('QUERY_BUDGET_QUERIES', default=30, cast=int),
+    'time_ms': config('QUERY_BUDGET_TIME_MS', default=250, cast=int),
+    'repeats': 5,
+}
+QUERY_BUDGETS = {
+    'shop:view_cart': {'queries': 12},
+    'shop:checkout_page': {'queries': 25},
+    'shop:category_products': {'queries': 10},
+    'dashboard:order_list': {'queries': 15},
+    'dashboard:order_detail': {'queries': 15},
+}
+
+# Seconds before each process rebuilds its in-memory autocomplete index
+# (local saves/deletes are applied immediately via signals).
+SUGGEST_INDEX_TTL = 600
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
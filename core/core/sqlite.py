@@ -0,0 +1,49 @@
+"""
+SQLite tuning for concurrent requests.
+
+Out of the box SQLite journals with a rollback journal, so a writer locks
+readers out and every request that saves its session (``SESSION_SAVE_EVERY_
+REQUEST``) or touches a cart queues behind the others. ``configure()`` runs
+on every new SQLite connection and applies ``SQLITE_PRAGMAS``:
+
+* ``journal_mode = wal``: readers no longer block the writer or each other;
+* ``synchronous = normal``: with WAL, commits no longer wait for an fsync
+  (a power cut can lose the last commits, never corrupt the database);
+* ``busy_timeout``: a writer waits this many milliseconds for the write
+  lock instead of failing with "database is locked";
+* ``mmap_size`` and ``cache_size``: more of the database read from memory.
+
+The busy timeout cannot help a transaction that started as a reader and
+then tries to write while another writer holds the lock; SQLite fails it at
+once. ``DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'``
+makes ``atomic()`` blocks take the write lock when they begin, so they
+wait their turn instead.
+
+``manage.py benchmark_sqlite`` compares the default and tuned settings.
+"""
+from django.conf import settings
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative: KiB, so 64 MiB
+    'temp_store': 'memory',
+}
+
+
+def pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+
+def apply_pragmas(conn, values):
+    """Run ``PRAGMA name = value`` on a DB-API SQLite connection for each item of ``values``."""
+    for name, value in values.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+
+
+def configure(sender, connection, **kwargs):
+    """``connection_created`` receiver: tune new SQLite connections."""
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection.connection, pragmas())
@@ -0,0 +1,96 @@
+"""
+Row counts for the dashboard home, kept in ``Counter`` rows.
+
+``COUNT(*)`` reads the whole table on SQLite (and most of an index on
+Postgres), so the dashboard home does not run it. Each counter is
+adjusted by one UPDATE in the same transaction as the change it counts:
+``post_save`` (on create) and ``post_delete`` receivers for the counted
+models, and ``weather.history.searches_recorded`` for weather searches.
+
+Bulk inserts and queryset updates send no signals, so ``reconcile()``
+(``manage.py reconcile_counters``, or the ``reconcile_counters`` job)
+periodically recounts and corrects any drift. A counter that does not exist
+yet is counted once, on first read.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from blog.models import Post
+from events.models import Event
+from shop.models import Product
+from weather.models import CityWeatherHourly
+
+from .models import Counter
+
+PRODUCTS = 'products'
+USERS = 'users'
+EVENTS = 'events'
+BLOG_POSTS = 'blog_posts'
+WEATHER_SEARCHES = 'weather_searches'
+
+
+def _weather_searches():
+    # Raw searches are pruned; their hourly rollups keep the total.
+    return CityWeatherHourly.objects.aggregate(total=Sum('searches'))['total'] or 0
+
+
+COUNTS = {
+    PRODUCTS: lambda: Product.objects.count(),
+    USERS: lambda: get_user_model().objects.count(),
+    EVENTS: lambda: Event.objects.count(),
+    BLOG_POSTS: lambda: Post.objects.count(),
+    WEATHER_SEARCHES: _weather_searches,
+}
+
+# Models whose creations and deletions move a counter.
+TRACKED = {
+    Product: PRODUCTS,
+    get_user_model(): USERS,
+    Event: EVENTS,
+    Post: BLOG_POSTS,
+}
+
+
+def add(name, delta):
+    """Add ``delta`` to counter ``name``; a counter not created yet is counted when first read."""
+    if delta:
+        Counter.objects.filter(name=name).update(value=F('value') + delta)
+
+
+def get_many(names=None):
+    """``{name: value}`` for ``names`` (default: all counters), in one query once they exist."""
+    names = list(names or COUNTS)
+    values = dict(Counter.objects.filter(name__in=names).values_list('name', 'value'))
+    missing = [name for name in names if name not in values]
+    if missing:
+        now = timezone.now()
+        Counter.objects.bulk_create(
+            [Counter(name=name, value=COUNTS[name](), reconciled_at=now) for name in missing],
+            ignore_conflicts=True,
+        )
+        values.update(Counter.objects.filter(name__in=missing).values_list('name', 'value'))
+    return values
+
+
+def reconcile(name):
+    """Recount ``name`` and store the result; returns it."""
+    with transaction.atomic():
+        # Lock the row first: increments made while counting wait, and land on top of the count.
+        counter, _ = Counter.objects.select_for_update().get_or_create(name=name)
+        counter.value = COUNTS[name]()
+        counter.reconciled_at = timezone.now()
+        counter.save(update_fields=['value', 'reconciled_at'])
+    return counter.value
+
+
+def reconcile_all():
+    """Recount every counter; returns ``{name: (old value, new value)}`` for those that had drifted."""
+    drift = {}
+    for name in COUNTS:
+        before = Counter.objects.filter(name=name).values_list('value', flat=True).first()
+        after = reconcile(name)
+        if before is not None and before != after:
+            drift[name] = (before, after)
+    return drift
@@ -0,0 +1,81 @@
+"""
+Bulk invoice export as a streamed ZIP archive.
+
+``invoice_archive()`` is a generator of ZIP bytes for a
+``StreamingHttpResponse``. Invoices already rendered (see
+``payments.invoices``) are copied straight from disk. The rest are
+rendered by the shared invoice process pool, which also leaves them cached
+for later downloads. Each entry is written as soon as its PDF is ready and
+flushed to the client, so neither the archive nor the full list of orders
+is ever held in memory: orders are read in chunks and at most ``window``
+renders are in flight.
+"""
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.conf import settings
+
+from payments import invoices
+
+DEFAULT_WINDOW = 32
+
+
+class _ZipStream:
+    """Write-only, unseekable file object; ``zipfile`` then emits data descriptors instead of seeking back."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def invoice_archive(orders, window=None):
+    """Yield a ZIP archive holding ``receipt_<id>.pdf`` for every order in ``orders``."""
+    if window is None:
+        window = getattr(settings, 'INVOICE_EXPORT_WINDOW', DEFAULT_WINDOW)
+    stream = _ZipStream()
+    failed = []
+    # PDFs are already compressed; deflating them again costs CPU for nothing.
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        running = {}
+
+        def add(order_id, path):
+            archive.write(path, f'receipt_{order_id}.pdf')
+            return stream.drain()
+
+        def collect(timeout=None):
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                order_id, path = running.pop(future)
+                if future.exception() is None:
+                    yield add(order_id, path)
+                else:
+                    failed.append(order_id)
+
+        for data in invoices.snapshots(orders):
+            path = invoices.invoice_path(data)
+            if not path.exists():
+                future = invoices.submit(data, path)
+                if future is not None:
+                    running[future] = (data['order_id'], path)
+                    # Block only when the window is full; otherwise just pick up finished renders.
+                    yield from collect(None if len(running) >= window else 0)
+                    continue
+            yield add(data['order_id'], path)
+
+        while running:
+            yield from collect()
+
+        if failed:
+            archive.writestr('FAILED.txt', 'Could not render invoices for orders:\n' + '\n'.join(map(str, failed)))
+    yield stream.drain()
@@ -1,9 +1,16 @@
+from datetime import timedelta
+
 from django import forms
 from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
 from shop.models import Product
 from events.models import Event
 from weather.models import SearchHistory
 from blog.models import Post
+from order_management.models import Order
+from . import sales
+from .sales import start_of_day
 
 class ProductForm(forms.ModelForm):
     class Meta:
@@ -131,3 +138,74 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ['title', 'content', 'image']
 
+
+
+class InvoiceExportForm(forms.Form):
+    """Filters for the bulk invoice export; every field is optional."""
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    status = forms.ChoiceField(choices=[('', 'Any status')] + Order.STATUS_CHOICES, required=False)
+
+    def clean(self):
+        cleaned = super().clean()
+        start, end = cleaned.get('start'), cleaned.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError('The start date must be before the end date.')
+        return cleaned
+
+    def filter(self, orders):
+        data = self.cleaned_data
+        # Plain created_at ranges, not created_at__date, so the (status, -created_at) index applies.
+        if data.get('start'):
+            orders = orders.filter(created_at__gte=start_of_day(data['start']))
+        if data.get('end'):
+            orders = orders.filter(created_at__lt=start_of_day(data['end'] + timedelta(days=1)))
+        if data.get('status'):
+            orders = orders.filter(status=data['status'])
+        return orders
+
+
+class OrderFilterForm(InvoiceExportForm):
+    """Filters for the dashboard order list: the export filters plus a customer."""
+    customer = forms.CharField(
+        required=False, max_length=254,
+        widget=forms.TextInput(attrs={'placeholder': 'Username, email or user ID'}),
+    )
+
+    def filter(self, orders):
+        orders = super().filter(orders)
+        customer = self.cleaned_data.get('customer', '').strip()
+        if customer:
+            match = Q(username__iexact=customer) | Q(email__iexact=customer)
+            if customer.isdigit():
+                match |= Q(pk=int(customer))
+            # A literal id list, not a subquery, so the planner walks the (user, -created_at) index.
+            orders = orders.filter(user__in=list(User.objects.filter(match).values_list('pk', flat=True)))
+        return orders
+
+    def has_filters(self):
+        return any(getattr(self, 'cleaned_data', {}).get(name) for name in self.fields)
+
+
+class SalesReportForm(forms.Form):
+    """Date range (the last 30 days by default) and grouping for the sales report."""
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 731
+
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    by = forms.ChoiceField(
+        choices=[(sales.DAY, 'By day'), (sales.CATEGORY, 'By category'), (sales.PRODUCT, 'By product')],
+        required=False,
+    )
+
+    def clean(self):
+        cleaned = super().clean()
+        end = cleaned.get('end') or timezone.localdate()
+        start = cleaned.get('start') or end - timedelta(days=self.DEFAULT_DAYS - 1)
+        if start > end:
+            raise forms.ValidationError('The start date must be before the end date.')
+        if (end - start).days >= self.MAX_DAYS:
+            raise forms.ValidationError(f'Report at most {self.MAX_DAYS} days at a time.')
+        cleaned.update(start=start, end=end, by=cleaned.get('by') or sales.DAY)
+        return cleaned
@@ -0,0 +1,42 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from dashboard import sales
+from order_management.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily sales rollups from the orders for a range of days "
+        "(default: from the first order to today), --chunk-days days per transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=date.fromisoformat, help="First day (YYYY-MM-DD).")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last day (YYYY-MM-DD), default today.")
+        parser.add_argument("--chunk-days", type=int, default=sales.DEFAULT_CHUNK_DAYS)
+        parser.add_argument("--pause", type=float, default=0, help="Seconds to sleep between chunks.")
+
+    def handle(self, *args, **options):
+        end = options["end"] or timezone.localdate()
+        start = options["start"]
+        if start is None:
+            first = Order.objects.aggregate(first=Min("created_at"))["first"]
+            if first is None:
+                self.stdout.write("No orders.")
+                self.stdout.write(self.style.SUCCESS("Done."))
+                return
+            start = timezone.localdate(first)
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+
+        began = time.perf_counter()
+        days = sales.rebuild(start, end, max(1, options["chunk_days"]), options["pause"])
+        self.stdout.write(
+            f"Rebuilt {start} to {end}: {days} day(s) with sales in {time.perf_counter() - began:.2f}s."
+        )
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from dashboard.sales import COUNTED
+from dashboard.views import SALES_TOP
+
+START = date(2024, 1, 1)
+SCHEMA = """
+CREATE TABLE product (id INTEGER PRIMARY KEY, name TEXT, category TEXT);
+CREATE TABLE orders (id INTEGER PRIMARY KEY, created_at TEXT, status TEXT);
+CREATE INDEX orders_status_created ON orders (status, created_at);
+CREATE TABLE item (id INTEGER PRIMARY KEY, order_id INTEGER, product_id INTEGER, quantity INTEGER, price NUMERIC);
+CREATE INDEX item_order ON item (order_id);
+CREATE TABLE daily_sales (day TEXT PRIMARY KEY, revenue NUMERIC, units INTEGER, orders INTEGER);
+CREATE TABLE daily_category_sales (
+    day TEXT, category TEXT, revenue NUMERIC, units INTEGER, orders INTEGER, PRIMARY KEY (day, category)
+);
+CREATE TABLE daily_product_sales (
+    day TEXT, product_id INTEGER, revenue NUMERIC, units INTEGER, orders INTEGER, PRIMARY KEY (day, product_id)
+);
+"""
+PLACED = "o.status IN ({}) AND o.created_at >= :start AND o.created_at < :end".format(
+    ", ".join(f"'{status}'" for status in sorted(COUNTED))
+)
+TOTALS = "SUM(i.price * i.quantity), SUM(i.quantity), COUNT(DISTINCT o.id)"
+# What the sales page reads: every day in the window, then the top categories and products.
+QUERIES = ("days", "categories", "products")
+RAW = (
+    f"SELECT date(o.created_at), {TOTALS} FROM item i JOIN orders o ON o.id = i.order_id "
+    f"WHERE {PLACED} GROUP BY 1",
+    f"SELECT p.category, {TOTALS} FROM item i JOIN orders o ON o.id = i.order_id "
+    f"JOIN product p ON p.id = i.product_id WHERE {PLACED} GROUP BY 1 ORDER BY 2 DESC LIMIT {SALES_TOP}",
+    f"SELECT i.product_id, {TOTALS} FROM item i JOIN orders o ON o.id = i.order_id "
+    f"WHERE {PLACED} GROUP BY 1 ORDER BY 2 DESC LIMIT {SALES_TOP}",
+)
+ROLLUP = (
+    "SELECT day, revenue, units, orders FROM daily_sales WHERE day >= :first AND day <= :last",
+    "SELECT category, SUM(revenue), SUM(units), SUM(orders) FROM daily_category_sales "
+    f"WHERE day >= :first AND day <= :last GROUP BY 1 ORDER BY 2 DESC LIMIT {SALES_TOP}",
+    "SELECT product_id, SUM(revenue), SUM(units), SUM(orders) FROM daily_product_sales "
+    f"WHERE day >= :first AND day <= :last GROUP BY 1 ORDER BY 2 DESC LIMIT {SALES_TOP}",
+)
+BACKFILL = (
+    f"INSERT INTO daily_sales SELECT date(o.created_at), {TOTALS} FROM item i "
+    "JOIN orders o ON o.id = i.order_id WHERE {placed} GROUP BY 1",
+    f"INSERT INTO daily_category_sales SELECT date(o.created_at), p.category, {TOTALS} FROM item i "
+    "JOIN orders o ON o.id = i.order_id JOIN product p ON p.id = i.product_id WHERE {placed} GROUP BY 1, 2",
+    f"INSERT INTO daily_product_sales SELECT date(o.created_at), i.product_id, {TOTALS} FROM item i "
+    "JOIN orders o ON o.id = i.order_id WHERE {placed} GROUP BY 1, 2",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the sales report read from the daily rollups against the same "
+        "report aggregated from the orders and their items. Runs on a throwaway "
+        "SQLite database with --items order items spread over --days days."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=10_000_000, help="Order items to generate.")
+        parser.add_argument("--items-per-order", type=int, default=3)
+        parser.add_argument("--products", type=int, default=5000)
+        parser.add_argument("--categories", type=int, default=40)
+        parser.add_argument("--days", type=int, default=730, help="Days the orders are spread over.")
+        parser.add_argument("--windows", default="7,30,365", help="Comma-separated report windows in days.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query, median reported.")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            conn = sqlite3.connect(os.path.join(directory, "benchmark.sqlite3"), isolation_level=None)
+            conn.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF; PRAGMA cache_size = -262144;")
+            started = time.perf_counter()
+            orders = self._create(conn, options)
+            self.stdout.write(
+                f"Generated {options['items']} items in {orders} orders over {options['days']} days "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+
+            started = time.perf_counter()
+            conn.execute("BEGIN")
+            for statement in BACKFILL:
+                conn.execute(statement.format(placed=PLACED), self._range(0, options["days"]))
+            conn.execute("COMMIT")
+            rows = conn.execute("SELECT COUNT(*) FROM daily_product_sales").fetchone()[0]
+            self.stdout.write(
+                f"Built the rollups ({rows} product-day rows) in {time.perf_counter() - started:.1f}s"
+            )
+
+            self.stdout.write(f"{'window':>8} {'query':<11} {'raw ms':>10} {'rollup ms':>10} {'speedup':>9}")
+            for window in (int(w) for w in options["windows"].split(",") if w.strip()):
+                params = self._range(options["days"] - window, options["days"])
+                for name, raw_query, rollup_query in zip(QUERIES, RAW, ROLLUP):
+                    raw = self._time(conn, raw_query, params, options["repeat"])
+                    rollup = self._time(conn, rollup_query, params, options["repeat"])
+                    self.stdout.write(
+                        f"{window:>7}d {name:<11} {raw:>10.1f} {rollup:>10.1f} {raw / rollup if rollup else 0:>8.0f}x"
+                    )
+            conn.close()
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    @staticmethod
+    def _create(conn, options):
+        conn.executescript(SCHEMA)
+        orders = max(1, options["items"] // options["items_per_order"])
+        seconds = options["days"] * 86400 / orders
+        conn.execute("BEGIN")
+        conn.execute(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+            "INSERT INTO product SELECT i, 'Product ' || i, 'Category ' || (i % ?) FROM n",
+            (options["products"], options["categories"]),
+        )
+        conn.execute(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+            "INSERT INTO orders SELECT i, datetime(?, '+' || (i * ?) || ' seconds'), "
+            "CASE i % 10 WHEN 0 THEN 'pending' WHEN 1 THEN 'cancelled' ELSE 'paid' END FROM n",
+            (orders, str(START), seconds),
+        )
+        conn.execute(
+            "UPDATE orders SET status = CASE id % 4 WHEN 0 THEN 'shipped' WHEN 1 THEN 'delivered' "
+            "ELSE status END WHERE status = 'paid'"
+        )
+        conn.execute(
+            "WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ? - 1) "
+            "INSERT INTO item SELECT i + 1, i / ? + 1, (i * 7919) % ? + 1, 1 + i % 3, 5 + (i * 31) % 200 FROM n",
+            (options["items"], options["items_per_order"], options["products"]),
+        )
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+        return orders
+
+    @staticmethod
+    def _range(first, last):
+        """Parameters for days ``first`` to ``last`` (exclusive) after ``START``."""
+        return {
+            "start": str(START + timedelta(days=first)),
+            "end": str(START + timedelta(days=last)),
+            "first": str(START + timedelta(days=first)),
+            "last": str(START + timedelta(days=last - 1)),
+        }
+
+    @staticmethod
+    def _time(conn, query, params, repeat):
+        """Median milliseconds to run ``query`` and fetch its rows."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(query, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
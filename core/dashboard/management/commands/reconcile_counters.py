@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from dashboard import counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the dashboard counters and correct any drift (bulk inserts and "
+        "queryset updates bypass the signals that keep them current). Runs once, "
+        "or every --interval seconds with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep reconciling.")
+        parser.add_argument("--interval", type=float, default=3600, help="Seconds between runs.")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.monotonic()
+            drift = counters.reconcile_all()
+            for name, (before, after) in drift.items():
+                self.stdout.write(self.style.WARNING(f"{name}: {before} -> {after}"))
+            self.stdout.write(
+                f"Reconciled {len(counters.COUNTS)} counter(s) in {time.monotonic() - start:.2f}s, "
+                f"{len(drift)} had drifted."
+            )
+            if not options["loop"]:
+                break
+            close_old_connections()
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
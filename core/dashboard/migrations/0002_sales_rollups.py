@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        ('shop', '0006_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.BigIntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('category', models.CharField(max_length=200)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'category'), name='dashboard_dailycategorysales_day_category')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.BigIntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day',), name='dashboard_dailysales_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.BigIntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('product_name', models.CharField(max_length=200)),
+                ('category', models.CharField(max_length=200)),
+                ('product', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='shop.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'product'), name='dashboard_dailyproductsales_day_product')],
+            },
+        ),
+    ]
@@ -1,3 +1,61 @@
 from django.db import models
 
-# Create your models here.
+
+class Counter(models.Model):
+    """A row count kept up to date by signals (see ``dashboard.counters``)."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class SalesRollup(models.Model):
+    """Sales on one day of orders placed that day (see ``dashboard.sales``)."""
+
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.BigIntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day'], name='dashboard_dailysales_day')]
+
+    def __str__(self):
+        return f"{self.day}: {self.revenue}"
+
+
+class DailyCategorySales(SalesRollup):
+    category = models.CharField(max_length=200)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='dashboard_dailycategorysales_day_category'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.category}: {self.revenue}"
+
+
+class DailyProductSales(SalesRollup):
+    # No foreign key constraint: the history outlives deleted products.
+    product = models.ForeignKey(
+        'shop.Product', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    product_name = models.CharField(max_length=200)
+    category = models.CharField(max_length=200)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='dashboard_dailyproductsales_day_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_name}: {self.revenue}"
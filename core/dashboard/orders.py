@@ -0,0 +1,68 @@
+"""
+The dashboard order list.
+
+Orders are listed newest first a page at a time with the keyset pagination
+in ``shop.pagination``, so a page deep in the list costs the same as the
+first; filtering by status and date range walks the ``(status, -created_at)``
+index. Each row's customer and payment come in the same query.
+
+The total shown above the list is exact up to ``DASHBOARD_ORDER_COUNT_CAP``
+orders. Past that the list says "over N" (the count stops after N + 1
+rows), or, unfiltered on PostgreSQL, gives the planner's row estimate for
+the table instead of counting it.
+"""
+from django.conf import settings
+from django.db import connections
+
+from order_management.models import Order
+from shop.pagination import capped_count, paginate, page_size
+
+DEFAULT_COUNT_CAP = 10000
+ABOUT = 'about'
+
+
+def orders():
+    return Order.objects.select_related('user', 'payment')
+
+
+def page(queryset, cursor=None, per_page=None):
+    return paginate(queryset, cursor=cursor, per_page=page_size(per_page, 'DASHBOARD_ORDER_PAGE_SIZE'))
+
+
+def estimated_count(queryset, filtered=True):
+    """Return ``(count, qualifier)``, where the qualifier is ``EXACT``, ``ABOUT`` or ``OVER``."""
+    cap = getattr(settings, 'DASHBOARD_ORDER_COUNT_CAP', DEFAULT_COUNT_CAP)
+    if not filtered:
+        estimate = _table_estimate(queryset)
+        if estimate is not None and estimate > cap:
+            return estimate, ABOUT
+    return capped_count(queryset, cap)
+
+
+def _table_estimate(queryset):
+    """The planner's row count for the table, or ``None`` if unknown or not on PostgreSQL."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 until the table is first vacuumed or analyzed.
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def as_json(order):
+    payment = getattr(order, 'payment', None)
+    return {
+        'id': order.pk,
+        'created_at': order.created_at.isoformat(),
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'customer': order.user.username,
+        'email': order.user.email,
+        'final_total': str(order.final_total),
+        'payment_method': payment.method if payment else None,
+        'paid': payment.is_paid if payment else False,
+    }
@@ -0,0 +1,220 @@
+"""
+Daily sales rollups for the dashboard's revenue reports.
+
+An order is a sale while its status is in ``COUNTED``, and counts on the
+day it was placed (in the current time zone). ``DailySales``,
+``DailyCategorySales`` and ``DailyProductSales`` keep its revenue (price x
+quantity of its items, delivery excluded), units and order count per day,
+per day and category, and per day and product. Reports read only these
+tables, so they cost the same however many orders there are.
+
+The rollups are adjusted in the same transaction as the change, from
+``order_management.signals.status_changed``: an order entering ``COUNTED``
+(``Payment.confirm()``, a paid webhook, a status update) adds its items and
+one leaving it (cancelled, failed) takes them away again. Status changes
+made with queryset ``update()``, and edits to the items of an order already
+counted, are not seen; ``manage.py backfill_sales`` rebuilds the rollups for
+a range of days from the orders, a few days per transaction.
+"""
+import time
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, NullIf, TruncDate
+from django.utils import timezone
+
+from order_management.models import MONEY, Order, OrderItem
+from .models import DailyCategorySales, DailyProductSales, DailySales
+
+COUNTED = frozenset({'paid', 'successful', 'processing', 'shipped', 'delivered', 'completed'})
+UNCATEGORIZED = 'Uncategorized'
+TOTALS = ('revenue', 'units', 'orders')
+CENT = Decimal('0.01')
+DEFAULT_CHUNK_DAYS = 7
+DAY, CATEGORY, PRODUCT = 'day', 'category', 'product'
+
+
+def start_of_day(day):
+    """Midnight at the start of ``day`` in the current time zone."""
+    return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+
+def _category():
+    # As the shop shows it: the category, else the legacy category text.
+    return Coalesce('product__category_ref__name', NullIf('product__category', Value('')), Value(UNCATEGORIZED))
+
+
+def _revenue():
+    return Sum(Coalesce('price', Value(Decimal('0.00'))) * F('quantity'), output_field=MONEY)
+
+
+# --------------------------------
+# Incremental updates
+# --------------------------------
+def record(changes):
+    """Apply ``(order, previous_status)`` pairs to the rollups (``status_changed`` receiver)."""
+    moves = {}
+    for order, previous in changes:
+        sign = (order.status in COUNTED) - (previous in COUNTED)
+        if sign:
+            moves[order.pk] = (sign, timezone.localdate(order.created_at))
+    if not moves:
+        return
+
+    days, categories, products = {}, {}, {}
+    for order_id, (sign, day) in moves.items():
+        _accumulate(days, day, sign, order_id)  # orders without items still count
+    lines = (
+        OrderItem.objects.filter(order_id__in=moves)
+        .values('order_id', 'product_id', 'product__name', category=_category())
+        .annotate(revenue=_revenue(), units=Sum('quantity'))
+        .order_by()
+    )
+    for line in lines:
+        sign, day = moves[line['order_id']]
+        revenue, units = line['revenue'] or 0, line['units'] or 0
+        _accumulate(days, day, sign, line['order_id'], revenue, units)
+        _accumulate(categories, (day, line['category']), sign, line['order_id'], revenue, units)
+        if line['product_id'] is not None:
+            _accumulate(
+                products, (day, line['product_id']), sign, line['order_id'], revenue, units,
+                product_name=line['product__name'], category=line['category'],
+            )
+
+    for day, group in days.items():
+        _add(DailySales, {'day': day}, group)
+    for (day, category), group in categories.items():
+        _add(DailyCategorySales, {'day': day, 'category': category}, group)
+    for (day, product_id), group in products.items():
+        _add(DailyProductSales, {'day': day, 'product_id': product_id}, group, 'product_name', 'category')
+
+
+def _accumulate(groups, key, sign, order_id, revenue=0, units=0, **fields):
+    group = groups.get(key)
+    if group is None:
+        group = groups[key] = {'revenue': Decimal('0.00'), 'units': 0, 'orders': 0, 'seen': set(), **fields}
+    group['revenue'] += sign * revenue
+    group['units'] += sign * units
+    if order_id not in group['seen']:
+        group['seen'].add(order_id)
+        group['orders'] += sign
+
+
+def _add(model, lookup, group, *fields):
+    """Add ``group``'s totals to the ``model`` row matching ``lookup``, creating it if needed."""
+    if not any(group[name] for name in TOTALS):
+        return
+    rows = model.objects.filter(**lookup)
+    totals = {name: F(name) + group[name] for name in TOTALS}
+    if rows.update(**totals):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(
+                **lookup, **{name: group[name] for name in TOTALS + fields},
+            )
+    except IntegrityError:
+        # Another transaction created the row first.
+        rows.update(**totals)
+
+
+# --------------------------------
+# Rebuilding from the orders
+# --------------------------------
+def rebuild(start, end, chunk_days=DEFAULT_CHUNK_DAYS, pause=0):
+    """
+    Recompute the rollups for the days ``start`` to ``end`` (inclusive) from
+    the orders, ``chunk_days`` days per transaction, sleeping ``pause``
+    seconds between chunks. Returns the number of days with sales.
+    """
+    days = 0
+    first = start
+    while first <= end:
+        last = min(first + timedelta(days=chunk_days - 1), end)
+        with transaction.atomic():
+            days += _rebuild(first, last)
+        first = last + timedelta(days=1)
+        if pause and first <= end:
+            time.sleep(pause)
+    return days
+
+
+def _rebuild(first, last):
+    for model in (DailySales, DailyCategorySales, DailyProductSales):
+        model.objects.filter(day__range=(first, last)).delete()
+
+    # Plain created_at ranges so the (status, -created_at) index applies.
+    placed = {'created_at__gte': start_of_day(first), 'created_at__lt': start_of_day(last + timedelta(days=1))}
+    orders = Order.objects.filter(status__in=COUNTED, **placed)
+    items = OrderItem.objects.filter(
+        order__status__in=COUNTED, **{f'order__{name}': value for name, value in placed.items()}
+    )
+    day = TruncDate('order__created_at')
+
+    totals = {
+        row['day']: row
+        for row in items.values(day=day).annotate(revenue=_revenue(), units=Sum('quantity')).order_by()
+    }
+    created = DailySales.objects.bulk_create([
+        DailySales(
+            day=row['day'], orders=row['orders'],
+            revenue=totals.get(row['day'], {}).get('revenue') or 0,
+            units=totals.get(row['day'], {}).get('units') or 0,
+        )
+        for row in orders.values(day=TruncDate('created_at')).annotate(orders=Count('pk')).order_by()
+    ])
+    DailyCategorySales.objects.bulk_create([
+        DailyCategorySales(**row)
+        for row in items.values(day=day, category=_category())
+        .annotate(revenue=_revenue(), units=Sum('quantity'), orders=Count('order', distinct=True))
+        .order_by()
+    ], batch_size=1000)
+    DailyProductSales.objects.bulk_create([
+        DailyProductSales(**row)
+        for row in items.filter(product__isnull=False)
+        .values('product_id', day=day, product_name=F('product__name'), category=_category())
+        .annotate(revenue=_revenue(), units=Sum('quantity'), orders=Count('order', distinct=True))
+        .order_by()
+    ], batch_size=1000)
+    return len(created)
+
+
+# --------------------------------
+# Reports
+# --------------------------------
+def report(start, end, by=DAY, limit=None):
+    """
+    Sales between ``start`` and ``end`` (inclusive) as dicts with ``revenue``,
+    ``units`` and ``orders``: one per day (every day, zeros included), or per
+    ``category`` or ``product`` with the best sellers first.
+    """
+    if by == DAY:
+        rows = {
+            row['day']: row
+            for row in DailySales.objects.filter(day__range=(start, end)).values('day', *TOTALS)
+        }
+        days = (start + timedelta(days=i) for i in range((end - start).days + 1))
+        return [rows.get(day) or {'day': day, 'revenue': Decimal('0.00'), 'units': 0, 'orders': 0} for day in days]
+
+    if by == CATEGORY:
+        rows = DailyCategorySales.objects.filter(day__range=(start, end)).values('category')
+    elif by == PRODUCT:
+        rows = DailyProductSales.objects.filter(day__range=(start, end)).values('product_id').annotate(
+            product_name=Max('product_name'), category=Max('category')
+        )
+    else:
+        raise ValueError(f'Unknown grouping: {by!r}')
+    # Annotations cannot reuse the field names, so sum under total_* and rename.
+    rows = rows.annotate(**{f'total_{name}': Sum(name) for name in TOTALS}).order_by('-total_revenue')
+    return [
+        {**{key: value for key, value in row.items() if not key.startswith('total_')},
+         **{name: row[f'total_{name}'] for name in TOTALS}, 'revenue': _cents(row['total_revenue'])}
+        for row in (rows[:limit] if limit else rows)
+    ]
+
+
+def _cents(amount):
+    # SQLite hands back sums of decimals unquantized.
+    return Decimal(amount or 0).quantize(CENT)
@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from order_management.signals import status_changed
+from weather.history import searches_recorded
+from . import counters, sales
+
+
+def count_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.add(counters.TRACKED[sender], 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    counters.add(counters.TRACKED[sender], -1)
+
+
+for model in counters.TRACKED:
+    post_save.connect(count_created, sender=model, dispatch_uid=f'count_created_{model._meta.label}')
+    post_delete.connect(count_deleted, sender=model, dispatch_uid=f'count_deleted_{model._meta.label}')
+
+
+@receiver(searches_recorded)
+def count_weather_searches(sender, count, **kwargs):
+    counters.add(counters.WEATHER_SEARCHES, count)
+
+
+@receiver(status_changed)
+def record_sales(sender, changes, **kwargs):
+    sales.record(changes)
@@ -0,0 +1,14 @@
+import logging
+
+from jobs.queue import task
+
+logger = logging.getLogger(__name__)
+
+
+@task(queue='maintenance', max_attempts=3)
+def reconcile_counters():
+    """Recount the dashboard counters and log any that had drifted."""
+    from . import counters
+
+    for name, (before, after) in counters.reconcile_all().items():
+        logger.warning('Dashboard counter %s drifted: %s, recounted %s', name, before, after)
@@ -1,3 +1,284 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import Post
+from order_management.models import Order, OrderItem
+from payments import webhooks
+from payments.models import Payment
+from shop.models import Category, Product
+from weather import history
+from . import counters, sales
+from .models import Counter, DailyCategorySales, DailyProductSales, DailySales
+
+
+class InvoiceExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('accounts', password='pw', is_staff=True)
+        customer = User.objects.create_user('customer')
+        product = Product.objects.create(name='Lamp', price=Decimal('15.00'), stock=50)
+        for status in ('paid', 'paid', 'delivered', 'pending'):
+            order = Order.objects.create(user=customer, status=status, total_amount=15, final_total=15)
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=15)
+            Payment.objects.create(order=order, method='visa')
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media, INVOICE_RENDER_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.login(username='accounts', password='pw')
+
+    def export(self, **params):
+        response = self.client.get(reverse('dashboard:export_invoices'), params, secure=True)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_exports_matching_orders(self):
+        archive = self.export(status='paid')
+        paid = Order.objects.filter(status='paid').order_by('pk')
+        self.assertEqual(archive.namelist(), [f'receipt_{order.pk}.pdf' for order in paid])
+        self.assertTrue(archive.read(archive.namelist()[0]).startswith(b'%PDF'))
+        self.assertIsNone(archive.testzip())
+
+    def test_date_range(self):
+        self.assertEqual(len(self.export().namelist()), 4)
+        self.assertEqual(self.export(start='2000-01-01', end='2000-12-31').namelist(), [])
+
+    def test_invalid_range_redirects(self):
+        response = self.client.get(
+            reverse('dashboard:export_invoices'), {'start': '2020-02-01', 'end': '2020-01-01'}, secure=True
+        )
+        self.assertRedirects(response, reverse('dashboard:home'), fetch_redirect_response=False)
+
+
+class CounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+
+    def home(self):
+        response = self.client.get(reverse('dashboard:home'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_counters_follow_creates_and_deletes(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.home()['products_count'], 0)  # counted once, on first read
+        lamp = Product.objects.create(name='Lamp', price=10)
+        Product.objects.create(name='Desk', price=90)
+        lamp.delete()
+        lamp = Product.objects.get()
+        lamp.name = 'Standing desk'
+        lamp.save()
+        User.objects.create_user('new')
+        history.record(city_name='Cairo', temperature=20)
+        history.record(city_name='Giza', temperature=21)
+        history.flush()
+
+        context = self.home()
+        self.assertEqual(context['products_count'], 1)
+        self.assertEqual(context['users_count'], 2)
+        self.assertEqual(context['weather_count'], 2)
+
+    def test_home_does_not_count_rows(self):
+        self.client.force_login(self.staff)
+        self.home()
+        Product.objects.bulk_create(Product(name=f'P{i}', price=1) for i in range(50))
+        with self.assertNumQueries(6):  # session and user, the counters, then saving the session
+            self.home()
+
+    def test_reconcile_corrects_drift(self):
+        counters.get_many()
+        Post.objects.bulk_create([Post(title='One', slug='one'), Post(title='Two', slug='two')])
+        self.assertEqual(counters.get_many([counters.BLOG_POSTS]), {counters.BLOG_POSTS: 0})
+        self.assertEqual(counters.reconcile_all(), {counters.BLOG_POSTS: (0, 2)})
+        self.assertEqual(Counter.objects.get(name=counters.BLOG_POSTS).value, 2)
+
+
+class OrderListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        alice = User.objects.create_user('alice', email='alice@example.com')
+        bob = User.objects.create_user('bob')
+        start = timezone.make_aware(datetime(2024, 3, 1, 12))
+        for i in range(12):
+            order = Order.objects.create(user=alice if i % 2 else bob, status='paid' if i % 3 else 'pending')
+            Order.objects.filter(pk=order.pk).update(created_at=start + timedelta(days=i))
+            if i % 2:
+                Payment.objects.create(order=order, method='visa')
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def orders(self, **params):
+        response = self.client.get(reverse('dashboard:order_list_api'), params, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_follow_the_cursor(self):
+        first = self.orders(per_page=5)
+        self.assertEqual((first['total'], first['total_qualifier']), (12, ''))
+        seen = [order['id'] for order in first['orders']]
+        cursor = first['next_cursor']
+        while cursor:
+            page = self.orders(per_page=5, cursor=cursor)
+            self.assertNotIn('total', page)
+            seen += [order['id'] for order in page['orders']]
+            cursor = page['next_cursor']
+        self.assertEqual(seen, list(Order.objects.order_by('-created_at', '-id').values_list('pk', flat=True)))
+
+    def test_filters(self):
+        paid = self.orders(status='paid', customer='ALICE@example.com')
+        self.assertEqual({(order['status'], order['customer']) for order in paid['orders']}, {('paid', 'alice')})
+        self.assertEqual(paid['total'], 4)
+        self.assertEqual(paid['orders'][0]['payment_method'], 'visa')
+        in_march = self.orders(start='2024-03-03', end='2024-03-05')
+        self.assertEqual(len(in_march['orders']), 3)
+
+        response = self.client.get(
+            reverse('dashboard:order_list_api'), {'start': '2024-03-05', 'end': '2024-03-01'}, secure=True
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(DASHBOARD_ORDER_COUNT_CAP=5)
+    def test_large_totals_are_not_counted_in_full(self):
+        self.assertEqual((self.orders()['total'], self.orders()['total_qualifier']), (5, 'over'))
+        response = self.client.get(reverse('dashboard:order_list'), secure=True)
+        self.assertContains(response, 'Over 5 orders')
+
+    def test_page_queries_do_not_grow_with_rows(self):
+        # Session and user, the page with its customers and payments, the count (after the table
+        # estimate on PostgreSQL), then saving the session.
+        with self.assertNumQueries(8 if connection.vendor == 'postgresql' else 7):
+            response = self.client.get(reverse('dashboard:order_list'), {'per_page': 10}, secure=True)
+        self.assertEqual(len(response.context['orders']), 10)
+        self.assertContains(response, 'cursor=')
+
+
+class SalesRollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        cls.customer = User.objects.create_user('customer')
+        lighting = Category.objects.create(name='Lighting', slug='lighting')
+        cls.lamp = Product.objects.create(name='Lamp', price=Decimal('15.00'), category_ref=lighting)
+        cls.desk = Product.objects.create(name='Desk', price=Decimal('90.00'), category='Furniture')
+
+    def setUp(self):
+        settings = override_settings(INVOICE_RENDER_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp())
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, settings.options['MEDIA_ROOT'])
+        self.today = timezone.localdate()
+
+    def order(self, *lines, status='pending'):
+        order = Order.objects.create(user=self.customer, status=status)
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        Payment.objects.create(order=order, method='visa')
+        return order
+
+    def rollups(self):
+        return (
+            sorted(DailySales.objects.values_list('day', 'revenue', 'units', 'orders')),
+            sorted(DailyCategorySales.objects.values_list('category', 'revenue', 'units', 'orders')),
+            sorted(DailyProductSales.objects.values_list('product_name', 'category', 'revenue', 'units', 'orders')),
+        )
+
+    def test_paid_orders_are_rolled_up_and_cancellations_taken_back(self):
+        first = self.order((self.lamp, 2), (self.desk, 1))
+        second = self.order((self.lamp, 1))
+        self.assertFalse(DailySales.objects.exists())
+
+        first.payment.confirm()
+        second.payment.confirm()
+        self.assertEqual(self.rollups(), (
+            [(self.today, Decimal('135.00'), 4, 2)],
+            [('Furniture', Decimal('90.00'), 1, 1), ('Lighting', Decimal('45.00'), 3, 2)],
+            [('Desk', 'Furniture', Decimal('90.00'), 1, 1), ('Lamp', 'Lighting', Decimal('45.00'), 3, 2)],
+        ))
+
+        first.status = 'shipped'  # still a sale
+        first.save()
+        first.status = 'cancelled'
+        first.save()
+        self.assertEqual(self.rollups()[0], [(self.today, Decimal('15.00'), 1, 1)])
+        self.assertEqual(DailyCategorySales.objects.get(category='Furniture').orders, 0)
+
+    def test_stale_loads_are_counted_once(self):
+        order = self.order((self.lamp, 2))
+        first, second = (Payment.objects.select_related('order').get(order=order) for _ in range(2))
+        first.confirm()
+        second.confirm()  # its order was loaded while still pending
+        self.assertEqual(self.rollups()[0], [(self.today, Decimal('30.00'), 2, 1)])
+
+        other = self.order((self.desk, 1))
+        stale = Payment.objects.select_related('order').get(order=other)
+        payload = {'order_id': other.pk, 'status': 'successful', 'amount': '90', 'currency': 'EGP'}
+        webhooks.ingest(payload, webhooks.idempotency_key(payload))
+        webhooks.process_batch()
+        stale.confirm()
+        self.assertEqual(self.rollups()[0], [(self.today, Decimal('120.00'), 3, 2)])
+
+    def test_webhook_batches_are_rolled_up(self):
+        paid, failed = self.order((self.desk, 2)), self.order((self.lamp, 1))
+        for order, status in ((paid, 'successful'), (failed, 'failed')):
+            payload = {'order_id': order.pk, 'status': status, 'amount': '1', 'currency': 'EGP'}
+            webhooks.ingest(payload, webhooks.idempotency_key(payload))
+        webhooks.process_batch()
+        self.assertEqual(self.rollups()[0], [(self.today, Decimal('180.00'), 2, 1)])
+
+    def test_backfill_matches_the_incremental_rollups(self):
+        for lines in (((self.lamp, 2), (self.desk, 1)), ((self.lamp, 1),), ((self.desk, 3),)):
+            self.order(*lines).payment.confirm()
+        self.order((self.desk, 5))  # never paid
+        old = self.order((self.lamp, 4), status='delivered')
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=9))
+        DailySales.objects.filter(day=self.today).update(revenue=0)  # drift
+        incremental = self.rollups()
+
+        call_command('backfill_sales', '--chunk-days=3', stdout=io.StringIO())
+        rebuilt = self.rollups()
+        self.assertEqual(rebuilt[0], [
+            (self.today - timedelta(days=9), Decimal('60.00'), 4, 1), (self.today, Decimal('405.00'), 7, 3),
+        ])
+        self.assertEqual(rebuilt[2][0], ('Desk', 'Furniture', Decimal('360.00'), 4, 2))
+        self.assertNotEqual(incremental, rebuilt)
+
+    def test_reports_read_only_the_rollups(self):
+        self.order((self.lamp, 2), (self.desk, 1)).payment.confirm()
+        self.client.force_login(self.staff)
+        with self.assertNumQueries(3):
+            days = sales.report(self.today - timedelta(days=6), self.today)
+            sales.report(self.today, self.today, sales.CATEGORY)
+            sales.report(self.today, self.today, sales.PRODUCT)
+        self.assertEqual(len(days), 7)
+        self.assertEqual(days[0]['revenue'], 0)
+
+        response = self.client.get(reverse('dashboard:sales_api'), {'by': 'product'}, secure=True)
+        self.assertEqual(
+            [(row['product_name'], row['revenue']) for row in response.json()['rows']],
+            [('Desk', '90.00'), ('Lamp', '30.00')],
+        )
+        response = self.client.get(reverse('dashboard:sales_report'), secure=True)
+        self.assertContains(response, '$120.00')
+        response = self.client.get(reverse('dashboard:sales_api'), {'start': '2020-01-01'}, secure=True)
+        self.assertEqual(response.status_code, 400)
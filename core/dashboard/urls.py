@@ -40,7 +40,13 @@ urlpatterns = [
 
     # Orders Management
     path('orders/', views.order_list, name='order_list'),
+    path('orders/api/', views.order_list_api, name='order_list_api'),
     path('orders/<int:pk>/', views.order_detail, name='order_detail'),
     path('orders/<int:pk>/status/', views.update_order_status, name='update_order_status'),
     path('orders/<int:pk>/cancel/', views.cancel_order, name='cancel_order'),
+    path('orders/invoices/export/', views.export_invoices, name='export_invoices'),
+
+    # Sales reports
+    path('sales/', views.sales_report, name='sales_report'),
+    path('sales/api/', views.sales_api, name='sales_api'),
 ]
@@ -1,18 +1,25 @@
 # core/dashboard/views.py
+from datetime import timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import user_passes_test, login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.conf import settings
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
 from order_management.models import Order, OrderItem
 from django.views.decorators.cache import never_cache
+from django.http import JsonResponse, StreamingHttpResponse
 
-from shop.models import Product, ProductSize
+from shop import reservations
+from shop.models import Product, StockReservation
 from events.models import Event
-from weather.models import SearchHistory
+from weather.models import CityWeatherHourly, SearchHistory
 from blog.models import Post
 
-from .forms import ProductForm, EventForm, WeatherForm, UserForm, PostForm
+from . import counters, orders, sales
+from .exports import invoice_archive
+from .forms import ProductForm, EventForm, WeatherForm, UserForm, PostForm, InvoiceExportForm, OrderFilterForm, SalesReportForm
 
 # --------------------------------
 # decorator: only staff/admin
@@ -26,18 +33,15 @@ def staff_required(view):
 @staff_required
 @never_cache
 def dashboard_home(request):
-    products_count = Product.objects.count()
-    users_count = User.objects.count()
-    events_count = Event.objects.count()
-    posts_count = Post.objects.count()
-    weather_count = SearchHistory.objects.count()
+    counts = counters.get_many()
 
     context = {
-        'products_count': products_count,
-        'users_count': users_count,
-        'events_count': events_count,
-        'blog_count': posts_count,
-        'weather_count': weather_count,
+        'export_form': InvoiceExportForm(),
+        'products_count': counts[counters.PRODUCTS],
+        'users_count': counts[counters.USERS],
+        'events_count': counts[counters.EVENTS],
+        'blog_count': counts[counters.BLOG_POSTS],
+        'weather_count': counts[counters.WEATHER_SEARCHES],
     }
     return render(request, 'dashboard/home.html', context)
 
@@ -219,11 +223,37 @@ def event_delete(request, pk):
 # -------------------------------
 # Weather CRUD (admin)
 # -------------------------------
+WEATHER_SUMMARY_DAYS = 7
+WEATHER_RECENT_ENTRIES = 50
+
+
 @staff_required
 def weather_list(request):
-    weather_entries = SearchHistory.objects.all()
-
-    return render(request, 'dashboard/weather_list.html', {'weather_entries': weather_entries})
+    since = timezone.now() - timedelta(days=WEATHER_SUMMARY_DAYS)
+    cities = (
+        CityWeatherHourly.objects.filter(hour__gte=since)
+        .values('city_name')
+        .annotate(
+            searches=Sum('searches'),
+            temp_min=Min('temp_min'),
+            temp_max=Max('temp_max'),
+            temp_sum=Sum('temp_sum'),
+            temp_count=Sum('temp_count'),
+            humidity_sum=Sum('humidity_sum'),
+            humidity_count=Sum('humidity_count'),
+        )
+        .order_by('-searches', 'city_name')
+    )
+    for city in cities:
+        city['temp_mean'] = city['temp_sum'] / city['temp_count'] if city['temp_count'] else None
+        city['humidity_mean'] = city['humidity_sum'] / city['humidity_count'] if city['humidity_count'] else None
+    weather_entries = SearchHistory.objects.order_by('-searched_at')[:WEATHER_RECENT_ENTRIES]
+
+    return render(request, 'dashboard/weather_list.html', {
+        'cities': cities,
+        'summary_days': WEATHER_SUMMARY_DAYS,
+        'weather_entries': weather_entries,
+    })
 
 @staff_required
 def weather_add(request):
@@ -335,54 +365,37 @@ def user_warn(request, pk):
     return redirect('dashboard:users_list')
 
 
-@staff_required
-def order_list(request):
-    orders = Order.objects.all().order_by('-created_at')
-    return render(request, 'dashboard/order_list.html', {'orders': orders})
-
-@staff_required
-def order_detail(request, pk):
-    order = get_object_or_404(Order, pk=pk)
-    items = order.items.all()
-    return render(request, 'dashboard/order_detail.html', {
-        'order': order,
-        'items': items
-    })
-
-@staff_required
-def update_order_status(request, pk):
-    order = get_object_or_404(Order, pk=pk)
-
-    if request.method == 'POST':
-        status = request.POST.get('status')
-        current = order.status
-        if status not in settings.ALLOWED_STATUS_FLOW.get(current, []):
-            messages.error(request, "Invalid status transition.")
-        else:
-            order.status = status
-            order.save()
-            messages.success(request, "Order updated.")
-
-    return redirect('dashboard:order_detail', pk=pk)
-
 @staff_required
 def cancel_order(request, pk):
     order = get_object_or_404(Order, pk=pk)
 
+    # Put back whatever the order still holds unless it already left the warehouse.
+    if order.status not in ('shipped', 'delivered'):
+        reservations.release(order, statuses=(StockReservation.HELD, StockReservation.CONFIRMED))
     
-    if order.status != Order.STATUS_COMPLETED:
-        for item in order.items.all():
-            size = ProductSize.objects.get(
-                product=item.product,
-                size=item.size
-            )
-            size.quantity += item.quantity
-            size.save()
-    
-    order.status = Order.STATUS_CANCELLED
+    order.status = 'cancelled'
     order.save()
     messages.success(request, "Order cancelled.")
     return redirect('dashboard:order_list')
+
+@staff_required
+def export_invoices(request):
+    """Stream a ZIP of invoices for the orders matching the date range / status filter."""
+    form = InvoiceExportForm(request.GET)
+    if not form.is_valid():
+        for error in form.errors.get('__all__', []) or ['Invalid export filter.']:
+            messages.error(request, error)
+        return redirect('dashboard:home')
+
+    data = form.cleaned_data
+    name = '_'.join(
+        str(part) for part in ('invoices', data['start'], data['end'], data['status']) if part
+    )
+    response = StreamingHttpResponse(
+        invoice_archive(form.filter(Order.objects.all())), content_type='application/zip'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}.zip"'
+    return response
     
 
 from accounts.models import BalanceTransaction
@@ -402,8 +415,40 @@ def wallet_history(request):
 # -------------------------------
 @staff_required
 def order_list(request):
-    orders = Order.objects.all().order_by('-created_at')
-    return render(request, 'dashboard/order_list.html', {'orders': orders})
+    form = OrderFilterForm(request.GET)
+    if form.is_valid():
+        matching = form.filter(orders.orders())
+    else:
+        matching = Order.objects.none()
+    page = orders.page(matching, request.GET.get('cursor'), request.GET.get('per_page'))
+    total, qualifier = orders.estimated_count(matching, filtered=form.has_filters())
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    return render(request, 'dashboard/order_list.html', {
+        'form': form,
+        'orders': page.items,
+        'page': page,
+        'total': total,
+        'total_qualifier': qualifier,
+        'params': params.urlencode(),
+    })
+
+@staff_required
+def order_list_api(request):
+    """JSON variant of ``order_list`` for a virtualized table: same filters plus ?cursor=&per_page=;
+    the first page also carries the (estimated) total."""
+    form = OrderFilterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    matching = form.filter(orders.orders())
+    page = orders.page(matching, request.GET.get('cursor'), request.GET.get('per_page'))
+    data = {
+        'orders': [orders.as_json(order) for order in page],
+        'next_cursor': page.next_cursor,
+    }
+    if page.is_first():
+        data['total'], data['total_qualifier'] = orders.estimated_count(matching, filtered=form.has_filters())
+    return JsonResponse(data)
 
 @staff_required
 def order_detail(request, pk):
@@ -424,3 +469,52 @@ def update_order_status(request, pk):
             messages.error(request, "Invalid status.")
 
     return redirect('dashboard:order_detail', pk=pk)
+
+# -------------------------------
+# Sales reports (admin)
+# -------------------------------
+SALES_TOP = 10
+SALES_API_MAX_ROWS = 500
+
+
+@staff_required
+def sales_report(request):
+    """Revenue, units and orders per day, category and product; reads only the rollups."""
+    form = SalesReportForm(request.GET)
+    context = {'form': form}
+    if form.is_valid():
+        start, end = form.cleaned_data['start'], form.cleaned_data['end']
+        days = sales.report(start, end)
+        peak = max((day['revenue'] for day in days), default=0)
+        for day in days:
+            day['share'] = int(day['revenue'] * 100 / peak) if peak > 0 else 0
+        context.update({
+            'days': days,
+            'totals': {name: sum(day[name] for day in days) for name in sales.TOTALS},
+            'categories': sales.report(start, end, sales.CATEGORY, limit=SALES_TOP),
+            'products': sales.report(start, end, sales.PRODUCT, limit=SALES_TOP),
+        })
+    return render(request, 'dashboard/sales.html', context)
+
+@staff_required
+def sales_api(request):
+    """Sales rows for charts: ?start=&end=&by=day|category|product&limit= (limit applies to categories and products)."""
+    form = SalesReportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    data = form.cleaned_data
+    try:
+        limit = max(1, min(int(request.GET.get('limit', SALES_API_MAX_ROWS)), SALES_API_MAX_ROWS))
+    except ValueError:
+        limit = SALES_API_MAX_ROWS
+    rows = sales.report(data['start'], data['end'], data['by'], limit=limit)
+    for row in rows:
+        row['revenue'] = str(row['revenue'])
+        if 'day' in row:
+            row['day'] = row['day'].isoformat()
+    return JsonResponse({
+        'start': data['start'].isoformat(),
+        'end': data['end'].isoformat(),
+        'by': data['by'],
+        'rows': rows,
+    })
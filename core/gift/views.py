@@ -3,8 +3,9 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
 from .models import Gift, GiftRedemption
-from django.core.mail import send_mail
 from django.conf import settings
+from jobs.queue import enqueue
+from jobs.tasks import send_email
 
 def gift_list(request):
     """Display all available gifts"""
@@ -62,18 +63,20 @@ def redeem_gift(request, uid):
                     status='completed'
                     
                 )
-                send_mail(
-                    subject='🎉 Gift Redeemed Successfully!',
-                    message=(
-                        f"Hi {user.username},\n\n"
-                        f"Congratulations! 🎁 You have redeemed: {gift.name}.\n"
-                        f"Points spent: {gift.points_cost}. Remaining points: {profile.points}.\n\n"
-                        "Your gift has been added to your profile (My Gifts)."
-                    ),
-                    from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', None),
-                    recipient_list=[user.email] if user.email else [],
-                    fail_silently=True,
-                )
+                # Queued with the redemption: sent by a worker only if it commits.
+                if user.email:
+                    enqueue(
+                        send_email,
+                        '🎉 Gift Redeemed Successfully!',
+                        (
+                            f"Hi {user.username},\n\n"
+                            f"Congratulations! 🎁 You have redeemed: {gift.name}.\n"
+                            f"Points spent: {gift.points_cost}. Remaining points: {profile.points}.\n\n"
+                            "Your gift has been added to your profile (My Gifts)."
+                        ),
+                        getattr(settings, 'DEFAULT_FROM_EMAIL', None),
+                        [user.email],
+                    )
                 
                 messages.success(request, f"🎉 Congrats! {gift.name} has been added to your profile (My Gifts).")
                 return redirect('gift:gift_list')
@@ -0,0 +1,20 @@
+"""Django admin configuration for background jobs."""
+from django.contrib import admin
+from django.utils import timezone
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Queued, running and finished background jobs."""
+
+    list_display = ["id", "task", "queue", "status", "attempts", "run_at", "finished_at"]
+    list_filter = ["status", "queue", "task"]
+    search_fields = ["task", "last_error"]
+    readonly_fields = ["created_at", "locked_by", "locked_at", "finished_at", "last_error"]
+    ordering = ["-id"]
+    actions = ["retry"]
+
+    @admin.action(description="Run selected jobs again")
+    def retry(self, request, queryset):
+        queryset.exclude(status=Job.RUNNING).update(status=Job.QUEUED, attempts=0, run_at=timezone.now())
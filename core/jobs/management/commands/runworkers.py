@@ -0,0 +1,41 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (emails, ...) with a pool of worker threads and, "
+        "for CPU-bound tasks, processes. Stops cleanly on SIGINT/SIGTERM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--queues", default="", help="Comma-separated queues to take jobs from (default: all)."
+        )
+        parser.add_argument(
+            "--threads", type=int, default=getattr(settings, "JOBS_THREADS", 4),
+            help="Worker threads for I/O-bound tasks.",
+        )
+        parser.add_argument(
+            "--processes", type=int, default=getattr(settings, "JOBS_PROCESSES", 0),
+            help="Worker processes for tasks declared with executor='process'.",
+        )
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds between polls when idle.")
+        parser.add_argument("--burst", action="store_true", help="Exit once no job is due.")
+
+    def handle(self, *args, **options):
+        queues = [q.strip() for q in options["queues"].split(",") if q.strip()]
+        worker = Worker(queues, options["threads"], options["processes"], options["poll"])
+        signal.signal(signal.SIGINT, worker.stop)
+        signal.signal(signal.SIGTERM, worker.stop)
+
+        self.stdout.write(self.style.NOTICE(
+            f"Worker {worker.name}: {options['threads']} thread(s), {options['processes']} process(es), "
+            f"queues {', '.join(queues) or 'all'}"
+        ))
+        processed = worker.run(burst=options["burst"])
+        self.stdout.write(self.style.SUCCESS(f"Stopped after {processed} job(s)."))
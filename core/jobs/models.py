@@ -0,0 +1,48 @@
+"""
+Background job queue.
+
+A ``Job`` is a call to a registered task (``jobs.queue.task``) that a
+``runworkers`` process will make later. Jobs are ordinary rows, so one
+enqueued inside a transaction exists only if that transaction commits.
+"""
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """A queued, running or finished call to a registered task."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    task = models.CharField(max_length=200)
+    queue = models.CharField(max_length=50, default="default")
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now, help_text="Not started before this time")
+    locked_by = models.CharField(max_length=100, blank=True, help_text="Worker claim running this job")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-id"]
+        indexes = [
+            models.Index(fields=["status", "queue", "run_at"]),
+            models.Index(fields=["locked_by"]),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
@@ -0,0 +1,18 @@
+"""
+Entry points for the worker's process pool.
+
+Spawned children start with no apps loaded, so this module must be
+importable before ``django.setup()``: it imports nothing from the project
+at module level.
+"""
+
+
+def setup():
+    """Pool initializer: children inherit DJANGO_SETTINGS_MODULE but must load the apps themselves."""
+    import django
+    django.setup()
+
+
+def execute(name, args, kwargs):
+    from .queue import execute
+    return execute(name, args, kwargs)
@@ -0,0 +1,202 @@
+"""
+A database-backed job queue that needs no broker.
+
+Declare a task in an app's ``tasks.py`` (discovered when Django starts)::
+
+    @task(queue='email', max_attempts=5)
+    def send_email(subject, body, from_email, to):
+        ...
+
+and queue a call with JSON-serialisable arguments::
+
+    enqueue(send_email, 'Hi', 'Body', None, ['a@example.com'])
+
+The job is a row in ``jobs_job``. Enqueued inside ``transaction.atomic()``,
+it is committed or rolled back together with the rest of the transaction,
+so it doubles as an outbox: an email queued next to a write is only sent if
+the write is kept. ``manage.py runworkers`` claims and runs queued jobs (see
+``jobs.worker``). A failed job is retried with exponential backoff until it
+has used ``max_attempts``.
+
+Claiming uses ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database
+supports it, so workers never wait on each other's rows. On SQLite a single
+``UPDATE ... WHERE id IN (SELECT ... LIMIT n) AND status = 'queued'`` tags
+the claimed rows; SQLite runs one writer at a time, so no two workers can
+claim the same job.
+"""
+import os
+import random
+import socket
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
+
+from .models import Job
+
+DEFAULT_QUEUE = 'default'
+DEFAULT_BACKOFF = 10  # seconds before the first retry, doubled on each later one
+DEFAULT_MAX_BACKOFF = 3600
+DEFAULT_LOCK_TIMEOUT = 600  # seconds before a running job is presumed lost with its worker
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+_registry = {}
+
+
+class Task:
+    """A function registered with ``@task``; calling it runs it directly."""
+
+    def __init__(self, func, name, queue, max_attempts, executor):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.executor = executor
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        return enqueue(self, *args, **kwargs)
+
+
+def task(func=None, *, name=None, queue=DEFAULT_QUEUE, max_attempts=5, executor=THREAD):
+    """
+    Register ``func`` as a task. ``executor='process'`` runs it in the worker's
+    process pool (for CPU-bound work); the default runs it on a thread.
+    """
+    def register(func):
+        registered = Task(func, name or f'{func.__module__}.{func.__qualname__}', queue, max_attempts, executor)
+        _registry[registered.name] = registered
+        return registered
+    return register(func) if func is not None else register
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f'No task registered as {name!r}') from None
+
+
+def enqueue(task, *args, queue=None, delay=None, run_at=None, **kwargs):
+    """
+    Queue ``task(*args, **kwargs)``; returns the ``Job``. ``delay`` (seconds
+    or ``timedelta``) or ``run_at`` postpones it.
+    """
+    if isinstance(task, str):
+        task = get_task(task)
+    if run_at is None:
+        run_at = timezone.now()
+        if delay:
+            run_at += delay if isinstance(delay, timedelta) else timedelta(seconds=delay)
+    job = Job.objects.create(
+        task=task.name,
+        queue=queue or task.queue,
+        args=list(args),
+        kwargs=kwargs,
+        max_attempts=task.max_attempts,
+        run_at=run_at,
+    )
+    if getattr(settings, 'JOBS_RUN_INLINE', False):
+        # Development without a worker: run it once the enqueuing transaction commits.
+        transaction.on_commit(lambda: run_inline(job.pk))
+    return job
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(queues=None, limit=1, worker=None):
+    """Mark up to ``limit`` due jobs as running for this worker and return them."""
+    now = timezone.now()
+    token = f'{worker or worker_name()}:{uuid.uuid4().hex[:8]}'
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'pk')
+    if queues:
+        due = due.filter(queue__in=queues)
+    claimed = {'status': Job.RUNNING, 'locked_by': token, 'locked_at': now, 'attempts': F('attempts') + 1}
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            if not ids:
+                return []
+            Job.objects.filter(pk__in=ids).update(**claimed)
+        else:
+            if not Job.objects.filter(
+                pk__in=Subquery(due.values('pk')[:limit]), status=Job.QUEUED
+            ).update(**claimed):
+                return []
+    return list(Job.objects.filter(locked_by=token, status=Job.RUNNING).order_by('run_at', 'pk'))
+
+
+def execute(name, args, kwargs):
+    """Run one job's task in a worker thread or process."""
+    from django.db import close_old_connections
+
+    try:
+        return get_task(name)(*args, **kwargs)
+    finally:
+        # Pool threads and processes outlive jobs as request threads outlive
+        # requests: drop connections that are broken or past CONN_MAX_AGE.
+        close_old_connections()
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that has failed ``attempts`` times, with ±25% jitter."""
+    base = getattr(settings, 'JOBS_BACKOFF', DEFAULT_BACKOFF)
+    ceiling = getattr(settings, 'JOBS_MAX_BACKOFF', DEFAULT_MAX_BACKOFF)
+    return min(ceiling, base * 2 ** max(0, attempts - 1)) * random.uniform(0.75, 1.25)
+
+
+def succeeded(job):
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        status=Job.DONE, finished_at=timezone.now(), locked_by='', last_error=''
+    )
+
+
+def failed(job, exc):
+    """Schedule a retry of ``job``, or give up on it once it has used all its attempts."""
+    error = ''.join(traceback.format_exception(exc))[-4000:]
+    now = timezone.now()
+    jobs = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    if job.attempts >= job.max_attempts:
+        jobs.update(status=Job.FAILED, finished_at=now, locked_by='', last_error=error)
+    else:
+        jobs.update(
+            status=Job.QUEUED, locked_by='', last_error=error,
+            run_at=now + timedelta(seconds=backoff(job.attempts)),
+        )
+
+
+def requeue_stale(timeout=None):
+    """Put back running jobs whose worker has not finished them within ``timeout`` seconds."""
+    if timeout is None:
+        timeout = getattr(settings, 'JOBS_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)
+    return Job.objects.filter(
+        status=Job.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status=Job.QUEUED, locked_by='')
+
+
+def run_inline(job_id):
+    """Claim and run one job in the calling thread (``JOBS_RUN_INLINE``)."""
+    token = f'{worker_name()}:inline:{uuid.uuid4().hex[:8]}'
+    if not Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+        status=Job.RUNNING, locked_by=token, locked_at=timezone.now(), attempts=F('attempts') + 1
+    ):
+        return
+    job = Job.objects.get(pk=job_id)
+    try:
+        get_task(job.task)(*job.args, **job.kwargs)
+    except Exception as exc:
+        failed(job, exc)
+    else:
+        succeeded(job)
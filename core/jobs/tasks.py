@@ -0,0 +1,9 @@
+from django.core.mail import EmailMessage
+
+from .queue import task
+
+
+@task(queue='email', max_attempts=8)
+def send_email(subject, body, from_email, to):
+    """Send a plain-text email; SMTP errors raise so the job is retried."""
+    EmailMessage(subject, body, from_email, to).send(fail_silently=False)
@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from gift.models import Gift
+from . import queue
+from .models import Job
+from .tasks import send_email
+from .worker import Worker
+
+calls = []
+
+
+@queue.task(name='jobs.tests.record')
+def record(value):
+    calls.append(value)
+
+
+@queue.task(name='jobs.tests.flaky', max_attempts=2)
+def flaky():
+    raise ConnectionError('SMTP unavailable')
+
+
+def work():
+    return Worker(threads=0).run(burst=True)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueued_job_runs_once(self):
+        job = record.enqueue('a')
+        self.assertEqual(work(), 1)
+        self.assertEqual(calls, ['a'])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+        self.assertEqual(work(), 0)
+
+    def test_jobs_roll_back_with_their_transaction(self):
+        with transaction.atomic():
+            record.enqueue('kept')
+        with transaction.atomic():
+            record.enqueue('dropped')
+            transaction.set_rollback(True)
+        work()
+        self.assertEqual(calls, ['kept'])
+
+    def test_delayed_jobs_wait(self):
+        record.enqueue('later', delay=60)
+        self.assertEqual(work(), 0)
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(work(), 1)
+
+    def test_claims_do_not_overlap(self):
+        for i in range(5):
+            record.enqueue(i)
+        first = queue.claim(limit=3)
+        second = queue.claim(limit=3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+        self.assertEqual(queue.claim(limit=3), [])
+
+    def test_failures_back_off_then_give_up(self):
+        job = flaky.enqueue()
+        with self.assertLogs('jobs.worker', 'WARNING'):
+            work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+        self.assertIn('SMTP unavailable', job.last_error)
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('jobs.worker', 'WARNING'):
+            work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_stale_jobs_are_requeued(self):
+        record.enqueue('lost')
+        queue.claim()
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(queue.requeue_stale(timeout=60), 1)
+        self.assertEqual(work(), 1)
+
+
+
+class WorkerPoolTests(TransactionTestCase):
+    """Pool threads use their own connections, so the jobs must be committed."""
+
+    def test_thread_pool(self):
+        calls.clear()
+        for i in range(10):
+            record.enqueue(i)
+        self.assertEqual(Worker(threads=4).run(burst=True), 10)
+        self.assertEqual(sorted(calls), list(range(10)))
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 10)
+
+
+class OutboxEmailTests(TestCase):
+
+    def test_gift_email_is_sent_by_the_worker(self):
+        user = User.objects.create_user('fan', 'fan@example.com', 'pw')
+        user.profile.points = 1000
+        user.profile.save()
+        gift = Gift.objects.create(name='Mug', points_cost=100, stock_quantity=3)
+        self.client.login(username='fan', password='pw')
+
+        self.client.post(reverse('gift:redeem_gift', args=[gift.uid]), secure=True)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Job.objects.get().task, send_email.name)
+
+        work()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['fan@example.com'])
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_inline_mode_sends_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            send_email.enqueue('Hi', 'Body', None, ['x@example.com'])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
@@ -0,0 +1,116 @@
+"""
+The ``runworkers`` loop.
+
+The main thread claims due jobs, hands each to a thread pool (I/O-bound
+tasks such as email) or a process pool (tasks declared with
+``executor='process'``), and records each outcome as its future completes.
+It claims no more jobs than it has free slots, so a busy worker leaves the
+rest of the queue to other workers.
+"""
+import logging
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from . import process, queue
+
+logger = logging.getLogger(__name__)
+
+STALE_CHECK_INTERVAL = 60  # seconds
+
+
+class Worker:
+    """Runs jobs from ``queues`` (all queues if empty) until stopped."""
+
+    def __init__(self, queues=None, threads=4, processes=0, poll=1.0):
+        self.queues = queues or None
+        self.poll = poll
+        self.name = queue.worker_name()
+        self.threads = ThreadPoolExecutor(threads, thread_name_prefix='job') if threads > 0 else None
+        self.process_count = processes
+        self.processes = self._process_pool() if processes > 0 else None
+        self.capacity = max(1, threads) + max(0, processes)
+        self.running = {}
+        self.stopping = False
+        self.processed = 0
+
+    def _process_pool(self):
+        return ProcessPoolExecutor(
+            self.process_count, mp_context=multiprocessing.get_context('spawn'), initializer=process.setup
+        )
+
+    def stop(self, *args):
+        """Finish the jobs already started, then return from ``run()``."""
+        self.stopping = True
+
+    def run(self, burst=False):
+        """Work until ``stop()``; with ``burst``, return as soon as nothing is due. Returns jobs run."""
+        last_stale_check = 0
+        try:
+            while not self.stopping:
+                if time.monotonic() - last_stale_check > STALE_CHECK_INTERVAL:
+                    queue.requeue_stale()
+                    last_stale_check = time.monotonic()
+
+                free = self.capacity - len(self.running)
+                jobs = queue.claim(self.queues, free, self.name) if free > 0 else []
+                for job in jobs:
+                    self._start(job)
+
+                if self.running:
+                    self._collect(self.poll if not jobs else 0)
+                elif burst:
+                    break
+                elif not jobs:
+                    time.sleep(self.poll)
+            while self.running:
+                self._collect(None)
+        finally:
+            for pool in (self.threads, self.processes):
+                if pool is not None:
+                    pool.shutdown(wait=True)
+        return self.processed
+
+    def _start(self, job):
+        try:
+            task = queue.get_task(job.task)
+        except LookupError as exc:
+            self._finish(job, exc)
+            return
+        pool = self.threads
+        if task.executor == queue.PROCESS and self.processes is not None:
+            pool = self.processes
+        if pool is None:
+            self._finish(job, self._run_here(job))
+            return
+        target = process.execute if pool is self.processes else queue.execute
+        self.running[pool.submit(target, job.task, job.args, job.kwargs)] = (job, pool)
+
+    @staticmethod
+    def _run_here(job):
+        # Not queue.execute(): the main thread keeps its connection between jobs.
+        try:
+            queue.get_task(job.task)(*job.args, **job.kwargs)
+        except Exception as exc:
+            return exc
+        return None
+
+    def _collect(self, timeout):
+        done, _ = wait(self.running, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            job, pool = self.running.pop(future)
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool) and pool is self.processes:
+                # A child died (killed, out of memory); later jobs get a fresh pool.
+                pool.shutdown(wait=False)
+                self.processes = self._process_pool()
+            self._finish(job, error)
+
+    def _finish(self, job, error):
+        self.processed += 1
+        if error is None:
+            queue.succeeded(job)
+        else:
+            logger.warning('Job %s (%s) failed on attempt %s: %r', job.pk, job.task, job.attempts, error)
+            queue.failed(job, error)
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+
+from order_management.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill missing order item prices and recompute total_amount/final_total "
+        "for historical orders, one id range per transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Orders per transaction.")
+        parser.add_argument("--start-id", type=int, default=None, help="Resume from this order id.")
+        parser.add_argument("--status", default=None, help="Only orders with this status.")
+        parser.add_argument(
+            "--include-zero",
+            action="store_true",
+            help="Also backfill items recorded at 0.00 (as confirm_payment does).",
+        )
+
+    def handle(self, *args, **options):
+        chunk = max(1, options["chunk_size"])
+        orders = Order.objects.all()
+        if options["status"]:
+            orders = orders.filter(status=options["status"])
+
+        bounds = orders.aggregate(low=Min("pk"), high=Max("pk"))
+        if bounds["low"] is None:
+            self.stdout.write(self.style.WARNING("No orders to recalculate."))
+            return
+        low = max(bounds["low"], options["start_id"] or bounds["low"])
+        high = bounds["high"]
+        span = high - low + 1
+
+        self.stdout.write(self.style.NOTICE(f"Recalculating orders {low}..{high} in chunks of {chunk}"))
+        start = time.perf_counter()
+        done = backfilled = 0
+        for first in range(low, high + 1, chunk):
+            last = min(first + chunk - 1, high)
+            with transaction.atomic():
+                batch = orders.filter(pk__gte=first, pk__lte=last)
+                backfilled += OrderItem.objects.filter(order__in=batch).backfill_prices(
+                    include_zero=options["include_zero"]
+                )
+                done += batch.recalc_totals()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"  ids {first}..{last}  {100 * (last - low + 1) / span:5.1f}%  "
+                f"{done} orders  {done / elapsed if elapsed else 0:,.0f}/s",
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Recalculated {done} orders and backfilled {backfilled} item prices "
+            f"in {time.perf_counter() - start:.1f}s."
+        ))
@@ -9,25 +9,32 @@ class Migration(migrations.Migration):
         ('order_management', '0001_initial'),
     ]
 
+    # 0001_initial already creates these columns. SQLite tolerated adding them
+    # again by rebuilding the table; other databases reject the duplicate
+    # columns, so this only restates the fields.
     operations = [
-        migrations.AddField(
-            model_name='order',
-            name='delivery_address',
-            field=models.TextField(default=''),
-        ),
-        migrations.AddField(
-            model_name='order',
-            name='delivery_fee',
-            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
-        ),
-        migrations.AddField(
-            model_name='order',
-            name='total_price',
-            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
-        ),
-        migrations.AddField(
-            model_name='order',
-            name='final_total',
-            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='order',
+                    name='delivery_address',
+                    field=models.TextField(default=''),
+                ),
+                migrations.AddField(
+                    model_name='order',
+                    name='delivery_fee',
+                    field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+                migrations.AddField(
+                    model_name='order',
+                    name='total_price',
+                    field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+                migrations.AddField(
+                    model_name='order',
+                    name='final_total',
+                    field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+            ],
         ),
     ]
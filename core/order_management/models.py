@@ -6,6 +6,8 @@ payment status.
 """
 from decimal import Decimal
 from django.db import models
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from shop.models import Product
 
@@ -20,6 +22,55 @@ SIZE_CHOICES = [
 ]
 
 
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _line_total():
+    return Sum(F("price") * F("quantity"), output_field=MONEY)
+
+
+class OrderItemQuerySet(models.QuerySet):
+    def backfill_prices(self, include_zero=False):
+        """
+        Copy the current product price onto items with no recorded price (or a
+        zero one with ``include_zero``) in one UPDATE; items whose product is
+        gone get 0.00. Returns the number of items updated.
+        """
+        missing = Q(price__isnull=True)
+        if include_zero:
+            missing |= Q(price=0)
+        product_price = Product.objects.filter(pk=OuterRef("product_id")).values("price")[:1]
+        return self.filter(missing).update(
+            price=Coalesce(Subquery(product_price), Value(Decimal("0.00")), output_field=MONEY)
+        )
+
+    def total(self):
+        """Sum of price x quantity, computed by the database."""
+        return self.aggregate(total=_line_total())["total"] or Decimal("0.00")
+
+
+class OrderQuerySet(models.QuerySet):
+    def recalc_totals(self):
+        """
+        Recompute ``total_amount`` and ``final_total`` for every order in the
+        queryset from its items with a single UPDATE. Returns the row count.
+        """
+        items_total = Coalesce(
+            Subquery(
+                OrderItem.objects.filter(order=OuterRef("pk"))
+                .values("order")
+                .annotate(total=_line_total())
+                .values("total")[:1]
+            ),
+            Value(Decimal("0.00")),
+            output_field=MONEY,
+        )
+        return self.update(
+            total_amount=items_total,
+            final_total=items_total + Coalesce(F("delivery_fee"), Value(Decimal("0.00")), output_field=MONEY),
+        )
+
+
 class Order(models.Model):
     """Customer order with status tracking and payment management."""
 
@@ -65,6 +116,8 @@ class Order(models.Model):
         max_length=30, choices=STATUS_CHOICES, default="pending", db_index=True
     )
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
         indexes = [
@@ -75,21 +128,15 @@ class Order(models.Model):
     def __str__(self):
         return f"Order #{self.id} - {self.user}"
 
-    def recalc_totals(self):
-        """Recalculate totals from order items and persist changes."""
-        total = Decimal("0.00")
-        for item in self.items.all():
-            # Ensure item has a recorded price
-            if item.price is None:
-                item.price = (
-                    item.product.price if item.product else Decimal("0.00")
-                )
-                item.save()
-            total += item.price * item.quantity
-
-        self.total_amount = total
-        self.final_total = total + (self.delivery_fee or Decimal("0.00"))
-        self.save()
+    def recalc_totals(self, include_zero=False):
+        """
+        Recalculate totals from order items and persist changes. Items without a
+        recorded price (or a zero one with ``include_zero``) get the product's.
+        """
+        self.items.backfill_prices(include_zero=include_zero)
+        self.total_amount = self.items.total()
+        self.final_total = self.total_amount + (self.delivery_fee or Decimal("0.00"))
+        self.save(update_fields=["total_amount", "final_total"])
         return self.total_amount
 
 
@@ -113,6 +160,8 @@ class OrderItem(models.Model):
         help_text="Price at time of order",
     )
 
+    objects = OrderItemQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Order Items"
 
@@ -0,0 +1,49 @@
+"""
+``status_changed`` tells other apps an order's status changed.
+
+It is sent with ``changes``, a list of ``(order, previous_status)`` pairs,
+in the same transaction as the change: once per ``Order.save()`` that
+creates an order or changes its status (``previous_status`` is ``None`` for
+a new order), and once per batch by code that updates statuses in bulk,
+such as ``payments.webhooks``. Queryset ``update()`` calls elsewhere, and
+saves of orders loaded with ``status`` deferred, send nothing.
+
+``previous_status`` is the status the instance was loaded with, so code
+that may race another change re-reads it under a row lock in the
+transaction that saves it: ``lock_status()`` (``Payment.confirm()``), or
+``select_for_update()`` for bulk updates (``payments.webhooks``).
+"""
+from django.db.models.signals import post_init, post_save
+from django.dispatch import Signal, receiver
+
+from .models import Order
+
+status_changed = Signal()
+
+
+@receiver(post_init, sender=Order)
+def remember_status(sender, instance, **kwargs):
+    if 'status' in instance.__dict__:
+        instance._saved_status = instance.status
+
+
+@receiver(post_save, sender=Order)
+def send_status_changed(sender, instance, created, raw=False, **kwargs):
+    if raw or not (created or hasattr(instance, '_saved_status')):
+        return
+    previous = None if created else instance._saved_status
+    if instance.status == previous:
+        return
+    instance._saved_status = instance.status
+    status_changed.send(sender=Order, changes=[(instance, previous)])
+
+
+def lock_status(order):
+    """
+    Lock ``order``'s row and reload its status, so its next save reports the
+    change from the current status. Call inside the transaction that saves it.
+    """
+    order.status = order._saved_status = (
+        Order.objects.select_for_update().values_list('status', flat=True).get(pk=order.pk)
+    )
+    return order.status
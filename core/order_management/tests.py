@@ -1,3 +1,84 @@
+import io
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from shop.models import Product
+from .models import Order, OrderItem
+
+
+class RecalcTotalsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pw')
+        cls.lamp = Product.objects.create(name='Lamp', price=Decimal('12.50'))
+        cls.bulb = Product.objects.create(name='Bulb', price=Decimal('3.00'))
+
+    def order(self, *lines, delivery_fee='0.00', status='pending'):
+        order = Order.objects.create(user=self.user, delivery_fee=Decimal(delivery_fee), status=status)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=quantity, price=Decimal(price))
+            for product, quantity, price in lines
+        )
+        return order
+
+    def test_recorded_prices_are_kept(self):
+        # A line sold during a sale keeps its discounted price, not today's list price.
+        order = self.order((self.lamp, 2, '10.00'), (self.bulb, 3, '3.00'), delivery_fee='4.99')
+        self.assertEqual(order.recalc_totals(), Decimal('29.00'))
+        order.refresh_from_db()
+        self.assertEqual((order.total_amount, order.final_total), (Decimal('29.00'), Decimal('33.99')))
+        self.assertEqual(order.recalc_totals(include_zero=True), Decimal('29.00'))
+
+    def test_zero_prices_are_backfilled_only_with_include_zero(self):
+        order = self.order((self.lamp, 2, '0.00'), (self.bulb, 1, '3.00'))
+        self.assertEqual(order.recalc_totals(), Decimal('3.00'))
+        self.assertEqual(order.items.get(product=self.lamp).price, Decimal('0.00'))
+        self.assertEqual(order.recalc_totals(include_zero=True), Decimal('28.00'))
+        self.assertEqual(order.items.get(product=self.lamp).price, Decimal('12.50'))
+
+    def test_items_of_deleted_products_count_as_zero(self):
+        gone = Product.objects.create(name='Gone', price=Decimal('99.00'))
+        order = self.order((gone, 1, '0.00'), (self.bulb, 2, '3.00'), delivery_fee='5.00')
+        gone.delete()
+        self.assertEqual(OrderItem.objects.filter(order=order).backfill_prices(include_zero=True), 1)
+        self.assertEqual(order.items.filter(product__isnull=True).get().price, Decimal('0.00'))
+        self.assertEqual(order.recalc_totals(), Decimal('6.00'))
+        order.refresh_from_db()
+        self.assertEqual(order.final_total, Decimal('11.00'))
+
+    def test_queryset_recalc_in_one_update(self):
+        first = self.order((self.lamp, 1, '12.50'), delivery_fee='2.00')
+        empty = self.order(delivery_fee='3.00')
+        Order.objects.filter(pk__in=[first.pk, empty.pk]).update(total_amount=1, final_total=1)
+        with self.assertNumQueries(1):
+            self.assertEqual(Order.objects.filter(pk__in=[first.pk, empty.pk]).recalc_totals(), 2)
+        first.refresh_from_db()
+        empty.refresh_from_db()
+        self.assertEqual((first.total_amount, first.final_total), (Decimal('12.50'), Decimal('14.50')))
+        self.assertEqual((empty.total_amount, empty.final_total), (Decimal('0.00'), Decimal('3.00')))
+
+    def test_command(self):
+        orders = [self.order((self.lamp, 1, '0.00'), (self.bulb, i + 1, '3.00'), delivery_fee='1.00') for i in range(5)]
+        shipped = self.order((self.lamp, 2, '0.00'), status='shipped')
+        out = io.StringIO()
+        call_command('recalc_order_totals', '--chunk-size=2', '--start-id', str(orders[1].pk), stdout=out)
+        self.assertIn('Recalculated 5 orders and backfilled 0 item prices', out.getvalue())
+        totals = dict(Order.objects.values_list('pk', 'final_total'))
+        self.assertEqual(totals[orders[0].pk], Decimal('0.00'))  # before --start-id
+        self.assertEqual(totals[orders[1].pk], Decimal('7.00'))
+        self.assertEqual(totals[shipped.pk], Decimal('0.00'))
+
+        call_command('recalc_order_totals', '--status=shipped', '--include-zero', stdout=out)
+        self.assertIn('Recalculated 1 orders and backfilled 1 item prices', out.getvalue())
+        shipped.refresh_from_db()
+        self.assertEqual(shipped.final_total, Decimal('25.00'))
+        self.assertEqual(orders[2].items.get(product=self.lamp).price, Decimal('0.00'))
+
+    def test_command_without_orders(self):
+        out = io.StringIO()
+        call_command('recalc_order_totals', stdout=out)
+        self.assertIn('No orders to recalculate.', out.getvalue())
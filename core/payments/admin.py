@@ -3,7 +3,7 @@
 Customizes the admin interface for managing payment records.
 """
 from django.contrib import admin
-from .models import Payment
+from .models import Payment, WebhookInbox
 
 
 @admin.register(Payment)
@@ -15,3 +15,14 @@ class PaymentAdmin(admin.ModelAdmin):
     search_fields = ["order__id", "order__user__username"]
     readonly_fields = ["paid_at"]
     ordering = ["-paid_at"]
+
+
+@admin.register(WebhookInbox)
+class WebhookInboxAdmin(admin.ModelAdmin):
+    """Queued and applied payment gateway notifications."""
+
+    list_display = ["id", "key", "status", "received_at", "processed_at", "error"]
+    list_filter = ["status"]
+    search_fields = ["key"]
+    readonly_fields = ["key", "payload", "received_at", "processed_at"]
+    ordering = ["-id"]
@@ -0,0 +1,332 @@
+"""
+Invoice PDFs, rendered once and served from disk.
+
+An invoice is stored content-addressed under ``MEDIA_ROOT``::
+
+    invoices/<order id>/<sha256 of the invoice contents>.pdf
+
+so the file for an order stays valid until something printed on it
+changes (a recalculated total, a backfilled price), at which point the
+next request simply finds no file under the new name.
+
+``schedule()`` snapshots the order into plain data in the web process and
+hands the ReportLab build to a process pool once the transaction commits;
+``Payment.confirm()`` calls it, so by the time the customer clicks
+*Download* the file is normally on disk. The worker writes to a temporary
+file and renames it into place, so a half-written PDF is never served.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_WAIT = 2  # seconds a download waits for a render already under way
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+class RenderError(Exception):
+    """An invoice could not be rendered; the next request tries again."""
+
+
+def invoice_data(order):
+    """
+    Everything printed on ``order``'s invoice, as JSON-serialisable data.
+    Runs two queries: the order with its user and payment, and its items.
+    """
+    from order_management.models import Order
+
+    order = Order.objects.select_related('user', 'payment').get(pk=order.pk)
+    return _snapshot(order, order.items.select_related('product').order_by('pk'))
+
+
+def snapshots(orders, chunk_size=500):
+    """Yield ``invoice_data()`` for every order in ``orders``, a few queries per ``chunk_size`` orders."""
+    from django.db.models import Prefetch
+
+    from order_management.models import OrderItem
+
+    items = Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('pk'))
+    orders = orders.select_related('user', 'payment').prefetch_related(items).order_by('pk')
+    for order in orders.iterator(chunk_size=chunk_size):
+        yield _snapshot(order, order.items.all())
+
+
+def _snapshot(order, items):
+    payment = getattr(order, 'payment', None)
+    # Receipts are stamped in Cairo time (UTC+2) with the moment of payment.
+    paid = (payment and payment.paid_at) or order.created_at
+    stamped = paid.astimezone(dt_timezone.utc) + timedelta(hours=2)
+    lines = []
+    for item in items:
+        product = item.product
+        price = item.price or (product.price if product else Decimal('0.00'))
+        lines.append({
+            'name': product.name if product else 'Removed product',
+            'quantity': item.quantity,
+            'size': item.size or '—',
+            'price': str(price),
+            'total': f'{price * item.quantity:.2f}',
+        })
+    return {
+        'order_id': order.pk,
+        'date': stamped.strftime('%d %b %Y - %I:%M %p'),
+        'customer': order.user.username,
+        'method': payment.method.upper() if payment else '',
+        'items': lines,
+        'subtotal': str(order.total_amount),
+        'delivery_fee': str(order.delivery_fee),
+        'total': str(order.final_total),
+    }
+
+
+def content_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def invoice_path(data, digest=None):
+    digest = digest or content_hash(data)
+    return Path(settings.MEDIA_ROOT) / 'invoices' / str(data['order_id']) / f'{digest}.pdf'
+
+
+def render(data, path):
+    """Build the invoice PDF for ``data`` at ``path``. Runs in a pool worker; touches no database."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    path = Path(path)
+    if path.exists():
+        return str(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    os.close(fd)
+
+    doc = SimpleDocTemplate(tmp, pagesize=letter)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=28,
+        textColor=colors.HexColor('#1a73e8'),
+        spaceAfter=6,
+        alignment=1  # Center
+    )
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=14,
+        textColor=colors.HexColor('#333333'),
+        spaceAfter=12,
+        spaceBefore=12
+    )
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontSize=11,
+        textColor=colors.HexColor('#333333')
+    )
+
+    # Store Name - Big and Bold
+    elements.append(Paragraph("<b>🏪 ELOSTORA STORE</b>", title_style))
+    elements.append(Spacer(1, 0.3*inch))
+
+    # Receipt Header
+    invoice_table = Table([
+        ['Receipt #', str(data['order_id'])],
+        ['Date & Time', data['date']],
+        ['Customer', data['customer']],
+        ['Payment Method', data['method']],
+        ['Status', '✓ COMPLETED'],
+    ], colWidths=[2*inch, 4*inch])
+    invoice_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+    ]))
+    elements.append(invoice_table)
+    elements.append(Spacer(1, 0.3*inch))
+
+    # Items
+    elements.append(Paragraph("<b>Order Items</b>", heading_style))
+    items_data = [['Product', 'Qty', 'Size', 'Price', 'Total']]
+    for item in data['items']:
+        items_data.append([
+            item['name'], str(item['quantity']), item['size'], f"${item['price']}", f"${item['total']}",
+        ])
+    items_table = Table(items_data, colWidths=[2.5*inch, 0.8*inch, 0.8*inch, 1*inch, 1*inch])
+    items_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1a73e8')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+        ('TOPPADDING', (0, 0), (-1, 0), 10),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f9f9f9')),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
+    ]))
+    elements.append(items_table)
+    elements.append(Spacer(1, 0.2*inch))
+
+    # Summary
+    summary_table = Table([
+        ['Subtotal:', f"${data['subtotal']}"],
+        ['Delivery Fee (5%):', f"${data['delivery_fee']}"],
+        ['', ''],
+        ['TOTAL:', f"${data['total']}"],
+    ], colWidths=[4*inch, 2*inch])
+    summary_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, 2), 'Helvetica'),
+        ('FONTNAME', (0, 3), (-1, 3), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 3), (-1, 3), 14),
+        ('BACKGROUND', (0, 3), (-1, 3), colors.HexColor('#1a73e8')),
+        ('TEXTCOLOR', (0, 3), (-1, 3), colors.white),
+        ('TOPPADDING', (0, 3), (-1, 3), 8),
+        ('BOTTOMPADDING', (0, 3), (-1, 3), 8),
+    ]))
+    elements.append(summary_table)
+    elements.append(Spacer(1, 0.3*inch))
+
+    # Footer
+    footer_text = "<i>Thank you for shopping with ELOSTORA STORE! We appreciate your business.</i>"
+    elements.append(Paragraph(footer_text, normal_style))
+
+    try:
+        doc.build(elements)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+    # Older versions of this order's invoice are unreachable now.
+    for stale in path.parent.glob('*.pdf'):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    return str(path)
+
+
+def _pool():
+    """The shared render pool, or ``None`` when ``INVOICE_RENDER_WORKERS`` is 0 (render inline)."""
+    global _executor
+    workers = getattr(settings, 'INVOICE_RENDER_WORKERS', DEFAULT_WORKERS)
+    if workers <= 0:
+        return None
+    with _lock:
+        if _executor is None:
+            # Spawned workers start clean instead of inheriting the server's
+            # threads and database connections; render() needs neither.
+            _executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _forget(path):
+    def done(future):
+        with _lock:
+            _pending.pop(path, None)
+        if future.exception() is not None:
+            logger.error('Invoice render failed for %s', path, exc_info=future.exception())
+    return done
+
+
+def _drop(key, future, exc):
+    """Forget a failed render so the next request starts another (in a new pool if this one broke)."""
+    global _executor
+    with _lock:
+        if future is not None and _pending.get(key) is future:
+            del _pending[key]
+        if isinstance(exc, BrokenProcessPool) and _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+def submit(data, path):
+    """Queue a render of ``data`` to ``path`` unless one is already running; returns its future."""
+    pool = _pool()
+    if pool is None:
+        render(data, path)
+        return None
+    key = str(path)
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _pending[key] = pool.submit(render, data, key)
+        else:
+            return future
+    future.add_done_callback(_forget(key))
+    return future
+
+
+def schedule(order):
+    """Render ``order``'s invoice in the background after the current transaction commits."""
+    from django.db import transaction
+
+    transaction.on_commit(lambda: schedule_orders([order.pk]))
+
+
+def schedule_orders(order_ids):
+    """Queue renders for the orders in ``order_ids`` whose current invoice is not on disk yet."""
+    from order_management.models import Order
+
+    for data in snapshots(Order.objects.filter(pk__in=order_ids)):
+        path = invoice_path(data)
+        if not path.exists():
+            submit(data, path)
+
+
+def get(order, wait=None):
+    """
+    Return ``(path, digest)`` for ``order``'s current invoice, rendering it if
+    needed. Waits at most ``wait`` seconds (``INVOICE_RENDER_WAIT``) for the
+    render; ``path`` is ``None`` if it is still running after that. Raises
+    ``RenderError`` if the render fails.
+    """
+    data = invoice_data(order)
+    digest = content_hash(data)
+    path = invoice_path(data, digest)
+    if path.exists():
+        return path, digest
+    future = None
+    try:
+        future = submit(data, path)
+        if future is not None:
+            if wait is None:
+                wait = getattr(settings, 'INVOICE_RENDER_WAIT', DEFAULT_WAIT)
+            future.result(timeout=wait)
+    except TimeoutError:
+        return None, digest
+    except Exception as exc:
+        logger.error('Invoice for order %s could not be rendered', order.pk, exc_info=True)
+        _drop(str(path), future, exc)
+        raise RenderError(f'Invoice for order {order.pk} could not be rendered') from exc
+    return path, digest
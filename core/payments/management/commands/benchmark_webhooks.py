@@ -0,0 +1,92 @@
+import json
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from order_management.models import Order
+from payments import webhooks
+from shop import reservations
+from shop.models import Product
+from shop.views import PaymentWebhook
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark payment webhook throughput: queueing through the view, draining "
+        "the inbox in batches, and the legacy apply-per-request handler. All rows "
+        "are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--webhooks", type=int, default=10000, help="Notifications to send.")
+        parser.add_argument("--retries", type=float, default=0.1, help="Share sent twice.")
+        parser.add_argument("--batch-size", type=int, default=webhooks.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = options["webhooks"]
+        with transaction.atomic():
+            payloads = self._load(count, options["retries"])
+            view = PaymentWebhook.as_view()
+            factory = RequestFactory()
+            bodies = [json.dumps(payload) for payload in payloads]
+
+            start = time.perf_counter()
+            for body in bodies:
+                view(factory.post("/shop/webhooks/payment/", body, content_type="application/json"))
+            ingest = time.perf_counter() - start
+
+            start = time.perf_counter()
+            applied = webhooks.drain(options["batch_size"])
+            drain = time.perf_counter() - start
+
+            # Same notifications through the old handler, against fresh reservations.
+            Order.objects.update(status="pending")
+            start = time.perf_counter()
+            for payload in payloads:
+                self._legacy(payload)
+            legacy = time.perf_counter() - start
+            transaction.set_rollback(True)
+
+        sent = len(payloads)
+        self.stdout.write(f"{'stage':<28} {'items':>8} {'seconds':>9} {'per second':>12}")
+        for label, items, seconds in (
+            ("queue (view + inbox)", sent, ingest),
+            (f"drain (batches of {options['batch_size']})", applied, drain),
+            ("queue + drain", sent, ingest + drain),
+            ("legacy per-request apply", sent, legacy),
+        ):
+            self.stdout.write(f"{label:<28} {items:>8} {seconds:>9.2f} {items / seconds:>12,.0f}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done ({sent - applied} retries deduplicated; benchmark data rolled back)."
+        ))
+
+    def _load(self, count, retries):
+        user = User.objects.create_user("webhook-benchmark")
+        product = Product.objects.create(name="Benchmark item", price=Decimal("10.00"), stock=count * 2)
+        orders = Order.objects.bulk_create(Order(user=user) for _ in range(count))
+        for order in orders:
+            reservations.reserve(order, [(product.pk, "", 1)])
+        statuses = ["successful"] * 8 + ["failed", "cancelled"]
+        payloads = [
+            {"order_id": order.pk, "status": statuses[i % len(statuses)], "amount": "10.50", "currency": "EGP"}
+            for i, order in enumerate(orders)
+        ]
+        step = int(1 / retries) if retries > 0 else 0
+        duplicates = payloads[::step] if step else []
+        return (payloads + duplicates)[:int(count * (1 + retries))]
+
+    @staticmethod
+    def _legacy(payload):
+        """The handler as it was: one lookup, save and stock update per notification."""
+        order = Order.objects.get(id=payload["order_id"])
+        order.status = payload["status"]
+        order.paid_amount = payload["amount"]
+        order.save()
+        if payload["status"] == "successful":
+            reservations.confirm(order)
+        elif payload["status"] in ("failed", "cancelled"):
+            reservations.release(order)
@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments import webhooks
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply queued payment gateway notifications in batches. Runs once until "
+        "the inbox is empty, or keeps polling with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=webhooks.DEFAULT_BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true", help="Keep polling for new notifications.")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds between polls when idle.")
+        parser.add_argument(
+            "--prune-days",
+            type=int,
+            default=None,
+            help="Also delete applied notifications and idempotency keys older than this many days.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+        if options["prune_days"] is not None:
+            inbox, keys = webhooks.prune(timezone.now() - timedelta(days=options["prune_days"]))
+            self.stdout.write(f"Pruned {inbox} inbox row(s) and {keys} idempotency key(s).")
+        while True:
+            start = time.perf_counter()
+            applied = webhooks.drain(batch_size)
+            if applied:
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"Applied {applied} notification(s) in {elapsed:.2f}s "
+                                  f"({applied / elapsed:,.0f}/s).")
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -4,7 +4,7 @@ Payment models for tracking payment methods and transaction status.
 Handles payment confirmation, method selection, and order completion
 workflow.
 """
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from order_management.models import Order
 
@@ -29,11 +29,71 @@ class Payment(models.Model):
 
     def confirm(self):
         """Mark payment as complete and update order status."""
-        self.is_paid = True
-        self.paid_at = timezone.now()
-        self.order.status = "paid"
-        self.order.save()
-        self.save()
+        from order_management.signals import lock_status
+        from shop import reservations
+        from . import invoices
+
+        with transaction.atomic():
+            # The status change feeds the sales rollups; starting from the
+            # status it had when loaded, a concurrent or repeated confirmation
+            # would be counted twice.
+            lock_status(self.order)
+            self.is_paid = True
+            self.paid_at = timezone.now()
+            self.order.status = "paid"
+            self.order.save()
+            self.save()
+            reservations.confirm(self.order)
+            invoices.schedule(self.order)
 
     def __str__(self):
         return f"Payment for Order #{self.order.id} - {self.get_method_display()}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A gateway notification that has already been accepted.
+
+    The unique ``key`` makes a retried webhook a no-op: the second insert
+    fails and the request is acknowledged without queueing anything.
+    """
+
+    key = models.CharField(max_length=128, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class WebhookInbox(models.Model):
+    """
+    A payment notification waiting to be applied.
+
+    The webhook only appends here; ``process_webhooks`` applies pending rows
+    in batches (see ``payments.webhooks``).
+    """
+
+    PENDING = "pending"
+    PROCESSED = "processed"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSED, "Processed"),
+        (FAILED, "Failed"),
+    ]
+
+    key = models.CharField(max_length=128)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.CharField(max_length=255, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "webhook inbox"
+        indexes = [
+            models.Index(fields=["status", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
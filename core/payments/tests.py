@@ -1,3 +1,211 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from order_management.models import Order, OrderItem
+from shop import reservations
+from shop.models import Product, StockReservation
+from . import invoices, webhooks
+from .models import Payment, WebhookInbox
+
+
+class InvoiceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('payer', password='pw')
+        product = Product.objects.create(name='Kettle', price=Decimal('20.00'), stock=5)
+        cls.order = Order.objects.create(
+            user=cls.user, total_amount=Decimal('40.00'),
+            delivery_fee=Decimal('2.00'), final_total=Decimal('42.00'),
+        )
+        cls.item = OrderItem.objects.create(order=cls.order, product=product, quantity=2, price=Decimal('20.00'))
+        Payment.objects.create(order=cls.order, method='cash')
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media, INVOICE_RENDER_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.login(username='payer', password='pw')
+        self.url = reverse('payments:invoice_pdf', args=[self.order.pk])
+
+    def test_rendered_once_and_revalidated(self):
+        response = self.client.get(self.url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        etag = response['ETag']
+
+        response = self.client.get(self.url, secure=True, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        path, _ = invoices.get(self.order)
+        size = path.stat().st_size
+        response = self.client.get(self.url, secure=True, headers={'Range': 'bytes=0-9'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{size}')
+        self.assertEqual(b''.join(response.streaming_content), path.read_bytes()[:10])
+
+        response = self.client.get(self.url, secure=True, headers={'Range': 'bytes=-5'})
+        self.assertEqual(b''.join(response.streaming_content), path.read_bytes()[-5:])
+
+        response = self.client.get(self.url, secure=True, headers={'Range': f'bytes={size}-'})
+        self.assertEqual(response.status_code, 416)
+
+    def test_changed_order_gets_a_new_file(self):
+        old, old_digest = invoices.get(self.order)
+        OrderItem.objects.filter(pk=self.item.pk).update(quantity=3)
+        self.order.recalc_totals()
+        new, new_digest = invoices.get(self.order)
+        self.assertNotEqual(old_digest, new_digest)
+        self.assertTrue(new.exists())
+        self.assertFalse(old.exists())
+
+    def test_confirming_payment_renders_the_invoice(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.payment.confirm()
+        path, _ = invoices.get(self.order)
+        self.assertTrue(path.exists())
+
+    def test_failed_render_asks_to_retry_later(self):
+        with mock.patch.object(invoices, 'render', side_effect=OSError('disk full')), \
+                self.assertLogs('payments.invoices', 'ERROR'):
+            response = self.client.get(self.url, secure=True)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.client.get(self.url, secure=True).status_code, 200)
+
+    def test_failed_background_render_is_dropped(self):
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        with mock.patch.object(invoices, '_pool', return_value=pool):
+            with mock.patch.object(invoices, 'render', side_effect=OSError('disk full')), \
+                    self.assertLogs('payments.invoices', 'ERROR'):
+                with self.assertRaises(invoices.RenderError):
+                    invoices.get(self.order, wait=5)
+            self.assertEqual(invoices._pending, {})
+            path, _ = invoices.get(self.order, wait=5)
+        self.assertTrue(path.exists())
+
+
+class WebhookTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('gateway')
+        cls.product = Product.objects.create(name='Fan', price=Decimal('30.00'), stock=10)
+
+    def setUp(self):
+        settings = override_settings(
+            INVOICE_RENDER_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp(), PAYMENT_WEBHOOK_SECRET='whsec',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, settings.options['MEDIA_ROOT'])
+
+    def order(self, quantity=2):
+        order = Order.objects.create(user=self.user)
+        reservations.reserve(order, [(self.product.pk, '', quantity)])
+        return order
+
+    def post(self, order_id, status='successful', body=None, **headers):
+        if body is None:
+            body = json.dumps({'order_id': order_id, 'status': status, 'amount': '63.00', 'currency': 'EGP'})
+        headers.setdefault('X-Signature', webhooks.signature(body.encode()))
+        return self.client.post(
+            reverse('shop:payment_webhook'), body, content_type='application/json', secure=True, headers=headers,
+        )
+
+    def test_retries_are_queued_once(self):
+        order = self.order()
+        for _ in range(3):
+            self.assertEqual(self.post(order.pk).status_code, 200)
+        self.post(order.pk, **{'Idempotency-Key': 'evt_1'})
+        self.post(order.pk, **{'Idempotency-Key': 'evt_1'})
+        self.assertEqual(WebhookInbox.objects.count(), 2)
+
+    def test_invalid_payload(self):
+        self.assertEqual(self.post(None, body='{"order_id": 1').status_code, 400)
+        self.assertFalse(WebhookInbox.objects.exists())
+
+    def test_bad_signature_is_refused(self):
+        order = self.order()
+        body = json.dumps({'order_id': order.pk, 'status': 'successful', 'amount': '63.00', 'currency': 'EGP'})
+        forged = webhooks.signature(body.encode(), secret='guess')
+        self.assertEqual(self.post(order.pk, body=body, **{'X-Signature': forged}).status_code, 403)
+        self.assertEqual(self.post(order.pk, body=body, **{'X-Signature': ''}).status_code, 403)
+        signed = webhooks.signature(body.encode())
+        tampered = body.replace('63.00', '0.01')
+        self.assertEqual(self.post(order.pk, body=tampered, **{'X-Signature': signed}).status_code, 403)
+        with override_settings(PAYMENT_WEBHOOK_SECRET=''):
+            unkeyed = webhooks.signature(body.encode(), secret='')
+            self.assertEqual(self.post(order.pk, body=body, **{'X-Signature': unkeyed}).status_code, 403)
+        self.assertFalse(WebhookInbox.objects.exists())
+        self.assertEqual(self.post(order.pk, body=body, **{'X-Signature': f'sha256={signed}'}).status_code, 200)
+
+    def test_unknown_status_is_refused(self):
+        order = self.order()
+        self.assertEqual(self.post(order.pk, 'refunded').status_code, 400)
+        self.assertFalse(WebhookInbox.objects.exists())
+        # Rows queued before statuses were checked fail instead of reaching the order.
+        payload = {'order_id': order.pk, 'status': 'x' * 40, 'amount': '1', 'currency': 'EGP'}
+        webhooks.ingest(payload, 'old')
+        self.post(order.pk, 'successful')
+        webhooks.process_batch()
+        self.assertEqual(WebhookInbox.objects.get(key='old').error, 'Unknown status')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'successful')
+
+    def test_drain_applies_in_batches(self):
+        paid = [self.order() for _ in range(3)]
+        failed = self.order()
+        for order in paid:
+            self.post(order.pk)
+        self.post(failed.pk, 'failed')
+        self.post(999999)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(webhooks.drain(batch_size=10), 5)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 4)
+        self.assertEqual(
+            set(Order.objects.values_list('status', flat=True)), {'successful', 'failed'}
+        )
+        self.assertEqual(Order.objects.get(pk=paid[0].pk).paid_amount, Decimal('63.00'))
+        self.assertEqual(
+            StockReservation.objects.filter(status=StockReservation.CONFIRMED).count(), 3
+        )
+        self.assertEqual(WebhookInbox.objects.get(status=WebhookInbox.FAILED).error, 'Unknown order')
+        self.assertEqual(WebhookInbox.objects.filter(status=WebhookInbox.PENDING).count(), 0)
+
+    def test_raw_sql_runs_on_the_routed_database(self):
+        order = self.order()
+        self.post(order.pk)
+        routed = mock.Mock(**{'db_for_write.return_value': 'payments'})
+        with mock.patch.object(webhooks, 'router', routed), \
+                mock.patch.object(webhooks, 'connections', {'payments': connection}):
+            webhooks.process_batch()
+        routed.db_for_write.assert_any_call(WebhookInbox)
+        routed.db_for_write.assert_any_call(Order)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'successful')
+
+    def test_batch_cost_does_not_grow_with_batch(self):
+        for order in [self.order(1) for _ in range(8)]:
+            self.post(order.pk, 'cancelled')
+        with self.assertNumQueries(11):  # 7 statements plus 2 savepoints, whatever the batch size
+            webhooks.process_batch(batch_size=8)
@@ -1,11 +1,15 @@
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, FileResponse
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from order_management.models import Order
-from .models import Payment
-from reportlab.pdfgen import canvas
+from shop import reservations
+from . import invoices
 import os
+import re
+
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+
 
 @login_required
 def countdown(request, order_id):
@@ -66,6 +70,7 @@ def cancel_order(request, order_id):
 
     order.status = 'cancelled'
     order.save()
+    reservations.release(order)
     # remove related payment record if it exists
     try:
         if hasattr(order, 'payment') and order.payment:
@@ -76,147 +81,84 @@ def cancel_order(request, order_id):
     messages.success(request, 'Pending order cancelled. You can now place a new order.')
     return redirect('shop:view_cart')
 
-    
 
-@login_required
-def invoice_pdf(request, order_id):
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib import colors
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from datetime import datetime, timedelta, timezone
-    
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-    
-    # Get current time in Cairo timezone (UTC+2)
-    current_utc = datetime.now(timezone.utc)
-    order_date = current_utc + timedelta(hours=2)
-    
-    file_name = f"receipt_{order.id}.pdf"
-    file_path = os.path.join('media', 'invoices', file_name)
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-    # Create PDF
-    doc = SimpleDocTemplate(file_path, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=28,
-        textColor=colors.HexColor('#1a73e8'),
-        spaceAfter=6,
-        alignment=1  # Center
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#333333'),
-        spaceAfter=12,
-        spaceBefore=12
+def _file_response(request, path, etag, filename, content_type):
+    """
+    Serve ``path`` with a strong ``ETag``, answering ``If-None-Match`` with
+    304 and a single ``Range: bytes=`` request with 206 (or 416).
+    """
+    size = os.path.getsize(path)
+    quoted = f'"{etag}"'
+    if request.headers.get('If-None-Match') in (quoted, '*'):
+        response = HttpResponseNotModified()
+        response['ETag'] = quoted
+        return response
+
+    start, end = 0, size - 1
+    partial = False
+    match = _RANGE.fullmatch(request.headers.get('Range', '').strip())
+    if_range = request.headers.get('If-Range')
+    if match and any(match.groups()) and if_range in (None, quoted):
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            start = max(0, size - int(last))
+        if start > end or start >= size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        partial = True
+
+    handle = open(path, 'rb')
+    handle.seek(start)
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        _read(handle, length), status=206 if partial else 200, content_type=content_type
     )
-    
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.HexColor('#333333')
-    )
-    
-    # Store Name - Big and Bold
-    store_name = Paragraph("<b>🏪 ELOSTORA STORE</b>", title_style)
-    elements.append(store_name)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Receipt Header
-    invoice_data = [
-        ['Receipt #', str(order.id)],
-        ['Date & Time', order_date.strftime('%d %b %Y - %I:%M %p')],
-        ['Customer', request.user.username],
-        ['Payment Method', order.payment.method.upper()],
-        ['Status', '✓ COMPLETED'],
-    ]
-    
-    invoice_table = Table(invoice_data, colWidths=[2*inch, 4*inch])
-    invoice_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-    ]))
-    elements.append(invoice_table)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Items Header
-    elements.append(Paragraph("<b>Order Items</b>", heading_style))
-    
-    # Items Table
-    items_data = [['Product', 'Qty', 'Size', 'Price', 'Total']]
-    
-    for item in order.items.all():
-        items_data.append([
-            item.product.name,
-            str(item.quantity),
-            item.size if hasattr(item, 'size') else '—',
-            f'${item.product.price}',
-            f'${float(item.product.price * item.quantity):.2f}'
-        ])
-    
-    items_table = Table(items_data, colWidths=[2.5*inch, 0.8*inch, 0.8*inch, 1*inch, 1*inch])
-    items_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1a73e8')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-        ('TOPPADDING', (0, 0), (-1, 0), 10),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f9f9f9')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
-    ]))
-    elements.append(items_table)
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Summary
-    summary_data = [
-        ['Subtotal:', f'${order.total_amount}'],
-        ['Delivery Fee (5%):', f'${order.delivery_fee}'],
-        ['', ''],
-        ['TOTAL:', f'${order.final_total}'],
-    ]
-    
-    summary_table = Table(summary_data, colWidths=[4*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, 2), 'Helvetica'),
-        ('FONTNAME', (0, 3), (-1, 3), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 3), (-1, 3), 14),
-        ('BACKGROUND', (0, 3), (-1, 3), colors.HexColor('#1a73e8')),
-        ('TEXTCOLOR', (0, 3), (-1, 3), colors.white),
-        ('TOPPADDING', (0, 3), (-1, 3), 8),
-        ('BOTTOMPADDING', (0, 3), (-1, 3), 8),
-    ]))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Footer
-    footer_text = "<i>Thank you for shopping with ELOSTORA STORE! We appreciate your business.</i>"
-    elements.append(Paragraph(footer_text, normal_style))
-    
-    # Build PDF
-    doc.build(elements)
+    response['Content-Length'] = str(length)
+    if partial:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = quoted
+    response['Cache-Control'] = 'private, max-age=3600'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _read(handle, length, chunk_size=64 * 1024):
+    with handle:
+        while length > 0:
+            chunk = handle.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
 
-    return FileResponse(open(file_path, 'rb'), content_type='application/pdf', as_attachment=True, filename=file_name)
 
+@login_required
+def invoice_pdf(request, order_id):
+    """
+    Download the order's invoice. The PDF is normally rendered in the
+    background when the payment is confirmed; if it is not on disk yet the
+    render is started and the client is asked to retry shortly.
+    """
+    order = get_object_or_404(Order, id=order_id, user=request.user)
+    try:
+        path, digest = invoices.get(order)
+    except invoices.RenderError:
+        response = HttpResponse(
+            'Your invoice could not be generated right now. Please try again later.',
+            status=503, content_type='text/plain',
+        )
+        response['Retry-After'] = '30'
+        return response
+    if path is None:
+        response = HttpResponse(
+            'Your invoice is being prepared. Please try again in a moment.',
+            status=202, content_type='text/plain',
+        )
+        response['Retry-After'] = '2'
+        return response
+    return _file_response(request, path, digest, f'receipt_{order.id}.pdf', 'application/pdf')
@@ -0,0 +1,236 @@
+"""
+Payment gateway webhook ingestion.
+
+The gateway signs each body with ``PAYMENT_WEBHOOK_SECRET``
+(``verify_signature()``); unsigned or mis-signed notifications, and ones
+with a status we do not know, are refused before anything is stored.
+
+Gateways retry notifications they do not see acknowledged quickly, and
+they send them in bursts. The webhook therefore does the least it can:
+
+``ingest()`` records the notification's idempotency key and appends the
+payload to ``WebhookInbox`` in one short transaction. A key that was seen
+before (a retry) is acknowledged without queueing anything.
+
+``process_batch()`` (run by ``manage.py process_webhooks``) applies pending
+notifications in batches, with a fixed number of statements per batch
+however many it holds:
+
+* the orders are loaded (and locked) with one query and their status and
+  paid amount written back with one UPDATE;
+* stock held for successfully paid orders is confirmed with one UPDATE,
+  and stock for failed or cancelled ones is put back with grouped ``F()``
+  UPDATEs (``shop.reservations.release_orders``);
+* the inbox rows are marked processed with one UPDATE per outcome;
+* ``order_management.signals.status_changed`` is sent once for the orders
+  whose status changed, since the UPDATE sends no ``post_save``.
+
+When an order receives several notifications in one batch, the latest wins.
+"""
+import hashlib
+import hmac
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey, WebhookInbox
+
+REQUIRED_FIELDS = ('order_id', 'status', 'amount', 'currency')
+DEFAULT_BATCH_SIZE = 500
+
+SUCCESSFUL = 'successful'
+RELEASING = ('failed', 'cancelled')
+SIGNATURE_HEADER = 'X-Signature'
+
+
+class InvalidPayload(ValueError):
+    pass
+
+
+def statuses():
+    """Statuses a notification may set: the gateway's own and the order statuses."""
+    from order_management.models import Order
+
+    return {SUCCESSFUL, *RELEASING, *(value for value, _ in Order.STATUS_CHOICES)}
+
+
+def signature(body, secret=None):
+    """Hex HMAC-SHA256 of ``body`` under ``secret`` (default ``PAYMENT_WEBHOOK_SECRET``)."""
+    if secret is None:
+        secret = getattr(settings, 'PAYMENT_WEBHOOK_SECRET', '')
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body, header):
+    """Whether ``header`` (optionally ``sha256=``-prefixed) signs ``body``; always false without a secret."""
+    secret = getattr(settings, 'PAYMENT_WEBHOOK_SECRET', '')
+    if not secret or not header:
+        return False
+    header = header.removeprefix('sha256=')
+    return hmac.compare_digest(signature(body, secret), header)
+
+
+def parse(body):
+    """Decode and validate a webhook body; raises ``InvalidPayload``."""
+    try:
+        payload = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise InvalidPayload('Body is not valid JSON') from exc
+    if not isinstance(payload, dict) or not all(field in payload for field in REQUIRED_FIELDS):
+        raise InvalidPayload(f'Payload must contain {", ".join(REQUIRED_FIELDS)}')
+    try:
+        Decimal(str(payload['amount']))
+    except InvalidOperation as exc:
+        raise InvalidPayload('Amount is not a number') from exc
+    if str(payload['status']) not in statuses():
+        raise InvalidPayload('Unknown status')
+    return payload
+
+
+def idempotency_key(payload, header=None):
+    """
+    The gateway's ``Idempotency-Key`` header or event ``id`` when it sends
+    one, otherwise a hash of the fields that make a notification distinct.
+    """
+    key = header or payload.get('event_id') or payload.get('id')
+    if key:
+        return str(key)[:128]
+    fields = {field: str(payload[field]) for field in REQUIRED_FIELDS}
+    return 'sha256:' + hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+def ingest(payload, key):
+    """Queue ``payload`` unless ``key`` was already seen; returns whether it was queued."""
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(key=key)
+            WebhookInbox.objects.create(key=key, payload=payload)
+    except IntegrityError:
+        return False
+    return True
+
+
+def process_batch(batch_size=DEFAULT_BATCH_SIZE):
+    """Apply up to ``batch_size`` pending notifications in one transaction; returns how many."""
+    from order_management.models import Order
+    from order_management.signals import status_changed
+    from shop import reservations
+    from . import invoices
+
+    with transaction.atomic():
+        pending = WebhookInbox.objects.filter(status=WebhookInbox.PENDING).order_by('pk')
+        if connections[router.db_for_write(WebhookInbox)].features.has_select_for_update_skip_locked:
+            # Several workers can drain the inbox side by side.
+            pending = pending.select_for_update(skip_locked=True)
+        rows = list(pending.values_list('pk', 'payload')[:batch_size])
+        if not rows:
+            return 0
+
+        known = statuses()
+        errors = {}  # {inbox pk: error}
+        latest = {}
+        for pk, payload in rows:
+            if str(payload.get('status')) not in known:
+                # Queued before statuses were checked on the way in.
+                errors[pk] = 'Unknown status'
+                continue
+            latest[_order_id(payload)] = payload
+        # Locked, so a concurrent batch or confirmation cannot move the status
+        # between this read and the UPDATE below (``previous`` feeds the rollups).
+        orders = Order.objects.select_for_update().in_bulk(
+            [order_id for order_id in latest if order_id is not None]
+        )
+
+        changed, paid, released, changes = [], [], [], []
+        for order_id, payload in latest.items():
+            order = orders.get(order_id)
+            if order is None:
+                continue
+            previous = order.status
+            order.status = str(payload['status'])
+            if order.status != previous:
+                changes.append((order, previous))
+            order.paid_amount = Decimal(str(payload['amount']))
+            changed.append(order)
+            if order.status == SUCCESSFUL:
+                paid.append(order_id)
+            elif order.status in RELEASING:
+                released.append(order_id)
+
+        if changed:
+            _update_by_pk(Order, changed, ['status', 'paid_amount'])
+        if changes:
+            status_changed.send(sender=Order, changes=changes)
+        if paid:
+            reservations.confirm_orders(paid)
+        if released:
+            reservations.release_orders(released)
+
+        now = timezone.now()
+        for pk, payload in rows:
+            if pk not in errors and _order_id(payload) not in orders:
+                errors[pk] = 'Unknown order'
+        WebhookInbox.objects.filter(pk__in=[pk for pk, _ in rows]).exclude(pk__in=errors).update(
+            status=WebhookInbox.PROCESSED, processed_at=now
+        )
+        for error in set(errors.values()):
+            WebhookInbox.objects.filter(pk__in=[pk for pk, e in errors.items() if e == error]).update(
+                status=WebhookInbox.FAILED, processed_at=now, error=error
+            )
+        if paid:
+            transaction.on_commit(lambda: invoices.schedule_orders(paid))
+    return len(rows)
+
+
+def drain(batch_size=DEFAULT_BATCH_SIZE):
+    """Process batches until the inbox is empty; returns the number of notifications applied."""
+    total = 0
+    while True:
+        done = process_batch(batch_size)
+        if not done:
+            return total
+        total += done
+
+
+def prune(before):
+    """Delete processed inbox rows and idempotency keys older than ``before``."""
+    inbox, _ = WebhookInbox.objects.filter(received_at__lt=before).exclude(status=WebhookInbox.PENDING).delete()
+    keys, _ = IdempotencyKey.objects.filter(created_at__lt=before).delete()
+    return inbox, keys
+
+
+def _update_by_pk(model, objs, fields):
+    """
+    Write ``fields`` of ``objs`` back in one ``UPDATE ... SET f = CASE id WHEN ...``.
+    ``bulk_update()`` builds the same statement, but resolving a ``When``
+    expression per row and field costs more than the update itself.
+    Runs on the database the router writes ``model`` to.
+    """
+    connection = connections[router.db_for_write(model)]
+    qn = connection.ops.quote_name
+    pk = qn(model._meta.pk.column)
+    assignments, params = [], []
+    for name in fields:
+        field = model._meta.get_field(name)
+        cases = []
+        for obj in objs:
+            cases.append('WHEN %s THEN %s')
+            params += [obj.pk, field.get_db_prep_save(getattr(obj, field.attname), connection)]
+        assignments.append(f'{qn(field.column)} = CASE {pk} {" ".join(cases)} ELSE {qn(field.column)} END')
+    params += [obj.pk for obj in objs]
+    sql = (
+        f'UPDATE {qn(model._meta.db_table)} SET {", ".join(assignments)} '
+        f'WHERE {pk} IN ({", ".join(["%s"] * len(objs))})'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _order_id(payload):
+    try:
+        return int(payload['order_id'])
+    except (TypeError, ValueError):
+        return None
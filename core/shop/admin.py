@@ -4,7 +4,7 @@ Django admin configuration for shop models.
 Customizes the admin interface for managing products, categories, and cart items.
 """
 from django.contrib import admin
-from .models import Category, Subcategory, Product, ProductSize, Cart, CartItem
+from .models import Category, Subcategory, Product, ProductSize, Cart, CartItem, StockReservation
 
 
 @admin.register(Category)
@@ -112,3 +112,14 @@ class CartItemAdmin(admin.ModelAdmin):
 
     get_subtotal.short_description = "Subtotal"
 
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    """Admin interface for stock held by pending orders."""
+
+    list_display = ["order", "product", "size", "quantity", "status", "expires_at"]
+    list_filter = ["status"]
+    search_fields = ["product__name", "order__id"]
+    raw_id_fields = ["order", "product"]
+    ordering = ["-created_at"]
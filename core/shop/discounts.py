@@ -0,0 +1,100 @@
+"""
+Process-wide index of live event discounts per category.
+
+Product and category discount accessors read from this map instead of
+querying ``Event`` for every product, so rendering a page of products costs
+a single query per TTL window. The map is dropped whenever an event or its
+category links change (see ``shop.signals``) and rebuilt on next access.
+"""
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.utils import timezone
+
+DEFAULT_TTL = 60  # seconds
+
+_lock = threading.Lock()
+_state = {"map": None, "expires": 0.0}
+
+
+def _build():
+    """Return ``({category_id: (percentage, event)}, seconds_valid)``."""
+    from events.models import Event
+
+    ttl = getattr(settings, "ACTIVE_DISCOUNT_TTL", DEFAULT_TTL)
+    now = timezone.now()
+    links = (
+        Event.categories.through.objects.filter(
+            event__is_active=True,
+            event__status="live",
+        )
+        .select_related("event")
+        .order_by("category_id", "-event__discount_percentage", "event__event_date")
+    )
+
+    discounts = {}
+    for link in links:
+        event = link.event
+        if event.event_date > now:
+            # Scheduled but not started: rebuild as soon as it goes live.
+            ttl = min(ttl, max(1, (event.event_date - now).total_seconds()))
+            continue
+        if link.category_id not in discounts:
+            discounts[link.category_id] = (event.discount_percentage, event)
+    return discounts, ttl
+
+
+def active_discounts():
+    """Return the cached ``{category_id: (percentage, event)}`` map."""
+    discounts = _state["map"]
+    if discounts is not None and time.monotonic() < _state["expires"]:
+        return discounts
+    with _lock:
+        if _state["map"] is None or time.monotonic() >= _state["expires"]:
+            discounts, ttl = _build()
+            _state["map"] = discounts
+            _state["expires"] = time.monotonic() + ttl
+        return _state["map"]
+
+
+def discount_for_category(category_id):
+    """Return ``(percentage, event)`` for a category id, or ``(0, None)``."""
+    if not category_id:
+        return 0, None
+    return active_discounts().get(category_id, (0, None))
+
+
+def attach_events(products):
+    """
+    Give each product annotated by ``with_discounts()`` the event it was
+    priced from, taken from the map or, for events it lacks (a stale map),
+    loaded in one query.
+    """
+    from events.models import Event
+
+    wanted = {p.discount_event_id for p in products if getattr(p, "discount_event_id", None)}
+    events = {}
+    if wanted:
+        events = {event.pk: event for _, event in active_discounts().values() if event.pk in wanted}
+        missing = wanted - events.keys()
+        if missing:
+            events.update(Event.objects.in_bulk(missing))
+    for product in products:
+        product._discount_event_cache = events.get(getattr(product, "discount_event_id", None))
+
+
+def apply_discount(price, percentage):
+    """Return ``price`` reduced by ``percentage`` percent, rounded to cents."""
+    if not percentage:
+        return price
+    discounted = price * (Decimal(100) - Decimal(percentage)) / Decimal(100)
+    return discounted.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def invalidate():
+    """Drop the map so the next access rebuilds it."""
+    with _lock:
+        _state["map"] = None
+        _state["expires"] = 0.0
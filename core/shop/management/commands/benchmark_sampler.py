@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.models import Product
+from shop.sampling import ProductSampler, random_products
+
+
+class Command(BaseCommand):
+    help = "Benchmark random product sampling latency across catalog sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="1000,10000,100000,1000000",
+            help="Comma-separated pool sizes to benchmark (default: 1k..1M).",
+        )
+        parser.add_argument("--count", type=int, default=48, help="Products per sample.")
+        parser.add_argument("--categories", type=int, default=40, help="Synthetic category count.")
+        parser.add_argument("--repeat", type=int, default=2000, help="Samples per size.")
+        parser.add_argument(
+            "--with-db",
+            action="store_true",
+            help="Also time sampler + id__in fetch vs ORDER BY RANDOM() on the configured database.",
+        )
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        repeat = options["repeat"]
+        categories = options["categories"]
+
+        self.stdout.write(self.style.NOTICE(
+            f"Sampling {count} ids, {repeat} runs per size, {categories} categories"
+        ))
+        self.stdout.write(f"{'products':>10}  {'flat p50':>10}  {'flat p99':>10}  {'strat p50':>10}  {'strat p99':>10}")
+        for size in (int(s) for s in options["sizes"].split(",") if s.strip()):
+            pool = ProductSampler(refresh_interval=float("inf"))
+            pool.load((i, i % categories) for i in range(1, size + 1))
+            flat = self._time(lambda: pool.sample(count), repeat)
+            strat = self._time(lambda: pool.sample(count, stratify=True), repeat)
+            self.stdout.write(
+                f"{size:>10}  {flat[0]:>8.1f}us  {flat[1]:>8.1f}us  {strat[0]:>8.1f}us  {strat[1]:>8.1f}us"
+            )
+
+        if options["with_db"]:
+            total = Product.objects.count()
+            runs = max(1, min(repeat, 200))
+            sampled = self._time(lambda: random_products(count), runs)
+            ordered = self._time(lambda: list(Product.objects.order_by("?")[:count]), runs)
+            self.stdout.write(self.style.NOTICE(f"Database ({total} products, {runs} runs):"))
+            self.stdout.write(f"  sampler + id__in   p50 {sampled[0]:>10.1f}us  p99 {sampled[1]:>10.1f}us")
+            self.stdout.write(f"  ORDER BY RANDOM()  p50 {ordered[0]:>10.1f}us  p99 {ordered[1]:>10.1f}us")
+
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    @staticmethod
+    def _time(fn, repeat):
+        """Return (p50, p99) wall time of ``fn`` in microseconds."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1e6)
+        timings.sort()
+        return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
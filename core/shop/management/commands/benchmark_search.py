@@ -0,0 +1,94 @@
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core import serializers
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop import search
+from shop.models import Product
+
+FIXTURES = Path(settings.BASE_DIR) / "shop" / "fixtures"
+DEFAULT_QUERIES = "echo,wireless headphones,kitchen,samsung galaxy,laptop stand,zzzz"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark indexed product search against the legacy icontains scan on the "
+        "products.json fixture scaled up N times. All rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=int, default=100, help="Copies of products.json to load.")
+        parser.add_argument("--queries", default=DEFAULT_QUERIES, help="Comma-separated search terms.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query.")
+
+    def handle(self, *args, **options):
+        if search.search_backend() is None:
+            self.stdout.write(self.style.WARNING("No search index on this database; nothing to compare."))
+            return
+
+        queries = [q.strip() for q in options["queries"].split(",") if q.strip()]
+        with transaction.atomic():
+            self._load(options["scale"])
+            self.stdout.write(f"{'query':<22} {'matches':>9} {'indexed p50':>13} {'icontains p50':>15}")
+            for query in queries:
+                page = search.search_products(query)
+                indexed = self._time(lambda: search.search_products(query), options["repeat"])
+                legacy = self._time(lambda: self._legacy(query), options["repeat"])
+                self.stdout.write(f"{query:<22} {page.total:>9} {indexed:>10.1f}ms {legacy:>12.1f}ms")
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Done (benchmark data rolled back)."))
+
+    def _load(self, scale):
+        with open(FIXTURES / "shop_data.json") as fh:
+            for obj in serializers.deserialize("json", fh.read()):
+                if obj.object._meta.model_name in ("category", "subcategory"):
+                    obj.save()
+        with open(FIXTURES / "products.json") as fh:
+            rows = [row["fields"] for row in json.load(fh) if row["model"] == "shop.product"]
+
+        start = time.perf_counter()
+        batch = []
+        for copy in range(scale):
+            for fields in rows:
+                batch.append(Product(
+                    name=fields["name"] if copy == 0 else f"{fields['name']} {copy}",
+                    category_ref_id=fields["category_ref"],
+                    subcategory_id=fields["subcategory"],
+                    short_description=fields["short_description"],
+                    description=fields["description"],
+                    price=fields["price"],
+                    stock=fields["stock"],
+                ))
+                if len(batch) >= 5000:
+                    Product.objects.bulk_create(batch)
+                    batch = []
+        Product.objects.bulk_create(batch)
+        loaded = time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.NOTICE(
+            f"Loaded {len(rows) * scale} products in {loaded:.1f}s; "
+            f"indexed {indexed} in {time.perf_counter() - start:.1f}s"
+        ))
+
+    @staticmethod
+    def _legacy(query):
+        """The pre-index global_search: icontains ORs, distinct, count, then evaluate."""
+        products = Product.objects.filter(search.fallback_filter(query)).distinct()
+        products.count()
+        return list(products[:24])
+
+    @staticmethod
+    def _time(fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from shop import reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancel pending orders whose stock reservations have expired and put the "
+        "stock back. Run every minute or so from cron."
+    )
+
+    def handle(self, *args, **options):
+        released = reservations.release_expired()
+        self.stdout.write(self.style.SUCCESS(f"Released stock for {released} expired order(s)."))
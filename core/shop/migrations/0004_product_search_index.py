@@ -0,0 +1,72 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+SOURCE_SQL = """
+    SELECT p.id,
+           COALESCE(p.name, ''),
+           TRIM(COALESCE(c.name, '') || ' ' || COALESCE(s.name, '') || ' ' || COALESCE(p.category, '')),
+           COALESCE(p.description, '')
+      FROM shop_product p
+      LEFT JOIN shop_category c ON c.id = p.category_ref_id
+      LEFT JOIN shop_subcategory s ON s.id = p.subcategory_id
+"""
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE shop_product_fts USING fts5("
+                    "name, category, description, tokenize = 'unicode61 remove_diacritics 2')"
+                )
+            except OperationalError:
+                # SQLite built without FTS5: search falls back to icontains.
+                return
+            cursor.execute(
+                f"INSERT INTO shop_product_fts (rowid, name, category, description) {SOURCE_SQL}"
+            )
+        elif connection.vendor == 'postgresql':
+            # No foreign key: rows are removed by the post_delete signal, like
+            # the FTS5 table, and one would make TRUNCATE shop_product (test
+            # flushes) fail.
+            cursor.execute(
+                "CREATE TABLE shop_product_search ("
+                " product_id bigint PRIMARY KEY,"
+                " document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                "CREATE INDEX shop_product_search_document_gin"
+                " ON shop_product_search USING GIN (document)"
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO shop_product_search (product_id, document)
+                SELECT src.id,
+                       setweight(to_tsvector('simple', src.name), 'A')
+                       || setweight(to_tsvector('simple', src.category), 'B')
+                       || setweight(to_tsvector('simple', src.description), 'C')
+                  FROM ({SOURCE_SQL}) AS src (id, name, category, description)
+                """
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("DROP TABLE IF EXISTS shop_product_fts")
+        elif connection.vendor == 'postgresql':
+            cursor.execute("DROP TABLE IF EXISTS shop_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_alter_cart_options_alter_cartitem_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
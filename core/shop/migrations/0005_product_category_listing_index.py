@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_ref', 'subcategory', '-created_at'], name='shop_product_cat_sub_new_idx'),
+        ),
+    ]
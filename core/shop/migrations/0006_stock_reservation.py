@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order_management', '0006_alter_order_options_alter_orderitem_options_and_more'),
+        ('shop', '0005_product_category_listing_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(blank=True, help_text='Empty for products without sizes', max_length=5)),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('held', 'Held'), ('confirmed', 'Confirmed'), ('released', 'Released')], default='held', max_length=10)),
+                ('expires_at', models.DateTimeField(help_text='Released automatically after this if still held')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='order_management.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='shop.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='shop_stockr_status_84d08f_idx')],
+            },
+        ),
+    ]
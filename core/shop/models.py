@@ -4,8 +4,13 @@ Shop models for product catalog, inventory, and cart management.
 This module defines models for product categories, product details, sizing,
 and shopping cart functionality.
 """
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Round
 from django.conf import settings
+from django.utils import timezone
 from django.utils.text import slugify
 
 # Size options for apparel products
@@ -45,21 +50,9 @@ class Category(models.Model):
         Get the highest active discount event for this category.
         Returns tuple: (discount_percentage, event) or (0, None)
         """
-        from events.models import Event
-        from django.utils import timezone
-        
-        active_events = Event.objects.filter(
-            is_active=True,
-            status='live',
-            categories=self,
-            event_date__lte=timezone.now()
-        ).order_by('-discount_percentage')
-        
-        if active_events.exists():
-            event = active_events.first()
-            return event.discount_percentage, event
-        
-        return 0, None
+        from .discounts import discount_for_category
+
+        return discount_for_category(self.pk)
     
     def has_active_discount(self):
         """Check if category has an active discount."""
@@ -101,6 +94,57 @@ class Subcategory(models.Model):
         return f"{self.category.name} - {self.name}"
 
 
+class ProductQuerySet(models.QuerySet):
+    """Query helpers for product listings."""
+
+    _attach_discount_events = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._attach_discount_events = self._attach_discount_events
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        if self._attach_discount_events and not fetched:
+            from .discounts import attach_events
+
+            attach_events([row for row in self._result_cache if isinstance(row, Product)])
+
+    def with_discounts(self):
+        """
+        Annotate each product with its best live event discount.
+
+        Adds ``event_discount`` (percentage, 0 when none), ``discount_event_id``
+        and ``discounted_price`` using correlated subqueries over the
+        event/category link table, so listing pages price every row in the
+        same query that fetches it. The events themselves are attached to
+        the fetched products together (``shop.discounts.attach_events``).
+        """
+        from events.models import Event
+
+        # Same order as shop.discounts, so both pick the same event.
+        best = Event.categories.through.objects.filter(
+            category_id=OuterRef('category_ref_id'),
+            event__is_active=True,
+            event__status='live',
+            event__event_date__lte=timezone.now(),
+        ).order_by('-event__discount_percentage', 'event__event_date', 'event_id')
+
+        queryset = self.annotate(
+            event_discount=Coalesce(Subquery(best.values('event__discount_percentage')[:1]), Value(0)),
+            discount_event_id=Subquery(best.values('event_id')[:1]),
+            discounted_price=Round(
+                F('price') * (Value(100) - F('event_discount')) * Value(Decimal('0.01')),
+                2,
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+        )
+        queryset._attach_discount_events = True
+        return queryset
+
+
 class Product(models.Model):
     """Product catalog with pricing, inventory, and category links."""
 
@@ -140,8 +184,17 @@ class Product(models.Model):
     image = models.URLField(max_length=500, blank=True, null=True, help_text="Product image URL")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Category pages: filter by category (and subcategory), newest first.
+            models.Index(
+                fields=["category_ref", "subcategory", "-created_at"],
+                name="shop_product_cat_sub_new_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -151,39 +204,35 @@ class Product(models.Model):
         Get the highest active event discount for this product's category.
         Returns tuple: (discount_percentage, event) or (0, None)
         """
-        if not self.category_ref:
-            return 0, None
-        
-        from events.models import Event
-        from django.utils import timezone
-        
-        # Get active events that include this product's category
-        active_events = Event.objects.filter(
-            is_active=True,
-            status='live',
-            categories=self.category_ref,
-            event_date__lte=timezone.now()
-        ).order_by('-discount_percentage')
-        
-        if active_events.exists():
-            event = active_events.first()
-            return event.discount_percentage, event
-        
-        return 0, None
+        from .discounts import discount_for_category
+
+        if hasattr(self, 'event_discount'):
+            # Annotated by with_discounts(): the percentage and the event both
+            # come from the annotations; the queryset attached the event.
+            if not self.event_discount:
+                return 0, None
+            return self.event_discount, self._discount_event()
+        return discount_for_category(self.category_ref_id)
+
+    def _discount_event(self):
+        # Only products fetched some other way (e.g. annotated by hand) load it here.
+        if not hasattr(self, '_discount_event_cache'):
+            from events.models import Event
+
+            self._discount_event_cache = Event.objects.filter(pk=self.discount_event_id).first()
+        return self._discount_event_cache
     
     def get_discounted_price(self):
         """
         Calculate the discounted price if an active event applies to this product.
         Returns the discounted price or original price if no discount.
         """
-        discount_percentage, event = self.get_active_event_discount()
-        
-        if discount_percentage > 0:
-            from decimal import Decimal
-            discount_amount = self.price * Decimal(discount_percentage / 100)
-            return self.price - discount_amount
-        
-        return self.price
+        from .discounts import apply_discount
+
+        if getattr(self, 'discounted_price', None) is not None:
+            return self.discounted_price
+        discount_percentage, _ = self.get_active_event_discount()
+        return apply_discount(self.price, discount_percentage)
     
     def has_active_discount(self):
         """Check if product has an active discount from an event."""
@@ -194,13 +243,14 @@ class Product(models.Model):
     def discount_info(self):
         """Get discount information as dict for templates."""
         discount_percentage, event = self.get_active_event_discount()
+        discounted_price = self.get_discounted_price()
         return {
             'has_discount': discount_percentage > 0,
             'percentage': discount_percentage,
             'original_price': self.price,
-            'discounted_price': self.get_discounted_price(),
+            'discounted_price': discounted_price,
             'event': event,
-            'savings': self.price - self.get_discounted_price() if discount_percentage > 0 else 0
+            'savings': self.price - discounted_price if discount_percentage > 0 else 0
         }
 
 
@@ -234,7 +284,9 @@ class Cart(models.Model):
 
     def total_price(self):
         """Calculate total price of all items in cart."""
-        return sum(item.subtotal() for item in self.items.all())
+        from .pricing import price_cart
+
+        return price_cart(self).subtotal
 
     def __str__(self):
         return f"Cart for {self.user.username}"
@@ -260,3 +312,39 @@ class CartItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} ({self.size}) x{self.quantity}"
+
+
+class StockReservation(models.Model):
+    """
+    Stock held for a pending order.
+
+    Checkout takes the units off ``ProductSize.quantity`` (sized lines) or
+    ``Product.stock`` up front and records them here; see ``shop.reservations``.
+    """
+
+    HELD = "held"
+    CONFIRMED = "confirmed"
+    RELEASED = "released"
+    STATUS_CHOICES = [
+        (HELD, "Held"),
+        (CONFIRMED, "Confirmed"),
+        (RELEASED, "Released"),
+    ]
+
+    order = models.ForeignKey(
+        "order_management.Order", related_name="stock_reservations", on_delete=models.CASCADE
+    )
+    product = models.ForeignKey(Product, related_name="reservations", on_delete=models.CASCADE)
+    size = models.CharField(max_length=5, blank=True, help_text="Empty for products without sizes")
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField(help_text="Released automatically after this if still held")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.product} ({self.size or '-'}) x{self.quantity} for order #{self.order_id}"
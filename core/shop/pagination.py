@@ -0,0 +1,108 @@
+"""
+Keyset (cursor) pagination for product and order listings.
+
+Listings are ordered newest first on ``(created_at, id)``. Instead of an
+``OFFSET`` that makes the database walk past every earlier row, each page
+ends with an opaque cursor encoding the last row's key; the next page asks
+for rows strictly after it. Every page costs the same however deep the
+client scrolls, and rows inserted meanwhile do not shift later pages.
+Totals shown next to a listing are counted with ``capped_count``, which
+stops after a set number of rows.
+"""
+import base64
+import binascii
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 96
+DEFAULT_COUNT_CAP = 1000
+ORDERING = ('-created_at', '-id')
+EXACT, OVER = '', 'over'
+
+
+def page_size(value=None, setting='CATEGORY_PAGE_SIZE'):
+    """Parse a requested page size, defaulting to ``setting`` and capped at ``MAX_PAGE_SIZE``."""
+    default = getattr(settings, setting, DEFAULT_PAGE_SIZE)
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(row):
+    raw = f'{row.created_at.isoformat()}|{row.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, id)`` or ``None`` for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created, pk = raw.rsplit('|', 1)
+        created_at = parse_datetime(created)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if created_at is None:
+        return None
+    return created_at, pk
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing."""
+
+    def __init__(self, items, next_cursor, cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+        self.per_page = per_page
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def is_first(self):
+        return not self.cursor
+
+
+def paginate(queryset, cursor=None, per_page=DEFAULT_PAGE_SIZE):
+    """
+    Return the ``KeysetPage`` of ``queryset`` that follows ``cursor``.
+    An invalid cursor restarts from the first page.
+    """
+    key = decode_cursor(cursor)
+    queryset = queryset.order_by(*ORDERING)
+    if key is not None:
+        created_at, pk = key
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    else:
+        cursor = None
+    # One extra row tells us whether there is a next page without a COUNT.
+    items = list(queryset[:per_page + 1])
+    next_cursor = encode_cursor(items[per_page - 1]) if len(items) > per_page else None
+    return KeysetPage(items[:per_page], next_cursor, cursor, per_page)
+
+
+def capped_count(queryset, cap=None, setting='PRODUCT_COUNT_CAP'):
+    """
+    Return ``(count, qualifier)``: the exact count and ``EXACT``, or
+    ``(cap, OVER)`` once there are more than ``cap`` rows (default from
+    ``setting``). The count stops after ``cap + 1`` rows.
+    """
+    if cap is None:
+        cap = getattr(settings, setting, DEFAULT_COUNT_CAP)
+    count = queryset.order_by()[:cap + 1].count()
+    if count > cap:
+        return cap, OVER
+    return count, EXACT
@@ -0,0 +1,67 @@
+"""
+Cart pricing in a single pass.
+
+``price_cart()`` loads the cart lines with their products in one joined
+query, looks each product's category up in the cached active-discount map
+(``shop.discounts``) and returns the priced lines together with the
+subtotal, delivery fee and total, so pricing a cart costs the same number
+of queries however many lines it holds.
+"""
+from decimal import Decimal
+
+from .discounts import apply_discount, discount_for_category
+
+DELIVERY_FEE_RATE = Decimal('0.05')  # shipping is 5% of the subtotal
+CENT = Decimal('0.01')
+
+
+class PricedLine:
+    """One cart line with its discounted unit price and line subtotal."""
+
+    __slots__ = ('item', 'product', 'quantity', 'size', 'original_price', 'discount_percentage',
+                 'event', 'unit_price', 'subtotal')
+
+    def __init__(self, item):
+        self.item = item
+        self.product = item.product
+        self.quantity = item.quantity
+        self.size = item.size
+        self.original_price = self.product.price or Decimal('0.00')
+        self.discount_percentage, self.event = discount_for_category(self.product.category_ref_id)
+        self.unit_price = apply_discount(self.original_price, self.discount_percentage)
+        self.subtotal = self.unit_price * self.quantity
+
+    @property
+    def has_discount(self):
+        return self.discount_percentage > 0
+
+
+class CartPricing:
+    """Priced lines plus the cart subtotal, delivery fee and total."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.subtotal = sum((line.subtotal for line in lines), Decimal('0.00')).quantize(CENT)
+        self.delivery_fee = (self.subtotal * DELIVERY_FEE_RATE).quantize(CENT)
+        self.total = (self.subtotal + self.delivery_fee).quantize(CENT)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def price_items(items):
+    """Price a ``CartItem`` queryset (or an already loaded list of items)."""
+    if hasattr(items, 'select_related'):
+        items = items.select_related('product__category_ref')
+    return CartPricing([PricedLine(item) for item in items])
+
+
+def price_cart(cart):
+    """Price every line of ``cart``."""
+    return price_items(cart.items.all())
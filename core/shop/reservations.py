@@ -0,0 +1,210 @@
+"""
+Stock reservations for checkout.
+
+Stock is taken when the order is placed, not when it is paid, with
+conditional updates that the database applies atomically::
+
+    UPDATE shop_productsize
+       SET quantity = quantity - CASE WHEN ... THEN n ... END
+     WHERE (product_id = p AND size = s AND quantity >= n) OR ...
+
+One statement covers every sized line of the order and one every unsized
+line (``Product.stock``). If fewer rows were updated than requested, some
+line is short and the surrounding transaction is rolled back, so an order
+gets all of its units or none. No row is read before being written, so
+concurrent checkouts never oversell and only contend for the rows they share.
+
+Each line is recorded as a ``StockReservation`` that expires after
+``PENDING_ORDER_GRACE_PERIOD`` seconds. Paying confirms it; cancelling the
+order or letting it expire releases it and puts the units back
+(``release_expired_reservations`` sweeps expired ones).
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import Product, ProductSize, StockReservation
+
+DEFAULT_GRACE_PERIOD = 30  # seconds
+
+
+class InsufficientStock(Exception):
+    """Raised when some line cannot be reserved; ``short`` maps ``(product_id, size)`` to units available."""
+
+    def __init__(self, short):
+        self.short = short
+        super().__init__(f'Insufficient stock for {len(short)} line(s)')
+
+
+def grace_period():
+    return timedelta(seconds=getattr(settings, 'PENDING_ORDER_GRACE_PERIOD', DEFAULT_GRACE_PERIOD))
+
+
+def _combine(lines):
+    """Merge ``(product_id, size, quantity)`` lines into ``{(product_id, size): quantity}``."""
+    wanted = Counter()
+    for product_id, size, quantity in lines:
+        if quantity > 0:
+            wanted[(product_id, size or '')] += quantity
+    return wanted
+
+
+def _adjust(wanted, sign):
+    """
+    Add (``sign=1``) or conditionally take (``sign=-1``) stock for every key in
+    ``wanted`` with one UPDATE per table. Returns the number of keys updated.
+    """
+    sized = {key: n for key, n in wanted.items() if key[1]}
+    plain = {key: n for key, n in wanted.items() if not key[1]}
+    updated = 0
+    if sized:
+        match = Q()
+        for (product_id, size), n in sized.items():
+            line = Q(product_id=product_id, size=size)
+            match |= line & Q(quantity__gte=n) if sign < 0 else line
+        delta = Case(
+            *(When(product_id=p, size=s, then=Value(n)) for (p, s), n in sized.items()),
+            output_field=IntegerField(),
+        )
+        updated += ProductSize.objects.filter(match).update(quantity=F('quantity') + sign * delta)
+    if plain:
+        match = Q()
+        for (product_id, _), n in plain.items():
+            match |= Q(pk=product_id, stock__gte=n) if sign < 0 else Q(pk=product_id)
+        delta = Case(
+            *(When(pk=p, then=Value(n)) for (p, _), n in plain.items()),
+            output_field=IntegerField(),
+        )
+        updated += Product.objects.filter(match).update(stock=F('stock') + sign * delta)
+    return updated
+
+
+def available(keys):
+    """Return ``{(product_id, size): units in stock}`` for ``(product_id, size)`` keys, in two queries."""
+    keys = {(product_id, size or '') for product_id, size in keys}
+    stock = dict.fromkeys(keys, 0)
+    sized = [key for key in keys if key[1]]
+    plain = [product_id for product_id, size in keys if not size]
+    if sized:
+        rows = ProductSize.objects.filter(
+            product_id__in={product_id for product_id, _ in sized}
+        ).values_list('product_id', 'size', 'quantity')
+        for product_id, size, quantity in rows:
+            if (product_id, size) in stock:
+                stock[(product_id, size)] = max(0, quantity)
+    if plain:
+        for product_id, quantity in Product.objects.filter(pk__in=plain).values_list('pk', 'stock'):
+            stock[(product_id, '')] = quantity
+    return stock
+
+
+def reserve(order, lines):
+    """
+    Take stock for ``lines`` (``(product_id, size, quantity)``) and record it
+    against ``order``. Raises ``InsufficientStock`` without taking anything
+    if any line is short.
+    """
+    wanted = _combine(lines)
+    if not wanted:
+        return []
+    with transaction.atomic():
+        if _adjust(wanted, -1) == len(wanted):
+            expires_at = timezone.now() + grace_period()
+            return StockReservation.objects.bulk_create([
+                StockReservation(
+                    order=order, product_id=product_id, size=size, quantity=n, expires_at=expires_at
+                )
+                for (product_id, size), n in wanted.items()
+            ])
+        # Some line was short: undo the lines that were taken.
+        transaction.set_rollback(True)
+    stock = available(wanted)
+    raise InsufficientStock({key: stock[key] for key, n in wanted.items() if stock[key] < n})
+
+
+def confirm(order):
+    """Keep the stock held for ``order`` once it is paid."""
+    return confirm_orders([order.pk])
+
+
+def confirm_orders(order_ids):
+    """``confirm()`` for many orders in one UPDATE."""
+    return StockReservation.objects.filter(order_id__in=order_ids, status=StockReservation.HELD).update(
+        status=StockReservation.CONFIRMED
+    )
+
+
+def release(order, statuses=(StockReservation.HELD,)):
+    """
+    Put back the stock reserved for ``order`` in any of ``statuses``.
+    Safe to call concurrently: each reservation is released at most once.
+    """
+    return release_orders([order.pk], statuses)
+
+
+def _claim(pks, statuses):
+    """Mark reservations released unless that already happened; returns how many this call flipped."""
+    return StockReservation.objects.filter(pk__in=pks, status__in=statuses).update(
+        status=StockReservation.RELEASED
+    )
+
+
+def _put_back(reservations):
+    released = Counter()
+    for _, product_id, size, quantity in reservations:
+        released[(product_id, size)] += quantity
+    _adjust(released, 1)
+    return sum(released.values())
+
+
+def release_orders(order_ids, statuses=(StockReservation.HELD,)):
+    """
+    ``release()`` for many orders: one UPDATE for the reservations and one per stock table.
+
+    The reservations are flipped with a conditional UPDATE (``WHERE status IN
+    statuses``) and restocked only if it flipped every one of them. If a
+    concurrent caller got to some first, that UPDATE is rolled back and each
+    reservation is claimed on its own, so every unit goes back exactly once
+    without relying on row locks.
+    """
+    reservations = list(
+        StockReservation.objects.filter(order_id__in=order_ids, status__in=statuses)
+        .values_list('pk', 'product_id', 'size', 'quantity')
+    )
+    if not reservations:
+        return 0
+    with transaction.atomic():
+        if _claim([row[0] for row in reservations], statuses) == len(reservations):
+            return _put_back(reservations)
+        transaction.set_rollback(True)
+    with transaction.atomic():
+        return _put_back([row for row in reservations if _claim([row[0]], statuses)])
+
+
+def release_expired(now=None):
+    """
+    Cancel pending orders whose reservations have expired and put their
+    stock back; returns the number of orders released.
+    """
+    from order_management.models import Order
+
+    order_ids = set(
+        StockReservation.objects.filter(
+            status=StockReservation.HELD, expires_at__lte=now or timezone.now()
+        ).values_list('order_id', flat=True)
+    )
+    released = 0
+    for order in Order.objects.filter(pk__in=order_ids):
+        with transaction.atomic():
+            cancelled = Order.objects.filter(pk=order.pk, status='pending').update(status='cancelled')
+            if cancelled or order.status == 'cancelled':
+                release(order)
+                released += 1
+            else:
+                # Paid (or further along) without its stock being confirmed.
+                confirm(order)
+    return released
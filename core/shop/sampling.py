@@ -0,0 +1,190 @@
+"""
+Random product sampling without ``ORDER BY RANDOM()``.
+
+The homepage and its auto-refresh endpoint show a random selection of
+products. Sorting the whole table randomly costs a full scan per request,
+so instead we keep the product ids in memory (sorted ``array('q')`` per
+category, 8 bytes per id), pick random positions and fetch the chosen rows
+by primary key. Picking is O(count) regardless of catalog size.
+
+The pool is loaded lazily, kept current by the product signals in
+``shop.signals`` and fully reloaded every ``SAMPLER_REFRESH_INTERVAL``
+seconds to pick up changes made by other processes.
+"""
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate
+
+from django.conf import settings
+
+DEFAULT_REFRESH_INTERVAL = 300  # seconds
+DEFAULT_MAX_COUNT = 48
+
+
+class ProductSampler:
+    """In-memory pool of product ids grouped by category."""
+
+    def __init__(self, refresh_interval=None):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._by_category = None  # {category_id or None: sorted array('q')}
+        self._size = 0
+        self._loaded_at = 0.0
+
+    @property
+    def loaded(self):
+        return self._by_category is not None
+
+    def _interval(self):
+        if self.refresh_interval is not None:
+            return self.refresh_interval
+        return getattr(settings, 'SAMPLER_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL)
+
+    def load(self, rows=None):
+        """
+        (Re)build the pool from ``(product_id, category_id)`` pairs.
+        Reads them from the database when ``rows`` is not given.
+        """
+        if rows is None:
+            from .models import Product
+
+            rows = (
+                Product.objects.order_by('id')
+                .values_list('id', 'category_ref_id')
+                .iterator(chunk_size=10000)
+            )
+        by_category = {}
+        size = 0
+        for product_id, category_id in rows:
+            ids = by_category.get(category_id)
+            if ids is None:
+                ids = by_category[category_id] = array('q')
+            ids.append(product_id)
+            size += 1
+        for key, ids in by_category.items():
+            # Already ordered when read from the database; timsort is linear then.
+            by_category[key] = array('q', sorted(ids))
+        with self._lock:
+            self._by_category = by_category
+            self._size = size
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if not self.loaded or time.monotonic() - self._loaded_at > self._interval():
+            self.load()
+
+    def _remove(self, product_id):
+        for ids in self._by_category.values():
+            i = bisect_left(ids, product_id)
+            if i < len(ids) and ids[i] == product_id:
+                del ids[i]
+                self._size -= 1
+                return True
+        return False
+
+    def add(self, product_id, category_id=None):
+        """Add a product, moving it if it already sits under another category."""
+        if not self.loaded:
+            return
+        with self._lock:
+            self._remove(product_id)
+            ids = self._by_category.get(category_id)
+            if ids is None:
+                ids = self._by_category[category_id] = array('q')
+            if not ids or ids[-1] < product_id:
+                ids.append(product_id)
+            else:
+                insort(ids, product_id)
+            self._size += 1
+
+    def discard(self, product_id):
+        """Remove a product from the pool if present."""
+        if not self.loaded:
+            return
+        with self._lock:
+            self._remove(product_id)
+
+    def __len__(self):
+        return self._size
+
+    def sample(self, count, category_id=None, stratify=False):
+        """
+        Return up to ``count`` distinct random product ids.
+
+        ``category_id`` restricts the draw to one category. ``stratify``
+        spreads the picks evenly across categories instead of drawing
+        proportionally to category size.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            if category_id is not None:
+                pools = [self._by_category.get(category_id) or array('q')]
+            else:
+                pools = [ids for ids in self._by_category.values() if ids]
+            if not stratify or len(pools) == 1:
+                return self._sample_flat(pools, count)
+            return self._sample_stratified(pools, count)
+
+    @staticmethod
+    def _sample_flat(pools, count):
+        ends = list(accumulate(len(ids) for ids in pools))
+        total = ends[-1] if ends else 0
+        picked = []
+        for position in random.sample(range(total), min(count, total)):
+            pool = bisect_right(ends, position)
+            start = ends[pool - 1] if pool else 0
+            picked.append(pools[pool][position - start])
+        return picked
+
+    @staticmethod
+    def _sample_stratified(pools, count):
+        pools = list(pools)
+        random.shuffle(pools)
+        used = [set() for _ in pools]
+        picked = []
+        while len(picked) < count:
+            progressed = False
+            for ids, taken in zip(pools, used):
+                if len(taken) >= len(ids):
+                    continue
+                position = random.randrange(len(ids))
+                while position in taken:
+                    position = random.randrange(len(ids))
+                taken.add(position)
+                picked.append(ids[position])
+                progressed = True
+                if len(picked) >= count:
+                    break
+            if not progressed:
+                break
+        return picked
+
+
+sampler = ProductSampler()
+
+
+def clamp_count(value, default=24):
+    """Parse a requested sample size and cap it at ``RANDOM_PRODUCTS_MAX``."""
+    limit = getattr(settings, 'RANDOM_PRODUCTS_MAX', DEFAULT_MAX_COUNT)
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        count = default
+    return max(1, min(count, limit))
+
+
+def random_products(count, queryset=None, category_id=None, stratify=False):
+    """
+    Return up to ``count`` random products fetched by primary key.
+    ``queryset`` lets callers add annotations or ``select_related``.
+    """
+    from .models import Product
+
+    ids = sampler.sample(count, category_id=category_id, stratify=stratify)
+    if queryset is None:
+        queryset = Product.objects.all()
+    by_id = {p.id: p for p in queryset.filter(id__in=ids)}
+    return [by_id[i] for i in ids if i in by_id]
@@ -0,0 +1,299 @@
+"""
+Full-text product search.
+
+Products are indexed into a side table kept next to ``shop_product``:
+
+* SQLite: an FTS5 virtual table ``shop_product_fts`` (rowid = product id)
+  with ``name``, ``category`` and ``description`` columns, ranked by bm25.
+* PostgreSQL: ``shop_product_search`` holding a weighted ``tsvector`` per
+  product behind a GIN index, ranked by ``ts_rank``.
+
+The index is created by migration ``0004_product_search_index``, kept in
+sync by the product/category signals in ``shop.signals`` and can be rebuilt
+with ``manage.py rebuild_search_index`` (needed after bulk imports, which
+bypass signals). Other databases, or SQLite builds without FTS5, fall back
+to the old ``icontains`` scan.
+
+The raw SQL runs on the database the router picks for ``Product``: index
+maintenance on its write database, searches on the one the surrounding
+queryset reads (the replica for catalog views, see ``core.replicas``).
+"""
+import re
+from math import ceil
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'shop_product_fts'
+PG_TABLE = 'shop_product_search'
+CHUNK_SIZE = 500
+
+# Indexed fields and the tsvector weight each is stored under on PostgreSQL.
+FIELDS = {'name': 'A', 'category': 'B', 'description': 'C'}
+
+# bm25 column weights for (name, category, description); higher is better.
+SQLITE_WEIGHTS = (10.0, 4.0, 1.0)
+
+_SOURCE_SQL = """
+    SELECT p.id,
+           COALESCE(p.name, ''),
+           TRIM(COALESCE(c.name, '') || ' ' || COALESCE(s.name, '') || ' ' || COALESCE(p.category, '')),
+           COALESCE(p.description, '')
+      FROM shop_product p
+      LEFT JOIN shop_category c ON c.id = p.category_ref_id
+      LEFT JOIN shop_subcategory s ON s.id = p.subcategory_id
+"""
+
+_available = {}
+
+
+def reset_backend_cache(**kwargs):
+    """Forget which connections have an index (connected to ``post_migrate``)."""
+    _available.clear()
+
+
+def _product_db(write=False):
+    from .models import Product
+
+    return router.db_for_write(Product) if write else router.db_for_read(Product)
+
+
+def search_backend(using=None):
+    """
+    Return ``'sqlite'``, ``'postgresql'`` or ``None`` when no index is usable
+    on ``using`` (by default the database products are read from).
+    """
+    alias = using or _product_db()
+    if alias not in _available:
+        connection = connections[alias]
+        vendor = connection.vendor
+        table = {'sqlite': FTS_TABLE, 'postgresql': PG_TABLE}.get(vendor)
+        tables = connection.introspection.table_names() if table else []
+        _available[alias] = vendor if table in tables else None
+    return _available[alias]
+
+
+def tokenize(query):
+    """Split free text into lowercase word tokens safe to embed in a match expression."""
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def _match_expression(tokens, backend):
+    if backend == 'sqlite':
+        return ' '.join(f'"{token}"*' for token in tokens)
+    return ' & '.join(f'{token}:*' for token in tokens)
+
+
+# -------------------------------------------------
+# Index maintenance
+# -------------------------------------------------
+def _index_rows(where, params):
+    using = _product_db(write=True)
+    backend = search_backend(using)
+    with connections[using].cursor() as cursor:
+        if backend == 'sqlite':
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT p.id FROM shop_product p WHERE {where})",
+                params,
+            )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, category, description) {_SOURCE_SQL} WHERE {where}",
+                params,
+            )
+        elif backend == 'postgresql':
+            cursor.execute(
+                f"""
+                INSERT INTO {PG_TABLE} (product_id, document)
+                SELECT src.id,
+                       setweight(to_tsvector('simple', src.name), 'A')
+                       || setweight(to_tsvector('simple', src.category), 'B')
+                       || setweight(to_tsvector('simple', src.description), 'C')
+                  FROM ({_SOURCE_SQL} WHERE {where}) AS src (id, name, category, description)
+                ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document
+                """,
+                params,
+            )
+
+
+def index_products(product_ids):
+    """(Re)index the given products."""
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), CHUNK_SIZE):
+        chunk = product_ids[start:start + CHUNK_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        _index_rows(f'p.id IN ({placeholders})', chunk)
+
+
+def index_category(category_id):
+    """Reindex every product filed under a category (after a rename)."""
+    _index_rows('p.category_ref_id = %s', [category_id])
+
+
+def index_subcategory(subcategory_id):
+    """Reindex every product filed under a subcategory (after a rename)."""
+    _index_rows('p.subcategory_id = %s', [subcategory_id])
+
+
+def remove_products(product_ids):
+    """Drop products from the index."""
+    using = _product_db(write=True)
+    backend = search_backend(using)
+    if backend is None:
+        return
+    table, column = (FTS_TABLE, 'rowid') if backend == 'sqlite' else (PG_TABLE, 'product_id')
+    product_ids = list(product_ids)
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(product_ids), CHUNK_SIZE):
+            chunk = product_ids[start:start + CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", chunk)
+
+
+def rebuild_index():
+    """Rebuild the whole index from ``shop_product``; returns the row count."""
+    using = _product_db(write=True)
+    backend = search_backend(using)
+    if backend is None:
+        return 0
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE if backend == 'sqlite' else PG_TABLE}")
+    _index_rows('1 = 1', [])
+    if backend == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE if backend == 'sqlite' else PG_TABLE}")
+        return cursor.fetchone()[0]
+
+
+# -------------------------------------------------
+# Querying
+# -------------------------------------------------
+class SearchPage:
+    """One page of ranked search results plus the total match count."""
+
+    def __init__(self, products, total, number, per_page):
+        self.products = products
+        self.total = total
+        self.number = number
+        self.per_page = per_page
+        self.num_pages = max(1, ceil(total / per_page)) if per_page else 1
+
+    def has_next(self):
+        return self.number < self.num_pages
+
+    def has_previous(self):
+        return self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def _ranked_ids(tokens, offset, limit, backend, using):
+    """Return ``([product ids by rank], total)`` from a single index query."""
+    expression = _match_expression(tokens, backend)
+    if backend == 'sqlite':
+        weights = ', '.join(str(w) for w in SQLITE_WEIGHTS)
+        # bm25() cannot share a SELECT with a window function, hence the subquery.
+        sql = f"""
+            SELECT id, COUNT(*) OVER ()
+              FROM (SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS score
+                      FROM {FTS_TABLE}
+                     WHERE {FTS_TABLE} MATCH %s)
+             ORDER BY score, id DESC
+             LIMIT %s OFFSET %s
+        """
+    else:
+        sql = f"""
+            SELECT product_id, COUNT(*) OVER ()
+              FROM {PG_TABLE}, to_tsquery('simple', %s) AS query
+             WHERE document @@ query
+             ORDER BY ts_rank(document, query) DESC, product_id DESC
+             LIMIT %s OFFSET %s
+        """
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [expression, limit, offset])
+        rows = cursor.fetchall()
+    return [row[0] for row in rows], (rows[0][1] if rows else None)
+
+
+def matching_ids_sql(query, fields=None, using=None):
+    """
+    Return ``(sql, params)`` selecting the ids of products matching ``query``,
+    for use in ``id__in=RawSQL(...)`` filters, or ``None`` without an index.
+    ``fields`` limits matching to some of ``FIELDS``; ``using`` is the
+    database the filtered queryset runs on.
+    """
+    backend = search_backend(using)
+    tokens = tokenize(query)
+    if backend is None or not tokens:
+        return None
+    if backend == 'sqlite':
+        expression = _match_expression(tokens, backend)
+        if fields:
+            expression = f"{{{' '.join(fields)}}} : ({expression})"
+        return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression]
+    weights = ''.join(FIELDS[field] for field in fields) if fields else ''
+    expression = ' & '.join(f'{token}:*{weights}' for token in tokens)
+    return f"SELECT product_id FROM {PG_TABLE} WHERE document @@ to_tsquery('simple', %s)", [expression]
+
+
+def fallback_filter(query, fields=None):
+    """The pre-index ``icontains`` filter, used when no index is available."""
+    lookups = {
+        'name': Q(name__icontains=query),
+        'description': Q(description__icontains=query),
+        'category': Q(category__icontains=query) | Q(category_ref__name__icontains=query),
+    }
+    condition = Q()
+    for field in fields or ('name', 'description', 'category'):
+        condition |= lookups[field]
+    return condition
+
+
+def filter_products(queryset, query, fields=None):
+    """Restrict ``queryset`` to products matching ``query`` without ranking them."""
+    matching = matching_ids_sql(query, fields, using=queryset.db)
+    if matching is not None:
+        return queryset.filter(id__in=RawSQL(*matching))
+    if not tokenize(query):
+        return queryset.none()
+    return queryset.filter(fallback_filter(query, fields)).distinct()
+
+
+def search_products(query, page=1, per_page=24, queryset=None):
+    """
+    Return a ``SearchPage`` of products matching ``query``, best match first.
+    ``queryset`` lets callers add annotations or ``select_related``.
+    """
+    from .models import Product
+
+    if queryset is None:
+        queryset = Product.objects.all()
+    try:
+        page = max(1, int(page))
+    except (TypeError, ValueError):
+        page = 1
+    offset = (page - 1) * per_page
+
+    tokens = tokenize(query)
+    if not tokens:
+        return SearchPage([], 0, 1, per_page)
+
+    backend = search_backend(queryset.db)
+    if backend is None:
+        matches = queryset.filter(fallback_filter(query)).distinct()
+        total = matches.count()
+        return SearchPage(list(matches[offset:offset + per_page]), total, page, per_page)
+
+    ids, total = _ranked_ids(tokens, offset, per_page, backend, queryset.db)
+    if total is None:
+        # No rows on this page; only a page past the end needs a recount.
+        total = (_ranked_ids(tokens, 0, 1, backend, queryset.db)[1] or 0) if offset else 0
+    by_id = queryset.in_bulk(ids)
+    return SearchPage([by_id[i] for i in ids if i in by_id], total, page, per_page)
@@ -0,0 +1,106 @@
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed, post_migrate
+from django.dispatch import receiver
+
+from context_processors import CATEGORIES, bump_header_version
+from events.models import Event
+from . import discounts, search, suggest
+from .models import Category, Subcategory, Product
+from .sampling import sampler
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_discounts_on_event_change(sender, **kwargs):
+    discounts.invalidate()
+
+
+@receiver(m2m_changed, sender=Event.categories.through)
+def invalidate_discounts_on_categories_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        discounts.invalidate()
+
+
+@receiver(post_save, sender=Product)
+def add_product_to_sampler(sender, instance, **kwargs):
+    sampler.add(instance.pk, instance.category_ref_id)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_sampler(sender, instance, **kwargs):
+    sampler.discard(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_header_categories(sender, **kwargs):
+    bump_header_version(CATEGORIES)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, **kwargs):
+    if not created:
+        search.index_category(instance.pk)
+
+
+@receiver(post_save, sender=Subcategory)
+def reindex_subcategory_products(sender, instance, created, **kwargs):
+    if not created:
+        search.index_subcategory(instance.pk)
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Subcategory)
+def remember_products_to_reindex(sender, instance, **kwargs):
+    # Products are detached (SET_NULL) without signals; reindex them afterwards.
+    instance._search_product_ids = list(instance.products.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Subcategory)
+def reindex_detached_products(sender, instance, **kwargs):
+    search.index_products(getattr(instance, '_search_product_ids', []))
+
+
+@receiver(post_save, sender=Category)
+def update_category_suggestion(sender, instance, **kwargs):
+    suggest.index.upsert(suggest.CATEGORY, instance.pk, instance.name, slug=instance.slug, category_id=instance.pk)
+
+
+@receiver(post_save, sender=Subcategory)
+def update_subcategory_suggestion(sender, instance, **kwargs):
+    suggest.index.upsert(
+        suggest.SUBCATEGORY, instance.pk, instance.name, slug=instance.slug, category_id=instance.category_id
+    )
+
+
+@receiver(post_save, sender=Product)
+def update_product_suggestion(sender, instance, **kwargs):
+    suggest.index.upsert(suggest.PRODUCT, instance.pk, instance.name, category_id=instance.category_ref_id)
+
+
+@receiver(post_delete, sender=Category)
+def remove_category_suggestion(sender, instance, **kwargs):
+    suggest.index.remove(suggest.CATEGORY, instance.pk)
+
+
+@receiver(post_delete, sender=Subcategory)
+def remove_subcategory_suggestion(sender, instance, **kwargs):
+    suggest.index.remove(suggest.SUBCATEGORY, instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_suggestion(sender, instance, **kwargs):
+    suggest.index.remove(suggest.PRODUCT, instance.pk)
+
+
+post_migrate.connect(search.reset_backend_cache)
@@ -0,0 +1,344 @@
+"""
+In-memory autocomplete index for ``suggestions_api``.
+
+Category, subcategory and product names are held in process memory with a
+trigram posting list (pg_trgm-style: each word padded with two leading
+spaces and one trailing space) and a sorted word list for short prefixes.
+Substring and fuzzy lookups are answered from memory without touching the
+database; only a (re)build reads the three tables.
+
+The index is built lazily on first use, updated incrementally by the
+signals in ``shop.signals`` and rebuilt every ``SUGGEST_INDEX_TTL`` seconds
+to pick up changes made by other processes. Only one thread rebuilds at a
+time; the others keep answering from the old index until it is replaced.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.urls import reverse
+
+DEFAULT_TTL = 600  # seconds
+FUZZY_CUTOFF = 0.6  # same cutoff the difflib-based lookup used
+MAX_FUZZY_CANDIDATES = 50
+# Fuzzy lookups ignore trigrams shared by more than this share of the names
+# of a kind (``ing``, ``er ``...): they match everything and rank nothing.
+FREQUENT_GRAM_SHARE = 0.2
+
+CATEGORY = 'category'
+SUBCATEGORY = 'subcategory'
+PRODUCT = 'product'
+
+
+def _words(text):
+    return text.casefold().split()
+
+
+def _trigrams(text):
+    grams = set()
+    for word in _words(text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _inner_trigrams(text):
+    """Trigrams every label containing ``text`` must have (none cross words)."""
+    grams = set()
+    for word in _words(text):
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class Entry:
+    __slots__ = ('key', 'kind', 'pk', 'label', 'folded', 'slug', 'category_id', 'trigrams')
+
+    def __init__(self, kind, pk, label, slug=None, category_id=None):
+        self.key = (kind, pk)
+        self.kind = kind
+        self.pk = pk
+        self.label = label
+        self.folded = label.casefold()
+        self.slug = slug
+        self.category_id = category_id
+        self.trigrams = _trigrams(label)
+
+
+class SuggestionIndex:
+    """Trigram + prefix index over category, subcategory and product names."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._entries = None  # {(kind, pk): Entry}
+        self._postings = {}  # {kind: {trigram: {pk, ...}}}
+        self._sizes = {}  # {kind: number of entries}
+        self._words = []  # sorted [(word, kind, pk)]
+        self._category_slugs = {}  # {slug: category pk}
+        self._urls = {}  # {(kind, pk): url}, filled as suggestions are served
+        self._built_at = 0.0
+
+    @property
+    def built(self):
+        return self._entries is not None
+
+    def _ttl(self):
+        if self.ttl is not None:
+            return self.ttl
+        return getattr(settings, 'SUGGEST_INDEX_TTL', DEFAULT_TTL)
+
+    # -------------------------------------------------
+    # Building and incremental maintenance
+    # -------------------------------------------------
+    def build(self):
+        from .models import Category, Subcategory, Product
+
+        entries = [
+            Entry(CATEGORY, pk, name, slug=slug, category_id=pk)
+            for pk, name, slug in Category.objects.values_list('pk', 'name', 'slug')
+        ]
+        entries += [
+            Entry(SUBCATEGORY, pk, name, slug=slug, category_id=category_id)
+            for pk, name, slug, category_id in Subcategory.objects.values_list(
+                'pk', 'name', 'slug', 'category_id'
+            )
+        ]
+        entries += [
+            Entry(PRODUCT, pk, name, category_id=category_id)
+            for pk, name, category_id in Product.objects.values_list(
+                'pk', 'name', 'category_ref_id'
+            ).iterator(chunk_size=10000)
+        ]
+        with self._lock:
+            self._entries = {}
+            self._postings = {CATEGORY: {}, SUBCATEGORY: {}, PRODUCT: {}}
+            self._sizes = {CATEGORY: 0, SUBCATEGORY: 0, PRODUCT: 0}
+            self._words = []
+            self._category_slugs = {}
+            self._urls = {}
+            for entry in entries:
+                self._add(entry, sort=False)
+            self._words.sort()
+            self._built_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.built and time.monotonic() - self._built_at <= self._ttl():
+            return
+        if self.built:
+            # Stale: rebuild unless another thread already is, and serve
+            # the old index meanwhile.
+            if not self._build_lock.acquire(blocking=False):
+                return
+        else:
+            # Nothing to serve yet: wait for whichever thread builds first.
+            self._build_lock.acquire()
+        try:
+            if not self.built or time.monotonic() - self._built_at > self._ttl():
+                self.build()
+        finally:
+            self._build_lock.release()
+
+    def _add(self, entry, sort=True):
+        self._entries[entry.key] = entry
+        self._sizes[entry.kind] += 1
+        postings = self._postings[entry.kind]
+        for gram in entry.trigrams:
+            postings.setdefault(gram, set()).add(entry.pk)
+        for word in set(_words(entry.label)):
+            item = (word, entry.kind, entry.pk)
+            if sort:
+                insort(self._words, item)
+            else:
+                self._words.append(item)
+        if entry.kind == CATEGORY and entry.slug:
+            self._category_slugs[entry.slug] = entry.pk
+
+    def _discard(self, key):
+        if key[0] == PRODUCT:
+            self._urls.pop(key, None)
+        else:
+            # A category slug also appears in its subcategories' URLs.
+            self._urls = {k: v for k, v in self._urls.items() if k[0] == PRODUCT}
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._sizes[entry.kind] -= 1
+        postings = self._postings[entry.kind]
+        for gram in entry.trigrams:
+            pks = postings.get(gram)
+            if pks is not None:
+                pks.discard(entry.pk)
+                if not pks:
+                    del postings[gram]
+        for word in set(_words(entry.label)):
+            i = bisect_left(self._words, (word, entry.kind, entry.pk))
+            if i < len(self._words) and self._words[i] == (word, entry.kind, entry.pk):
+                del self._words[i]
+        if entry.kind == CATEGORY and self._category_slugs.get(entry.slug) == entry.pk:
+            del self._category_slugs[entry.slug]
+
+    def upsert(self, kind, pk, label, slug=None, category_id=None):
+        """Add or replace one entry; a no-op until the index is built."""
+        if not self.built:
+            return
+        with self._lock:
+            self._discard((kind, pk))
+            self._add(Entry(kind, pk, label, slug=slug, category_id=category_id))
+
+    def remove(self, kind, pk):
+        if not self.built:
+            return
+        with self._lock:
+            self._discard((kind, pk))
+
+    # -------------------------------------------------
+    # Lookups
+    # -------------------------------------------------
+    def category_id_for_slug(self, slug):
+        return self._category_slugs.get(slug)
+
+    def category_slug(self, category_id):
+        entry = self._entries.get((CATEGORY, category_id))
+        return entry.slug if entry else None
+
+    def url(self, entry):
+        url = self._urls.get(entry.key)
+        if url is None:
+            url = self._urls[entry.key] = _url(entry)
+        return url
+
+    def contains(self, query, kind, category_id=None, limit=5):
+        """Entries of ``kind`` whose name contains ``query``, sorted by name."""
+        folded = query.casefold()
+        grams = _inner_trigrams(query)
+        with self._lock:
+            if grams:
+                postings = sorted((self._postings[kind].get(g, ()) for g in grams), key=len)
+                keys = [(kind, pk) for pk in set(postings[0]).intersection(*postings[1:])]
+            else:
+                # Too short for trigrams: match word prefixes instead.
+                first = _words(query)[0] if _words(query) else ''
+                i = bisect_left(self._words, (first,))
+                keys = set()
+                while i < len(self._words) and self._words[i][0].startswith(first):
+                    if self._words[i][1] == kind:
+                        keys.add((kind, self._words[i][2]))
+                    i += 1
+            matches = [
+                self._entries[k] for k in keys
+                if folded in self._entries[k].folded
+                and (category_id is None or self._entries[k].category_id == category_id)
+            ]
+        return heapq.nsmallest(limit, matches, key=lambda e: e.label)
+
+    def fuzzy(self, query, kind, category_id=None, limit=5):
+        """
+        Entries of ``kind`` whose name is close to ``query``, best first.
+        Names that contain ``query`` outright are left to ``contains()``.
+        """
+        folded = query.casefold()
+        grams = _trigrams(query)
+        if not grams:
+            return []
+        with self._lock:
+            postings = self._postings[kind]
+            needed = max(2, int(len(grams) * 0.4))
+            frequent = max(MAX_FUZZY_CANDIDATES, int(self._sizes[kind] * FREQUENT_GRAM_SHARE))
+            present = sorted((gram for gram in grams if gram in postings), key=lambda gram: len(postings[gram]))
+            # Count only the rare ones (the two rarest if all are common),
+            # taking every name to share the frequent ones.
+            rare = [gram for gram in present if len(postings[gram]) <= frequent] or present[:2]
+            needed = max(1, needed - (len(present) - len(rare)))
+            shared = Counter()
+            for gram in rare:
+                shared.update(postings.get(gram, ()))
+            candidates = []
+            # Leave room for names skipped below (substring or out-of-scope matches).
+            for pk, n in shared.most_common(MAX_FUZZY_CANDIDATES * 4):
+                if n < needed or len(candidates) >= MAX_FUZZY_CANDIDATES:
+                    break
+                entry = self._entries[(kind, pk)]
+                if folded in entry.folded:
+                    continue
+                if category_id is None or entry.category_id == category_id:
+                    candidates.append(entry)
+
+        # As in difflib.get_close_matches: seq2 is cached, so set it once.
+        matcher = SequenceMatcher()
+        matcher.set_seq2(folded)
+        scored = []
+        for entry in candidates:
+            matcher.set_seq1(entry.folded)
+            if matcher.real_quick_ratio() < FUZZY_CUTOFF or matcher.quick_ratio() < FUZZY_CUTOFF:
+                continue
+            score = matcher.ratio()
+            if score >= FUZZY_CUTOFF:
+                scored.append((-score, entry.label, entry))
+        scored.sort(key=lambda item: item[:2])
+        return [entry for _, _, entry in scored[:limit]]
+
+
+index = SuggestionIndex()
+
+
+def _url(entry):
+    if entry.kind == CATEGORY:
+        return reverse('shop:category_products', args=[entry.slug])
+    if entry.kind == SUBCATEGORY:
+        category_slug = index.category_slug(entry.category_id)
+        return reverse('shop:category_products', args=[category_slug]) + f'?subcategory={entry.slug}'
+    return reverse('shop:product_detail', args=[entry.pk])
+
+
+def _as_suggestion(entry):
+    if entry.kind == CATEGORY:
+        return {'type': CATEGORY, 'label': entry.label, 'slug': entry.slug, 'url': index.url(entry)}
+    if entry.kind == SUBCATEGORY:
+        return {
+            'type': SUBCATEGORY, 'label': entry.label, 'slug': entry.slug,
+            'category': index.category_slug(entry.category_id), 'url': index.url(entry),
+        }
+    return {'type': PRODUCT, 'label': entry.label, 'id': entry.pk, 'url': index.url(entry)}
+
+
+def suggest(query, category_slug=None, limit=8):
+    """
+    Blend substring and fuzzy matches for ``query`` into at most ``limit``
+    deduplicated suggestions: categories, then subcategories, then products.
+    Subcategories and fuzzy products are scoped to ``category_slug`` if given.
+    """
+    index.ensure_built()
+    scope = index.category_id_for_slug(category_slug) if category_slug else None
+    if category_slug and scope is None:
+        scope = -1  # unknown category: nothing is in scope
+
+    suggestions = []
+    seen = set()
+
+    def add(entries):
+        for entry in entries:
+            if len(suggestions) >= limit:
+                return
+            key = (entry.kind, entry.label)
+            if key not in seen:
+                seen.add(key)
+                suggestions.append(_as_suggestion(entry))
+
+    # 1) Exact/partial contains
+    add(index.contains(query, CATEGORY))
+    add(index.contains(query, SUBCATEGORY, category_id=scope))
+    add(index.contains(query, PRODUCT))
+
+    # 2) Fuzzy matches, until reaching the limit
+    for kind, kind_scope in ((CATEGORY, None), (SUBCATEGORY, scope), (PRODUCT, scope)):
+        remaining = limit - len(suggestions)
+        if remaining <= 0:
+            break
+        add(index.fuzzy(query, kind, category_id=kind_scope, limit=remaining))
+
+    return suggestions
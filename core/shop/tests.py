@@ -1,3 +1,632 @@
-from django.test import TestCase
+import io
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from unittest import mock, skipUnless
+
+from django.db import OperationalError, connection, connections
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core import replicas
+from core.querybudget import QueryRecorder, query_budget, query_shape
+from events.models import Event
+from order_management.models import Order
+from . import discounts, reservations, search, suggest
+from .models import Cart, CartItem, Category, Product, ProductSize, StockReservation
+from .sampling import ProductSampler, clamp_count
+
+
+class QueryBudgetTests(TestCase):
+    """Keep the catalog pages from regressing into per-product queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Kitchen')
+        Product.objects.bulk_create(
+            Product(name=f'Pan {i}', price=10, stock=5, category_ref=cls.category) for i in range(40)
+        )
+        sale = Event.objects.create(
+            name='Kitchen Week', event_date=timezone.now() - timedelta(hours=1), status='live', discount_percentage=25,
+        )
+        sale.categories.add(cls.category)
+
+    def setUp(self):
+        discounts.invalidate()
+        self.addCleanup(discounts.invalidate)
+
+    def queries(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_shape_ignores_parameters(self):
+        self.assertEqual(
+            query_shape('SELECT * FROM t WHERE id IN (%s, %s, %s) AND n = 3'),
+            query_shape('SELECT * FROM t WHERE id IN (%s, %s) AND n = 7'),
+        )
+
+    def test_repeated_shapes_report_their_origin(self):
+        recorder = QueryRecorder()
+        with recorder.record():
+            for product in Product.objects.all()[:5]:
+                Category.objects.get(pk=product.category_ref_id)
+        ((count, _, origin),) = recorder.repeated(5)
+        self.assertEqual(count, 5)
+        self.assertIn('shop/tests.py', origin)
+
+    def test_category_products(self):
+        url = reverse('shop:category_products', args=[self.category.slug])
+        with query_budget(view_name='shop:category_products'):
+            response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['total'], response.context['total_qualifier']), (40, ''))
+        self.assertContains(response, 'SALE 25%')
+        # The infinite-scroll script lives in a block, so it actually renders.
+        self.assertContains(response, 'Infinite scroll')
+        self.assertContains(response, reverse('shop:category_products_api', args=[self.category.slug]))
+
+    def test_discounted_listings_cost_the_same_for_any_page_size(self):
+        url = reverse('shop:category_products', args=[self.category.slug])
+        self.queries(url)  # builds the discount map
+        few, _ = self.queries(url, per_page=2)
+        many, response = self.queries(url, per_page=30)
+        self.assertEqual(len(response.context['products']), 30)
+        self.assertEqual(many, few)
+
+        url = reverse('shop:random_products_api')
+        self.queries(url)  # loads the sampler
+        few, _ = self.queries(url, count=2)
+        many, response = self.queries(url, count=30)
+        self.assertTrue(all(p['discount_percentage'] == 25 for p in response.json()['products']))
+        self.assertEqual(many, few)
+
+    @override_settings(PRODUCT_COUNT_CAP=30)
+    def test_product_counts_stop_at_the_cap(self):
+        url = reverse('shop:category_products', args=[self.category.slug])
+        response = self.client.get(url, secure=True)
+        self.assertContains(response, 'Over 30</strong> products found')
+        search.rebuild_index()  # bulk_create skips the indexing signals
+        response = self.client.get(reverse('shop:global_search'), {'q': 'pan', 'sort': 'newest'}, secure=True)
+        self.assertContains(response, 'Found over 30 products')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+
+class CartPricingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', password='pw')
+        sale = Category.objects.create(name='Sale')
+        plain = Category.objects.create(name='Plain')
+        event = Event.objects.create(
+            name='Flash sale', event_date=timezone.now() - timedelta(days=1),
+            discount_percentage=25, is_active=True, status='live',
+        )
+        event.categories.add(sale)
+        cart = Cart.objects.create(user=cls.user)
+        for i in range(20):
+            product = Product.objects.create(
+                name=f'Item {i}', price=Decimal('10.00'), stock=5,
+                category_ref=sale if i % 2 else plain,
+            )
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+
+    def setUp(self):
+        self.client.login(username='shopper', password='pw')
+
+    def test_totals(self):
+        response = self.client.get(reverse('shop:view_cart'), secure=True)
+        # 10 lines at 2 x $10.00 and 10 lines at 2 x $7.50
+        self.assertEqual(response.context['subtotal'], Decimal('350.00'))
+        self.assertEqual(response.context['delivery_fee'], Decimal('17.50'))
+        self.assertEqual(response.context['total'], Decimal('367.50'))
+
+    def test_query_count_does_not_grow_with_cart(self):
+        with query_budget(view_name='shop:view_cart', repeats=2):
+            self.client.get(reverse('shop:view_cart'), secure=True)
+
+    def test_checkout_writes_the_order_in_bulk(self):
+        with query_budget(view_name='shop:checkout_page', repeats=2):
+            self.client.post(
+                reverse('shop:checkout_page'), {'address': '1 Nile St', 'payment_method': 'cash'}, secure=True
+            )
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.total_amount, Decimal('350.00'))
+        self.assertEqual(order.final_total, Decimal('367.50'))
+        self.assertEqual(sum(item.subtotal() for item in order.items.all()), order.total_amount)
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+
+
+class StockReservationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer')
+        cls.shirt = Product.objects.create(name='Shirt', price=20, stock=0)
+        ProductSize.objects.create(product=cls.shirt, size='M', quantity=3)
+        cls.mug = Product.objects.create(name='Mug', price=5, stock=4)
+
+    def order(self):
+        return Order.objects.create(user=self.user)
+
+    def stock(self):
+        self.shirt.refresh_from_db()
+        self.mug.refresh_from_db()
+        return self.shirt.sizes.get(size='M').quantity, self.mug.stock
+
+    def test_reserve_takes_every_line(self):
+        reservations.reserve(self.order(), [(self.shirt.pk, 'M', 2), (self.mug.pk, '', 3)])
+        self.assertEqual(self.stock(), (1, 1))
+
+    def test_short_line_takes_nothing(self):
+        order = self.order()
+        with self.assertRaises(reservations.InsufficientStock) as raised:
+            reservations.reserve(order, [(self.shirt.pk, 'M', 2), (self.mug.pk, '', 5)])
+        self.assertEqual(raised.exception.short, {(self.mug.pk, ''): 4})
+        self.assertEqual(self.stock(), (3, 4))
+        self.assertFalse(order.stock_reservations.exists())
+
+    def test_release_puts_stock_back_once(self):
+        order = self.order()
+        reservations.reserve(order, [(self.shirt.pk, 'M', 2), (self.mug.pk, '', 1)])
+        reservations.release(order)
+        reservations.release(order)
+        self.assertEqual(self.stock(), (3, 4))
+
+    def test_release_skips_rows_released_since_they_were_read(self):
+        order = self.order()
+        reservations.reserve(order, [(self.shirt.pk, 'M', 2), (self.mug.pk, '', 1)])
+        mug = order.stock_reservations.get(product=self.mug)
+
+        def release_mug_meanwhile(execute, sql, params, many, context):
+            if read and not raced:
+                # Another caller releases the mug between our read and our write.
+                raced.append(True)
+                StockReservation.objects.filter(pk=mug.pk).update(status=StockReservation.RELEASED)
+                Product.objects.filter(pk=self.mug.pk).update(stock=F('stock') + 1)
+            if sql.startswith('SELECT') and 'shop_stockreservation' in sql:
+                read.append(sql)
+            return execute(sql, params, many, context)
+
+        read, raced = [], []
+        with connection.execute_wrapper(release_mug_meanwhile):
+            self.assertEqual(reservations.release(order), 2)
+        self.assertEqual(self.stock(), (3, 4))
+
+    def test_confirmed_stock_is_kept(self):
+        order = self.order()
+        reservations.reserve(order, [(self.mug.pk, '', 1)])
+        reservations.confirm(order)
+        reservations.release(order)
+        self.assertEqual(self.stock(), (3, 3))
+
+    def test_expired_pending_orders_are_cancelled(self):
+        order = self.order()
+        reservations.reserve(order, [(self.mug.pk, '', 2)])
+        released = reservations.release_expired(now=timezone.now() + reservations.grace_period() * 2)
+        self.assertEqual(released, 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        self.assertEqual(self.stock(), (3, 4))
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    """Many buyers racing for the last units must never oversell."""
+
+    BUYERS = 16
+    UNITS = 5
+
+    def test_last_units(self):
+        user = User.objects.create_user('crowd')
+        product = Product.objects.create(name='Limited', price=99, stock=self.UNITS)
+        orders = [Order.objects.create(user=user) for _ in range(self.BUYERS)]
+        barrier = threading.Barrier(self.BUYERS)
+        outcomes = []
+
+        def buy(order):
+            barrier.wait()
+            try:
+                for _ in range(200):
+                    try:
+                        reservations.reserve(order, [(product.pk, '', 1)])
+                        outcomes.append('bought')
+                        return
+                    except reservations.InsufficientStock:
+                        outcomes.append('sold out')
+                        return
+                    except OperationalError:
+                        # The in-memory SQLite test database reports a locked table
+                        # instead of waiting like a file database would; retry.
+                        time.sleep(0.005)
+                outcomes.append('gave up')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(outcomes.count('bought'), self.UNITS)
+        self.assertEqual(outcomes.count('sold out'), self.BUYERS - self.UNITS)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(StockReservation.objects.filter(product=product).count(), self.UNITS)
+
+
+class SQLiteTuningTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+
+
+class ReplicaRoutingTests(TestCase):
+    """Catalog pages may read a replica; anything a user just changed may not."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pw')
+        cls.product = Product.objects.create(name='Kettle', price=30, stock=3)
+
+    def test_catalog_views_read_the_replica(self):
+        response = self.client.get(reverse('shop:product_detail', args=[self.product.pk]), secure=True)
+        self.assertTrue(response.wsgi_request.reads_replica)
+
+    def test_other_views_read_the_primary(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('shop:view_cart'), secure=True)
+        self.assertFalse(getattr(response.wsgi_request, 'reads_replica', False))
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('shop:add_to_cart', args=[self.product.pk]), secure=True)
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+
+        response = self.client.get(reverse('shop:product_detail', args=[self.product.pk]), secure=True)
+        self.assertFalse(getattr(response.wsgi_request, 'reads_replica', False))
+
+    def test_router(self):
+        router = replicas.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Product))
+        with replicas.reading_replica():
+            # Reads inside a transaction (as every TestCase runs) see its writes on the primary.
+            self.assertIsNone(router.db_for_read(Product))
+            self.assertIsNone(router.db_for_read(Cart))
+            self.assertIsNone(router.db_for_read(Order))
+            self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertFalse(router.allow_migrate(replicas.REPLICA, 'shop'))
+
+
+@skipUnless(replicas.replica_alias(), 'no replica database configured')
+class ReplicaQueryTests(TransactionTestCase):
+    databases = '__all__'
+
+    def test_product_page_reads_the_replica(self):
+        product = Product.objects.create(name='Toaster', price=40, stock=2)
+        with CaptureQueriesContext(connections[replicas.REPLICA]) as replica_queries:
+            response = self.client.get(reverse('shop:product_detail', args=[product.pk]), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('shop_product' in query['sql'] for query in replica_queries))
+
+    def test_search_reads_the_replica(self):
+        Product.objects.create(name='Toaster', price=40, stock=2)
+        with replicas.reading_replica(), CaptureQueriesContext(connections[replicas.REPLICA]) as replica_queries:
+            with CaptureQueriesContext(connection) as primary_queries:
+                page = search.search_products('toast')
+        self.assertEqual([product.name for product in page.products], ['Toaster'])
+        self.assertTrue(any(search.PG_TABLE in query['sql'] for query in replica_queries))
+        self.assertEqual(len(primary_queries), 0)
+
+    def test_router(self):
+        router = replicas.ReplicaRouter()
+        with replicas.reading_replica():
+            self.assertEqual(router.db_for_read(Product), replicas.REPLICA)
+            self.assertIsNone(router.db_for_read(Cart))
+        self.assertIsNone(router.db_for_read(Product))
+
+
+class ActiveDiscountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lighting = Category.objects.create(name='Lighting', slug='lighting')
+        cls.garden = Category.objects.create(name='Garden', slug='garden')
+
+    def setUp(self):
+        discounts.invalidate()
+        self.addCleanup(discounts.invalidate)
+        self.event = Event.objects.create(
+            name='Sale', event_date=timezone.now() - timedelta(hours=1), status='live', discount_percentage=20,
+        )
+        self.event.categories.add(self.lighting)
+
+    def test_map_is_cached(self):
+        self.assertEqual(discounts.discount_for_category(self.lighting.pk), (20, self.event))
+        with self.assertNumQueries(0):
+            self.assertEqual(discounts.discount_for_category(self.garden.pk), (0, None))
+
+    def test_event_changes_invalidate(self):
+        discounts.active_discounts()
+        self.event.discount_percentage = 35
+        self.event.save()
+        self.assertEqual(discounts.discount_for_category(self.lighting.pk)[0], 35)
+        self.event.delete()
+        self.assertEqual(discounts.discount_for_category(self.lighting.pk), (0, None))
+
+    def test_category_changes_invalidate(self):
+        discounts.active_discounts()
+        self.event.categories.add(self.garden)
+        self.assertEqual(discounts.discount_for_category(self.garden.pk)[0], 20)
+        self.event.categories.remove(self.lighting)
+        self.assertEqual(discounts.discount_for_category(self.lighting.pk), (0, None))
+        self.event.categories.clear()
+        self.assertEqual(discounts.active_discounts(), {})
+
+    @override_settings(ACTIVE_DISCOUNT_TTL=60)
+    def test_map_expires_after_ttl(self):
+        discounts.active_discounts()
+        Event.objects.filter(pk=self.event.pk).update(discount_percentage=50)  # no signal
+        self.assertEqual(discounts.discount_for_category(self.lighting.pk)[0], 20)
+        later = time.monotonic() + 61
+        with mock.patch('shop.discounts.time.monotonic', return_value=later):
+            self.assertEqual(discounts.discount_for_category(self.lighting.pk)[0], 50)
+
+    def test_scheduled_event_shortens_ttl(self):
+        soon = Event.objects.create(name='Soon', event_date=timezone.now() + timedelta(seconds=5), status='live')
+        soon.categories.add(self.garden)
+        discounts.active_discounts()
+        self.assertLessEqual(discounts._state['expires'] - time.monotonic(), 5)
+
+
+class ProductDiscountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lighting = Category.objects.create(name='Lighting', slug='lighting')
+        cls.garden = Category.objects.create(name='Garden', slug='garden')
+        started = timezone.now() - timedelta(hours=1)
+        cls.small = Event.objects.create(name='Small', event_date=started, status='live', discount_percentage=15)
+        cls.big = Event.objects.create(
+            name='Big', event_date=started + timedelta(minutes=1), status='live', discount_percentage=33,
+        )
+        Event.objects.create(name='Ended', event_date=started, status='end', discount_percentage=90)
+        cls.small.categories.add(cls.lighting, cls.garden)
+        cls.big.categories.add(cls.lighting)
+
+    def setUp(self):
+        discounts.invalidate()
+        self.addCleanup(discounts.invalidate)
+
+    def test_annotated_price_is_rounded_like_apply_discount(self):
+        prices = ['0.30', '0.50', '0.70', '1.15', '10.05', '19.99', '99.99']
+        for price in prices:
+            Product.objects.create(name=f'Lamp {price}', price=Decimal(price), category_ref=self.lighting)
+            Product.objects.create(name=f'Hose {price}', price=Decimal(price), category_ref=self.garden)
+        Product.objects.create(name='Plain', price=Decimal('4.99'))
+        for product in Product.objects.with_discounts():
+            expected = 33 if product.category_ref == self.lighting else 15 if product.category_ref else 0
+            self.assertEqual(product.event_discount, expected, product.name)
+            self.assertEqual(product.discounted_price, discounts.apply_discount(product.price, expected), product.name)
+
+    def test_annotations_name_the_event_they_priced(self):
+        Product.objects.create(name='Lamp', price=Decimal('20.00'), category_ref=self.lighting)
+        lamp = Product.objects.with_discounts().get()
+        self.assertEqual(lamp.get_active_event_discount(), (33, self.big))
+        self.assertEqual(lamp.discount_info['discounted_price'], Decimal('13.40'))
+        # A stale discount map does not change what an annotated product reports.
+        discounts._state.update(map={}, expires=time.monotonic() + 60)
+        lamp = Product.objects.with_discounts().get()
+        self.assertEqual(lamp.get_active_event_discount(), (33, self.big))
+        self.assertEqual(Product.objects.get().get_active_event_discount(), (0, None))
+
+
+class ProductSamplerTests(TestCase):
+
+    def setUp(self):
+        self.sampler = ProductSampler(refresh_interval=3600)
+        self.sampler.load([(1, 10), (2, 10), (3, 10), (4, 20), (5, None)])
+
+    def test_sample_is_distinct_and_capped_by_pool(self):
+        picked = self.sampler.sample(50)
+        self.assertEqual(sorted(picked), [1, 2, 3, 4, 5])
+        self.assertEqual(len(self.sampler.sample(3)), 3)
+
+    def test_sample_one_category(self):
+        for _ in range(20):
+            self.assertLessEqual(set(self.sampler.sample(2, category_id=10)), {1, 2, 3})
+        self.assertEqual(sorted(self.sampler.sample(9, category_id=10)), [1, 2, 3])
+
+    def test_empty_or_unknown_category(self):
+        self.assertEqual(self.sampler.sample(5, category_id=99), [])
+        self.sampler.discard(4)
+        self.assertEqual(self.sampler.sample(5, category_id=20), [])
+        empty = ProductSampler(refresh_interval=3600)
+        empty.load([])
+        self.assertEqual(empty.sample(5), [])
+        self.assertEqual(empty.sample(5, stratify=True), [])
+
+    def test_stratified_sample_covers_every_category(self):
+        for _ in range(20):
+            picked = self.sampler.sample(3, stratify=True)
+            self.assertEqual(len(picked), 3)
+            self.assertEqual({4, 5} & set(picked), {4, 5})
+        self.assertEqual(sorted(self.sampler.sample(50, stratify=True)), [1, 2, 3, 4, 5])
+
+    def test_add_moves_and_discard_removes(self):
+        self.sampler.add(3, 20)
+        self.assertEqual(sorted(self.sampler.sample(9, category_id=20)), [3, 4])
+        self.sampler.add(6, 10)
+        self.assertEqual(sorted(self.sampler.sample(9, category_id=10)), [1, 2, 6])
+        self.sampler.discard(1)
+        self.sampler.discard(42)
+        self.assertEqual(len(self.sampler), 5)
+        self.assertNotIn(1, self.sampler.sample(50))
+
+    def test_loads_from_the_database_once_stale(self):
+        lighting = Category.objects.create(name='Lighting', slug='lighting')
+        lamp = Product.objects.create(name='Lamp', price=10, category_ref=lighting)
+        sampler = ProductSampler(refresh_interval=0)
+        self.assertEqual(sampler.sample(5, category_id=lighting.pk), [lamp.pk])
+
+    @override_settings(RANDOM_PRODUCTS_MAX=10)
+    def test_clamp_count(self):
+        self.assertEqual(clamp_count('5'), 5)
+        self.assertEqual(clamp_count('500'), 10)
+        self.assertEqual(clamp_count('0'), 1)
+        self.assertEqual(clamp_count('-3'), 1)
+        self.assertEqual(clamp_count('lots', default=7), 7)
+        self.assertEqual(clamp_count(None, default=7), 7)
+
+
+class SearchIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lighting = Category.objects.create(name='Lighting', slug='lighting')
+        cls.desk_lamp = Product.objects.create(
+            name='Desk Lamp', price=30, category_ref=cls.lighting, description='Adjustable arm.',
+        )
+        cls.bulb = Product.objects.create(
+            name='Bulb', price=5, category_ref=cls.lighting, description='Fits any lamp.',
+        )
+        cls.hose = Product.objects.create(name='Garden Hose', price=20, description='Twenty metres.')
+
+    def setUp(self):
+        if search.search_backend() is None:
+            self.skipTest('No full-text index on this database.')
+
+    def names(self, query, **kwargs):
+        return [product.name for product in search.search_products(query, **kwargs).products]
+
+    def test_prefix_match_across_fields(self):
+        self.assertEqual(self.names('gard'), ['Garden Hose'])
+        self.assertEqual(self.names('light'), ['Bulb', 'Desk Lamp'])
+        self.assertEqual(self.names('desk adjust'), ['Desk Lamp'])
+        self.assertEqual(self.names('nothing here'), [])
+        self.assertEqual(self.names('"*'), [])
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.names('lamp'), ['Desk Lamp', 'Bulb'])
+        page = search.search_products('lamp', page=2, per_page=1)
+        self.assertEqual((page.total, [p.name for p in page.products]), (2, ['Bulb']))
+        self.assertEqual(search.search_products('lamp', page=9, per_page=1).total, 2)
+
+    def test_filter_by_field(self):
+        products = Product.objects.all()
+        self.assertEqual(set(search.filter_products(products, 'lamp', fields=('name',))), {self.desk_lamp})
+        self.assertEqual(set(search.filter_products(products, 'lamp')), {self.desk_lamp, self.bulb})
+
+    def test_save_updates_the_index(self):
+        self.hose.name = 'Garden Sprinkler'
+        self.hose.save()
+        self.assertEqual(self.names('sprinkler'), ['Garden Sprinkler'])
+        self.assertEqual(self.names('hose'), [])
+        self.lighting.name = 'Illumination'
+        self.lighting.save()
+        self.assertEqual(self.names('illum'), ['Bulb', 'Desk Lamp'])
+
+    def test_delete_removes_from_the_index(self):
+        self.bulb.delete()
+        self.assertEqual(self.names('lamp'), ['Desk Lamp'])
+        self.lighting.delete()
+        self.assertEqual(self.names('lighting'), [])
+        self.assertEqual(self.names('desk'), ['Desk Lamp'])
+
+    def test_rebuild_command_picks_up_bulk_changes(self):
+        Product.objects.filter(pk=self.hose.pk).update(name='Watering Can')  # no signal
+        self.assertEqual(self.names('watering'), [])
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 products', out.getvalue())
+        self.assertEqual(self.names('watering'), ['Watering Can'])
+        self.assertEqual(self.names('hose'), [])
+
+    def test_search_page(self):
+        response = self.client.get(reverse('shop:global_search'), {'q': 'lamp'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['products'], [self.desk_lamp, self.bulb])
+
+
+class SuggestionIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lighting = Category.objects.create(name='Lighting', slug='lighting')
+        cls.desk_lamp = Product.objects.create(name='Desk Lamp', price=30, category_ref=cls.lighting)
+        cls.lantern = Product.objects.create(name='Lantern', price=12)
+
+    def setUp(self):
+        self.index = suggest.SuggestionIndex(ttl=3600)
+        self.index.build()
+
+    def labels(self, entries):
+        return [entry.label for entry in entries]
+
+    def test_contains_and_fuzzy(self):
+        self.assertEqual(self.labels(self.index.contains('lamp', suggest.PRODUCT)), ['Desk Lamp'])
+        self.assertEqual(self.labels(self.index.contains('la', suggest.PRODUCT)), ['Desk Lamp', 'Lantern'])
+        self.assertEqual(self.labels(self.index.fuzzy('dsek lamp', suggest.PRODUCT)), ['Desk Lamp'])
+        self.assertEqual(self.labels(self.index.fuzzy('lighitng', suggest.CATEGORY)), ['Lighting'])
+        self.assertEqual(self.index.fuzzy('desk lamp', suggest.PRODUCT), [])  # left to contains()
+        self.assertEqual(
+            self.labels(self.index.fuzzy('dsek lamp', suggest.PRODUCT, category_id=self.lighting.pk + 1)), [],
+        )
+
+    def test_upsert_and_remove(self):
+        self.index.upsert(suggest.PRODUCT, self.lantern.pk, 'Storm Lantern')
+        self.assertEqual(self.labels(self.index.contains('storm', suggest.PRODUCT)), ['Storm Lantern'])
+        self.index.remove(suggest.PRODUCT, self.lantern.pk)
+        self.assertEqual(self.index.contains('lantern', suggest.PRODUCT), [])
+        self.assertEqual(self.index.fuzzy('lanturn', suggest.PRODUCT), [])
+
+    def test_fuzzy_skips_frequent_trigrams(self):
+        Product.objects.bulk_create(Product(name=f'Lamp {i}', price=1) for i in range(120))
+        self.index.build()
+        self.assertEqual(self.labels(self.index.fuzzy('lanturn', suggest.PRODUCT, limit=1)), ['Lantern'])
+        self.assertEqual(self.labels(self.index.fuzzy('lamp 7x', suggest.PRODUCT, limit=1)), ['Lamp 7'])
+        # The trigrams of 'lamq' are all common or unknown; the two rarest still find candidates.
+        self.assertTrue(self.index.fuzzy('lamq', suggest.PRODUCT))
+
+    def test_stale_index_is_served_while_another_thread_rebuilds(self):
+        Product.objects.create(name='Floor Lamp', price=80)
+        self.index._built_at -= 7200
+        self.index._build_lock.acquire()
+        try:
+            with self.assertNumQueries(0):
+                self.index.ensure_built()
+        finally:
+            self.index._build_lock.release()
+        self.assertEqual(self.labels(self.index.contains('lamp', suggest.PRODUCT)), ['Desk Lamp'])
+        self.index.ensure_built()
+        self.assertEqual(self.labels(self.index.contains('lamp', suggest.PRODUCT)), ['Desk Lamp', 'Floor Lamp'])
+
+    def test_first_build_happens_once(self):
+        index = suggest.SuggestionIndex(ttl=3600)
+
+        def build():
+            time.sleep(0.05)
+            index._entries, index._built_at = {}, time.monotonic()
+
+        with mock.patch.object(index, 'build', side_effect=build) as build:
+            threads = [threading.Thread(target=index.ensure_built) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(build.call_count, 1)
+        self.assertTrue(index.built)
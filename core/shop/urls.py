@@ -18,6 +18,7 @@ urlpatterns = [
     path('checkout-page/', views.checkout_page, name='checkout_page'),
     path('orders/', views.orders_list, name='orders_list'),
     path('order/<int:order_id>/', views.order_detail, name='order_detail'),
+    path('webhooks/payment/', views.PaymentWebhook.as_view(), name='payment_webhook'),
 
     # Admin CRUD
     path('admin/products/create/', views.create_product, name='create_product'),
@@ -30,6 +31,8 @@ urlpatterns = [
     # Homepage random products API
     path('api/random-products/', views.random_products_api, name='random_products_api'),
     path('api/suggestions/', views.suggestions_api, name='suggestions_api'),
+    path('api/category/<slug:slug>/products/', views.category_products_api, name='category_products_api'),
+    path('api/search/', views.search_api, name='search_api'),
 
     # Categories & Search
     path('categories/', views.category_list, name='category_list'),
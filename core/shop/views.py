@@ -5,12 +5,17 @@ from django.http import JsonResponse
 from django.urls import reverse
 from django.utils import timezone
 from django.db import transaction
-from django.db.models import Q
-from decimal import Decimal
 
 from .models import Cart, CartItem, Product, ProductSize, Category, Subcategory
+from .sampling import clamp_count, random_products
+from .pagination import capped_count, page_size, paginate
+from . import reservations
+from .pricing import price_cart
+from .search import filter_products, search_products
+from .suggest import suggest
 from order_management.models import Order, OrderItem
 from payments.models import Payment
+from payments import webhooks
 
 
 # -------------------------------------------------
@@ -28,7 +33,9 @@ def shop_home(request):
     from blog.models import Post
     from django.db.models import Q
     
-    products = Product.objects.order_by('?')[:48]
+    products = random_products(
+        48, queryset=Product.objects.with_discounts().select_related('category_ref')
+    )
     # Get 4 random published posts, excluding any with "Test" or "test" in title
     recent_blogs = Post.objects.filter(
         is_published=True
@@ -131,31 +138,24 @@ def add_to_cart(request, product_id):
 @login_required
 def view_cart(request):
     cart = get_user_cart(request.user)
-    items = []
-
-    for item in cart.items.all():
-        items.append({
-            'id': item.id,
-            'product': item.product.name,
-            'size': item.size,
-            'quantity': item.quantity,
-            'price': float(item.product.price),
-            'subtotal': float(item.subtotal())
-        })
-
-    # compute shipping fee (5%) and final total
-    try:
-        subtotal = Decimal(str(cart.total_price()))
-    except Exception:
-        subtotal = Decimal('0.00')
-    delivery_fee = (subtotal * Decimal('0.05')).quantize(Decimal('0.01'))
-    final_total = (subtotal + delivery_fee).quantize(Decimal('0.01'))
+    pricing = price_cart(cart)
+    items = [
+        {
+            'id': line.item.id,
+            'product': line.product.name,
+            'size': line.size,
+            'quantity': line.quantity,
+            'price': float(line.original_price),
+            'subtotal': float(line.subtotal),
+        }
+        for line in pricing
+    ]
 
     return render(request, 'shop/cart.html', {
         'items': items,
-        'subtotal': subtotal,
-        'delivery_fee': delivery_fee,
-        'total': final_total,
+        'subtotal': pricing.subtotal,
+        'delivery_fee': pricing.delivery_fee,
+        'total': pricing.total,
     })
 
 
@@ -205,21 +205,18 @@ def remove_from_cart(request, item_id):
 @login_required
 def checkout_page(request):
     cart = get_user_cart(request.user)
-    cart_items = cart.items.all()
+    pricing = price_cart(cart)
 
-    if not cart_items.exists():
+    if not pricing:
         messages.error(request, 'Your cart is empty')
         return redirect('shop:view_cart')
 
     # Ensure quantities do not exceed available stock just before checkout
     adjusted = False
-    for it in list(cart_items):
-        available = 0
-        if it.size:
-            ps = ProductSize.objects.filter(product=it.product, size=it.size).first()
-            available = int(ps.quantity) if ps else 0
-        else:
-            available = int(it.product.stock)
+    stock = reservations.available((line.product.pk, line.size) for line in pricing)
+    for line in pricing:
+        it = line.item
+        available = stock[(it.product_id, it.size or '')]
 
         if it.quantity > available:
             if available <= 0:
@@ -230,8 +227,8 @@ def checkout_page(request):
             adjusted = True
 
     if adjusted:
-        cart_items = cart.items.all()
-        if not cart_items.exists():
+        pricing = price_cart(cart)
+        if not pricing:
             messages.error(request, 'Some items are out of stock and were removed.')
             return redirect('shop:view_cart')
         messages.warning(request, 'Some item quantities were adjusted to available stock.')
@@ -247,26 +244,23 @@ def checkout_page(request):
         except Exception:
             age_seconds = 0
 
-        GRACE_PERIOD = 30  # 30 seconds
-        if age_seconds <= GRACE_PERIOD:
+        if age_seconds <= reservations.grace_period().total_seconds():
             messages.error(request, 'You have a pending order. Complete payment first.')
             return redirect('payments:countdown', order_id=latest.id)
         else:
             # cancel stale pending orders so user can create a new one
+            stale = list(pending_qs)
             pending_qs.update(status='cancelled')
+            for old in stale:
+                reservations.release(old)
             messages.info(request, 'An older pending order was cancelled so you can place a new order.')
 
-    # server-side subtotal calculation from cart
-    subtotal = Decimal('0.00')
-    for it in cart_items:
-        # assume CartItem.subtotal() exists, else compute
-        try:
-            subtotal += Decimal(str(it.subtotal()))
-        except Exception:
-            subtotal += Decimal(str(it.product.price)) * it.quantity
-
-    delivery_fee = (subtotal * Decimal('0.05')).quantize(Decimal('0.01'))
-    final_total = (subtotal + delivery_fee).quantize(Decimal('0.01'))
+    context = {
+        'cart_items': pricing.lines,
+        'subtotal': pricing.subtotal,
+        'delivery_fee': pricing.delivery_fee,
+        'final_total': pricing.total,
+    }
 
     if request.method == "POST":
         address = request.POST.get('address')
@@ -274,60 +268,40 @@ def checkout_page(request):
 
         if not address or not address.strip():
             messages.error(request, 'Please enter a delivery address')
-            return render(request, 'shop/checkout.html', {
-                'cart_items': cart_items,
-                'subtotal': subtotal,
-                'delivery_fee': delivery_fee,
-                'final_total': final_total
-            })
-
-        with transaction.atomic():
-            # create order with zero totals; will compute from items
-            order = Order.objects.create(
-                user=request.user,
-                delivery_address=address,
-                delivery_fee=delivery_fee,
-                **({"total_amount": Decimal("0.00")} if hasattr(Order, "total_amount") else {}),
-                **({"total_price": Decimal("0.00")} if hasattr(Order, "total_price") else {}),
-                **({"final_total": Decimal("0.00")} if hasattr(Order, "final_total") else {}),
-            )
+            return render(request, 'shop/checkout.html', context)
 
-            total = Decimal("0.00")
-            for ci in cart_items:
-                unit_price = Decimal(str(ci.product.price or 0))
-                OrderItem.objects.create(
-                    order=order,
-                    product=ci.product,
-                    quantity=ci.quantity,
-                    size=ci.size,
-                    price=unit_price  # persist unit price
+        try:
+            with transaction.atomic():
+                # The header goes in with its final totals, from the same pricing pass as the page.
+                order = Order.objects.create(
+                    user=request.user,
+                    delivery_address=address,
+                    delivery_fee=pricing.delivery_fee,
+                    total_amount=pricing.subtotal,
+                    final_total=pricing.total,
                 )
-                total += unit_price * ci.quantity
-
-            update_fields = []
-            if hasattr(order, "total_amount"):
-                order.total_amount = total
-                update_fields.append("total_amount")
-            if hasattr(order, "total_price"):
-                order.total_price = total
-                update_fields.append("total_price")
-            if hasattr(order, "final_total"):
-                order.final_total = total + (order.delivery_fee or Decimal("0.00"))
-                update_fields.append("final_total")
-            order.save(update_fields=update_fields or None)
-
-            Payment.objects.create(order=order, method=method)
-            cart_items.delete()
+                # Take the stock now; raises InsufficientStock (rolling back) if a line sold out.
+                reservations.reserve(order, [(line.product.pk, line.size, line.quantity) for line in pricing])
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product=line.product,
+                        quantity=line.quantity,
+                        size=line.size,
+                        price=line.unit_price,  # persist unit price actually charged
+                    )
+                    for line in pricing
+                ])
+                Payment.objects.create(order=order, method=method)
+                CartItem.objects.filter(pk__in=[line.item.pk for line in pricing]).delete()
+        except reservations.InsufficientStock:
+            messages.error(request, 'Some items sold out while you were checking out. Please review your cart.')
+            return redirect('shop:view_cart')
 
         return redirect('payments:countdown', order_id=order.id)
 
     # GET render
-    return render(request, 'shop/checkout.html', {
-        'cart_items': cart_items,
-        'subtotal': subtotal,
-        'delivery_fee': delivery_fee,
-        'final_total': final_total
-    })
+    return render(request, 'shop/checkout.html', context)
 
 
 # -------------------------------------------------
@@ -429,34 +403,65 @@ def category_list(request):
     return render(request, 'shop/category_list.html', {'categories': categories})
 
 
-def category_products(request, slug):
-    """Display products by category with subcategory filtering"""
-    category = get_object_or_404(Category, slug=slug)
-    subcategories = category.subcategories.all()
-    
-    # Get filter parameters
+def _category_listing(request, category):
+    """Products in ``category`` narrowed by the ``subcategory`` and ``q`` parameters."""
     subcategory_slug = request.GET.get('subcategory')
     search_query = request.GET.get('q', '')
-    
-    # Base query
-    products = Product.objects.filter(category_ref=category)
-    
-    # Apply subcategory filter
+
+    products = Product.objects.with_discounts().filter(category_ref=category)
     if subcategory_slug:
         subcategory = get_object_or_404(Subcategory, slug=subcategory_slug, category=category)
         products = products.filter(subcategory=subcategory)
-    
-    # Apply search within category
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        products = filter_products(products, search_query, fields=('name', 'description'))
+    return products, subcategory_slug, search_query
+
+
+def _product_json(p):
+    """Serialize a product (annotated by ``with_discounts()``) for the JSON listing APIs."""
+    # Always return media URL for image
+    if p.image:
+        image_url = f"/media/{str(p.image)}"
+    else:
+        image_url = "/media/photos/default photo.jpg"
+
+    # Get discount info
+    discount_info = p.discount_info
+
+    return {
+        'id': p.id,
+        'name': p.name,
+        'price': float(p.price),
+        'discounted_price': float(discount_info['discounted_price']),
+        'has_discount': discount_info['has_discount'],
+        'discount_percentage': discount_info['percentage'],
+        'savings': float(discount_info['savings']),
+        'category': getattr(p.category_ref, 'name', None) or p.category or 'Uncategorized',
+        'image': image_url,
+        'url': reverse('shop:product_detail', args=[p.id]),
+    }
+
+
+def category_products(request, slug):
+    """Display products by category with subcategory filtering, one cursor page at a time"""
+    category = get_object_or_404(Category, slug=slug)
+    subcategories = category.subcategories.all()
+    products, subcategory_slug, search_query = _category_listing(request, category)
+
+    page = paginate(
+        products,
+        cursor=request.GET.get('cursor'),
+        per_page=page_size(request.GET.get('per_page'), 'CATEGORY_PAGE_SIZE'),
+    )
+    total, total_qualifier = capped_count(products)
     
     context = {
         'category': category,
         'subcategories': subcategories,
-        'products': products,
+        'products': page.items,
+        'page': page,
+        'total': total,
+        'total_qualifier': total_qualifier,
         'search_query': search_query,
         'selected_subcategory': subcategory_slug
     }
@@ -464,168 +469,112 @@ def category_products(request, slug):
     return render(request, 'shop/category_products.html', context)
 
 
+def category_products_api(request, slug):
+    """JSON variant of ``category_products`` for infinite scroll: ?cursor=&subcategory=&q=&per_page="""
+    category = get_object_or_404(Category, slug=slug)
+    products, _, _ = _category_listing(request, category)
+    page = paginate(
+        products.select_related('category_ref'),
+        cursor=request.GET.get('cursor'),
+        per_page=page_size(request.GET.get('per_page'), 'CATEGORY_PAGE_SIZE'),
+    )
+    return JsonResponse({
+        'products': [_product_json(p) for p in page],
+        'next_cursor': page.next_cursor,
+    })
+
+
 def global_search(request):
-    """Global search across all products"""
+    """
+    Global search across all products, ranked by relevance (numbered pages)
+    or, with ?sort=newest, newest first (cursor pages).
+    """
     query = request.GET.get('q', '')
+    sort = 'newest' if request.GET.get('sort') == 'newest' else 'relevance'
     products = []
     count = 0
+    count_qualifier = ''
+    page = None
+    cursor_page = None
     
     if query:
-        products = Product.objects.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(category__icontains=query) |
-            Q(category_ref__name__icontains=query)
-        ).distinct()
-        count = products.count()
+        queryset = Product.objects.with_discounts().select_related('category_ref')
+        if sort == 'newest':
+            matches = filter_products(queryset, query)
+            cursor_page = paginate(
+                matches,
+                cursor=request.GET.get('cursor'),
+                per_page=page_size(request.GET.get('per_page'), 'SEARCH_PAGE_SIZE'),
+            )
+            products = cursor_page.items
+            count, count_qualifier = capped_count(matches)
+        else:
+            page = search_products(
+                query,
+                page=request.GET.get('page', 1),
+                per_page=page_size(request.GET.get('per_page'), 'SEARCH_PAGE_SIZE'),
+                queryset=queryset,
+            )
+            products = page.products
+            count = page.total
     
     return render(request, 'shop/search_results.html', {
         'query': query,
+        'sort': sort,
         'products': products,
-        'count': count
+        'count': count,
+        'count_qualifier': count_qualifier,
+        'page_obj': page,
+        'cursor_page': cursor_page,
+    })
+
+
+def search_api(request):
+    """JSON search results, newest first, for infinite scroll: ?q=&cursor=&per_page="""
+    query = request.GET.get('q', '')
+    if not query:
+        return JsonResponse({'products': [], 'next_cursor': None})
+    page = paginate(
+        filter_products(Product.objects.with_discounts().select_related('category_ref'), query),
+        cursor=request.GET.get('cursor'),
+        per_page=page_size(request.GET.get('per_page'), 'SEARCH_PAGE_SIZE'),
+    )
+    return JsonResponse({
+        'products': [_product_json(p) for p in page],
+        'next_cursor': page.next_cursor,
     })
 
 
 def random_products_api(request):
     """Return a random set of products for homepage auto-refresh with discount information."""
-    count = int(request.GET.get('count', 24))
-    items = []
-    for p in Product.objects.order_by('?')[:count]:
-        # Always return media URL for image
-        if p.image:
-            image_url = f"/media/{str(p.image)}"
-        else:
-            image_url = "/media/photos/default photo.jpg"
-        
-        # Get discount info
-        discount_info = p.discount_info
-        
-        items.append({
-            'id': p.id,
-            'name': p.name,
-            'price': float(p.price),
-            'discounted_price': float(discount_info['discounted_price']),
-            'has_discount': discount_info['has_discount'],
-            'discount_percentage': discount_info['percentage'],
-            'savings': float(discount_info['savings']),
-            'category': getattr(p.category_ref, 'name', None) or p.category or 'Uncategorized',
-            'image': image_url
-        })
+    count = clamp_count(request.GET.get('count'), default=24)
+    stratify = request.GET.get('stratify') in ('1', 'true')
+    products = random_products(
+        count,
+        queryset=Product.objects.with_discounts().select_related('category_ref'),
+        stratify=stratify,
+    )
+    items = [_product_json(p) for p in products]
     return JsonResponse({'products': items})
 
 
-def _fuzzy_find(names, query, limit=5):
-    """Return close matches for a misspelled query using simple ratio."""
-    try:
-        from difflib import get_close_matches
-        return get_close_matches(query, names, n=limit, cutoff=0.6)
-    except Exception:
-        return []
-
-
 def suggestions_api(request):
     """Return autocomplete suggestions for header/category search.
-    - Blends partial (`icontains`) and fuzzy matches
+    - Blends partial (contains) and fuzzy matches from the in-memory index
     - Optional scoping by category slug via ?category=<slug>
     - Caps and deduplicates results
     """
     q = (request.GET.get('q') or '').strip()
     category_slug = request.GET.get('category')
-    limit_total = int(request.GET.get('limit', 8))
-
-    suggestions = []
-    seen = set()  # track (type,label)
-    def add_suggestion(it):
-        key = (it['type'], it['label'])
-        if key in seen:
-            return False
-        seen.add(key)
-        suggestions.append(it)
-        return True
+    try:
+        limit_total = max(1, min(int(request.GET.get('limit', 8)), 20))
+    except ValueError:
+        limit_total = 8
 
     if not q:
-        return JsonResponse({'suggestions': suggestions})
-
-    # 1) Exact/partial contains
-    # Categories
-    for c in Category.objects.filter(name__icontains=q).order_by('name')[:5]:
-        if len(suggestions) >= limit_total: break
-        add_suggestion({
-            'type': 'category', 'label': c.name, 'slug': c.slug,
-            'url': reverse('shop:category_products', args=[c.slug])
-        })
-
-    # Subcategories (scoped to category if provided)
-    sub_qs = Subcategory.objects.all()
-    if category_slug:
-        sub_qs = sub_qs.filter(category__slug=category_slug)
-    for s in sub_qs.filter(name__icontains=q).order_by('name')[:5]:
-        if len(suggestions) >= limit_total: break
-        add_suggestion({
-            'type': 'subcategory', 'label': s.name, 'slug': s.slug, 'category': s.category.slug,
-            'url': reverse('shop:category_products', args=[s.category.slug]) + f'?subcategory={s.slug}'
-        })
-
-    # Products by name (contains)
-    for p in Product.objects.filter(name__icontains=q).order_by('name')[:5]:
-        if len(suggestions) >= limit_total: break
-        add_suggestion({
-            'type': 'product', 'label': p.name, 'id': p.id,
-            'url': reverse('shop:product_detail', args=[p.id])
-        })
-
-    # 2) Fuzzy matches (added even when partial matches exist, until reaching limit)
-    remaining = max(0, limit_total - len(suggestions))
-    if remaining > 0:
-        # Fuzzy Categories
-        all_cat_names = list(Category.objects.values_list('name', flat=True))
-        for name in _fuzzy_find(all_cat_names, q, limit=remaining):
-            c = Category.objects.filter(name=name).first()
-            if c and add_suggestion({
-                'type': 'category', 'label': c.name, 'slug': c.slug,
-                'url': reverse('shop:category_products', args=[c.slug])
-            }):
-                remaining = max(0, limit_total - len(suggestions))
-                if remaining == 0:
-                    break
-
-    remaining = max(0, limit_total - len(suggestions))
-    if remaining > 0:
-        # Fuzzy Subcategories (respect category scope)
-        sub_names_qs = Subcategory.objects.all()
-        if category_slug:
-            sub_names_qs = sub_names_qs.filter(category__slug=category_slug)
-        all_sub_names = list(sub_names_qs.values_list('name', flat=True))
-        for name in _fuzzy_find(all_sub_names, q, limit=remaining):
-            s = Subcategory.objects.filter(name=name).first()
-            if s and add_suggestion({
-                'type': 'subcategory', 'label': s.name, 'slug': s.slug, 'category': s.category.slug,
-                'url': reverse('shop:category_products', args=[s.category.slug]) + f'?subcategory={s.slug}'
-            }):
-                remaining = max(0, limit_total - len(suggestions))
-                if remaining == 0:
-                    break
-
-    remaining = max(0, limit_total - len(suggestions))
-    if remaining > 0:
-        # Fuzzy Products: scope by category if provided; otherwise prefilter by first 3 chars to improve recall
-        prod_qs = Product.objects.all()
-        if category_slug:
-            prod_qs = prod_qs.filter(category_ref__slug=category_slug)
-        if len(q) >= 3 and not category_slug:
-            prod_qs = prod_qs.filter(name__icontains=q[:3])
-        # cap candidate pool size
-        candidate_names = list(prod_qs.values_list('name', flat=True)[:1000])
-        for name in _fuzzy_find(candidate_names, q, limit=remaining):
-            p = Product.objects.filter(name=name).first()
-            if p and add_suggestion({
-                'type': 'product', 'label': p.name, 'id': p.id,
-                'url': reverse('shop:product_detail', args=[p.id])
-            }):
-                remaining = max(0, limit_total - len(suggestions))
-                if remaining == 0:
-                    break
+        return JsonResponse({'suggestions': []})
 
+    suggestions = suggest(q, category_slug=category_slug, limit=limit_total)
     return JsonResponse({'suggestions': suggestions, 'count': len(suggestions)})
 
 
@@ -637,59 +586,27 @@ from django.utils.decorators import method_decorator
 from django.views import View
 from django.http import HttpResponse
 
-import json
-import datetime
 
 @method_decorator(csrf_exempt, name='dispatch')
 class PaymentWebhook(View):
-    """Handle asynchronous payment notifications from the payment gateway."""
+    """
+    Accept asynchronous payment notifications from the payment gateway.
+
+    Notifications are only queued here and acknowledged straight away;
+    retries of one already queued are acknowledged without queueing it
+    again. ``manage.py process_webhooks`` applies them (see payments.webhooks).
+    Bodies not signed with ``PAYMENT_WEBHOOK_SECRET`` are refused.
+    """
     def post(self, request, *args, **kwargs):
-        # 1. Parse the JSON payload
+        if not webhooks.verify_signature(request.body, request.headers.get(webhooks.SIGNATURE_HEADER)):
+            return HttpResponse(status=403)
         try:
-            payload = json.loads(request.body)
-        except json.JSONDecodeError:
+            payload = webhooks.parse(request.body)
+        except webhooks.InvalidPayload:
             return HttpResponse(status=400)
 
-        # 2. Validate the payload (basic example, expand as needed)
-        required_fields = ['order_id', 'status', 'amount', 'currency']
-        if not all(field in payload for field in required_fields):
-            return HttpResponse(status=400)
-
-        # 3. Extract data
-        order_id = payload['order_id']
-        status = payload['status']
-        amount = payload['amount']
-        currency = payload['currency']
-
-        # 4. Update the order in the database
-        try:
-            order = Order.objects.get(id=order_id)
-            order.status = status
-            order.paid_amount = amount  # Update the paid amount
-            order.payment_date = datetime.datetime.now()  # Set the payment date
-            order.save()
-
-            # If payment is successful, you might want to update stock, etc.
-            if status == 'successful':
-                for item in order.items.all():
-                    # For each item in the order, reduce the stock quantity
-                    if item.size:
-                        # If the item has a size, find the corresponding ProductSize
-                        product_size = ProductSize.objects.get(product=item.product, size=item.size)
-                        product_size.quantity -= item.quantity
-                        product_size.save()
-                    else:
-                        # For non-sized items, reduce the general product stock
-                        item.product.stock -= item.quantity
-                        item.product.save()
-
-        except Order.DoesNotExist:
-            return HttpResponse(status=404)
-        except Exception as e:
-            # Log the exception e
-            return HttpResponse(status=500)
-
-        # 5. Send a 200 OK response to acknowledge receipt of the webhook
+        key = webhooks.idempotency_key(payload, request.headers.get('Idempotency-Key'))
+        webhooks.ingest(payload, key)
         return HttpResponse(status=200)
 
 @login_required
@@ -697,23 +614,6 @@ def confirm_payment(request, order_id):
     """Finalize: backfill missing item prices and recompute totals."""
     order = get_object_or_404(Order, id=order_id, user=request.user)
     with transaction.atomic():
-        total = Decimal("0.00")
-        for item in order.items.select_related('product').all():
-            if item.price is None or item.price == 0:
-                item.price = Decimal(str(getattr(item.product, "price", 0) or 0))
-                item.save(update_fields=["price"])
-            total += item.price * item.quantity
-
-        fields = []
-        if hasattr(order, "total_amount"):
-            order.total_amount = total
-            fields.append("total_amount")
-        if hasattr(order, "total_price"):
-            order.total_price = total
-            fields.append("total_price")
-        if hasattr(order, "final_total"):
-            order.final_total = total + (order.delivery_fee or Decimal("0.00"))
-            fields.append("final_total")
-        order.save(update_fields=fields or None)
+        order.recalc_totals(include_zero=True)
 
     return redirect('shop:orders_list')
\ No newline at end of file
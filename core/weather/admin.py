@@ -3,7 +3,7 @@
 Customizes the admin interface for managing weather search history.
 """
 from django.contrib import admin
-from .models import SearchHistory
+from .models import CityWeatherHourly, SearchHistory
 
 
 @admin.register(SearchHistory)
@@ -27,4 +27,20 @@ class SearchHistoryAdmin(admin.ModelAdmin):
     def get_readonly_fields(self, request, obj=None):
         if obj:  # Editing an existing object
             return ["searched_at"]
-        return []
\ No newline at end of file
+        return []
+
+
+@admin.register(CityWeatherHourly)
+class CityWeatherHourlyAdmin(admin.ModelAdmin):
+    """Read-only view of the hourly rollups kept by ``weather.history``."""
+
+    list_display = ["city_name", "hour", "searches", "temp_min", "temp_max", "temperature"]
+    list_filter = ["hour"]
+    search_fields = ["city_name"]
+    date_hierarchy = "hour"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class WeatherConfig(AppConfig):
     name = 'weather'
+
+    def ready(self):
+        import weather.signals
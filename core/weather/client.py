@@ -0,0 +1,237 @@
+"""
+Weather lookups for the weather views.
+
+``lookup(city)`` answers from, in order:
+
+1. the cache, for ``WEATHER_CACHE_TTL`` seconds after a reading was taken;
+2. the latest ``SearchHistory`` row for the city, if its reading is that
+   fresh too (after a restart or a cache eviction);
+3. the weather service, through ``WEATHER_BACKEND``.
+
+Concurrent lookups for the same city in a process share one upstream call:
+the first caller fetches, the others wait for its result (for at most the
+request timeout) instead of each sending their own request.
+
+The backend keeps a pool of HTTP connections to the service and gives up
+on a request after ``WEATHER_TIMEOUT`` seconds, so a slow service ties up a
+worker for a few seconds, not indefinitely. After ``WEATHER_FAILURE_THRESHOLD``
+consecutive failures the client stops calling the service for
+``WEATHER_FAILURE_COOLDOWN`` seconds, and lookups are answered from the last
+reading in ``SearchHistory`` (up to ``WEATHER_STALE_TTL`` seconds old, marked
+``stale``) or fail at once with ``WeatherUnavailable``.
+
+Tests and development can point ``WEATHER_API_URL`` at a local server, or
+``WEATHER_BACKEND`` at any class with a ``fetch(city)`` method.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+DEFAULT_URL = 'https://api.openweathermap.org/data/2.5/weather'
+DEFAULT_TIMEOUT = (3, 5)  # seconds to connect, seconds to wait for the response
+DEFAULT_CACHE_TTL = 600
+DEFAULT_STALE_TTL = 6 * 3600
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class WeatherError(Exception):
+    """A lookup failed; the message can be shown to the user."""
+
+
+class CityNotFound(WeatherError):
+    pass
+
+
+class WeatherUnavailable(WeatherError):
+    pass
+
+
+def normalize(city):
+    """The name a city is displayed and recorded under."""
+    return ' '.join(city.split()).capitalize()
+
+
+class OpenWeatherMapBackend:
+    """Current weather from OpenWeatherMap over a pooled ``requests.Session``."""
+
+    def __init__(self, api_key=None, url=None, timeout=None, pool_size=None):
+        self.api_key = api_key if api_key is not None else getattr(settings, 'WEATHER_API_KEY', '')
+        self.url = url or getattr(settings, 'WEATHER_API_URL', DEFAULT_URL)
+        self.timeout = timeout or getattr(settings, 'WEATHER_TIMEOUT', DEFAULT_TIMEOUT)
+        pool_size = pool_size or getattr(settings, 'WEATHER_POOL_SIZE', 10)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, city):
+        if not self.api_key:
+            raise WeatherUnavailable('Weather API key is not configured.')
+        try:
+            response = self.session.get(
+                self.url, params={'q': city, 'appid': self.api_key, 'units': 'metric'}, timeout=self.timeout
+            )
+            data = response.json()
+        except (requests.RequestException, ValueError) as exc:
+            raise WeatherUnavailable('Weather service is unreachable.') from exc
+        if response.status_code == 404:
+            raise CityNotFound(data.get('message', 'City not found').capitalize())
+        if response.status_code != 200 or not data.get('main'):
+            raise WeatherUnavailable(data.get('message', 'Error fetching weather'))
+        main = data['main']
+        condition = (data.get('weather') or [{}])[0]
+        return {
+            'city': normalize(city),
+            'temp': main.get('temp'),
+            'feels_like': main.get('feels_like'),
+            'humidity': main.get('humidity'),
+            'wind_speed': (data.get('wind') or {}).get('speed'),
+            'condition': (condition.get('description') or '').capitalize(),
+            'icon': condition.get('icon'),
+            'observed_at': timezone.now(),
+        }
+
+
+class WeatherClient:
+    def __init__(self, backend=None):
+        self.backend = backend or import_string(
+            getattr(settings, 'WEATHER_BACKEND', 'weather.client.OpenWeatherMapBackend')
+        )()
+        self.cache_ttl = getattr(settings, 'WEATHER_CACHE_TTL', DEFAULT_CACHE_TTL)
+        self.stale_ttl = getattr(settings, 'WEATHER_STALE_TTL', DEFAULT_STALE_TTL)
+        timeout = getattr(settings, 'WEATHER_TIMEOUT', DEFAULT_TIMEOUT)
+        self.wait = sum(timeout) if isinstance(timeout, (tuple, list)) else timeout
+        self.failure_threshold = getattr(settings, 'WEATHER_FAILURE_THRESHOLD', 5)
+        self.failure_cooldown = getattr(settings, 'WEATHER_FAILURE_COOLDOWN', 30)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+
+    def lookup(self, city):
+        """Current weather for ``city`` as a dict (see ``OpenWeatherMapBackend.fetch``)."""
+        city = normalize(city)
+        if not city:
+            raise CityNotFound('Enter a city name.')
+        reading = cache.get(self._key(city))
+        if reading is not None:
+            return reading
+        reading = self._from_history(city, self.cache_ttl)
+        if reading is not None:
+            self._cache(reading)
+            return reading
+        try:
+            return self.fetch(city)
+        except CityNotFound:
+            raise
+        except WeatherUnavailable:
+            reading = self._from_history(city, self.stale_ttl)
+            if reading is None:
+                raise
+            return {**reading, 'stale': True}
+
+    def fetch(self, city):
+        """Ask the service for ``city``, sharing the call with concurrent callers; caches the reading."""
+        city = normalize(city)
+        with self._lock:
+            future = self._flights.get(city)
+            leader = future is None
+            if leader:
+                future = self._flights[city] = Future()
+        if not leader:
+            try:
+                return future.result(timeout=self.wait)
+            except TimeoutError:
+                raise WeatherUnavailable('Weather service is not responding.') from None
+
+        try:
+            reading = self._call(city)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(reading)
+            self._cache(reading)
+            return reading
+        finally:
+            with self._lock:
+                self._flights.pop(city, None)
+
+    def _call(self, city):
+        if time.monotonic() < self._open_until:
+            raise WeatherUnavailable('Weather service is unavailable; try again shortly.')
+        try:
+            reading = self.backend.fetch(city)
+        except WeatherUnavailable:
+            with self._lock:
+                # Once open, the first call after the cooldown decides: one more failure re-opens it.
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open_until = time.monotonic() + self.failure_cooldown
+            raise
+        with self._lock:
+            self._failures = 0
+        return reading
+
+    @staticmethod
+    def _key(city):
+        return 'weather:' + hashlib.sha1(city.casefold().encode()).hexdigest()
+
+    def _cache(self, reading):
+        age = (timezone.now() - reading['observed_at']).total_seconds()
+        if age < self.cache_ttl:
+            cache.set(self._key(reading['city']), reading, self.cache_ttl - age)
+
+    @staticmethod
+    def _from_history(city, max_age):
+        from .models import SearchHistory
+
+        row = (
+            SearchHistory.objects.filter(city_name=city, temperature__isnull=False, observed_at__isnull=False)
+            .order_by('-searched_at')
+            .first()
+        )
+        if row is None or row.observed_at < timezone.now() - timedelta(seconds=max_age):
+            return None
+        return {
+            'city': row.city_name,
+            'temp': row.temperature,
+            'feels_like': row.feels_like,
+            'humidity': row.humidity,
+            'wind_speed': row.wind_speed,
+            'condition': row.description or '',
+            'icon': row.icon,
+            'observed_at': row.observed_at,
+        }
+
+
+def get_client():
+    """The process-wide ``WeatherClient``, built from settings on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WeatherClient()
+        return _client
+
+
+def reset_client(**kwargs):
+    """Drop the shared client so the next lookup rebuilds it (``setting_changed`` receiver)."""
+    global _client
+    if kwargs.get('setting', 'WEATHER_').startswith('WEATHER_'):
+        with _client_lock:
+            _client = None
+
+
+def lookup(city):
+    return get_client().lookup(city)
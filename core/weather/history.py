@@ -0,0 +1,213 @@
+"""
+Buffered weather search history and its hourly rollups.
+
+Every weather search is recorded, but nothing needs the row the moment it
+is made. ``record()`` appends it to an in-process buffer instead of running
+an INSERT during the request; ``flush()`` writes the buffer with one bulk
+INSERT every ``WEATHER_HISTORY_FLUSH_INTERVAL`` seconds (or as soon as it
+holds ``WEATHER_HISTORY_BATCH_SIZE`` searches, and when the process exits).
+A process that dies loses at most that interval's searches.
+``WEATHER_HISTORY_FLUSH_INTERVAL = 0`` writes each search at once. A flush
+that fails keeps its searches for the next one, but never more than
+``WEATHER_HISTORY_MAX_BUFFER`` in all; the oldest are dropped past that.
+
+The same flush folds the searches into ``CityWeatherHourly``, one row per
+city and hour, with a couple of UPDATEs per city and hour in the batch.
+Pages read the rollups, which stay small, instead of the raw history,
+which ``manage.py prune_weather_history`` trims to its retention period.
+Rows saved individually (the dashboard's *Add weather entry*) are rolled
+up by a ``post_save`` receiver; edits and deletions of raw rows are not
+reflected in the rollups.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.dispatch import Signal
+
+from context_processors import WEATHER, bump_header_version
+from .models import CityWeatherHourly, SearchHistory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_BUFFER = 10000
+DEFAULT_PRUNE_CHUNK = 5000
+LATEST_FIELDS = ('temperature', 'feels_like', 'humidity', 'wind_speed', 'description', 'icon')
+
+# Sent with ``count`` when searches are added to the rollups, in the same transaction.
+searches_recorded = Signal()
+
+_buffer = []
+_lock = threading.Lock()
+_timer = None
+
+
+def record(**fields):
+    """Queue a ``SearchHistory`` row with ``fields`` for the next flush."""
+    global _timer
+    interval = getattr(settings, 'WEATHER_HISTORY_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    batch_size = getattr(settings, 'WEATHER_HISTORY_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    row = SearchHistory(**fields)
+    with _lock:
+        _buffer.append(row)
+        full = interval <= 0 or len(_buffer) >= batch_size
+        if not full and _timer is None:
+            _timer = threading.Timer(interval, _flush_in_background)
+            _timer.daemon = True
+            _timer.start()
+    if full:
+        flush()
+
+
+def pending():
+    with _lock:
+        return len(_buffer)
+
+
+def flush():
+    """Write the buffered searches and update their rollups; returns how many were written."""
+    global _timer
+    with _lock:
+        rows = _buffer[:]
+        _buffer.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not rows:
+        return 0
+    try:
+        with transaction.atomic():
+            SearchHistory.objects.bulk_create(rows)
+            roll_up(rows)
+    except DatabaseError:
+        logger.exception('Could not write %s weather searches; keeping them for the next flush', len(rows))
+        for row in rows:
+            # bulk_create() set ids the rollback discarded; insert them afresh next time.
+            row.pk = None
+            row._state.adding, row._state.db = True, None
+        limit = getattr(settings, 'WEATHER_HISTORY_MAX_BUFFER', DEFAULT_MAX_BUFFER)
+        with _lock:
+            _buffer[:0] = rows
+            dropped = len(_buffer) - limit
+            if dropped > 0:
+                del _buffer[:dropped]
+        if dropped > 0:
+            logger.warning('Weather search buffer full; dropped the %s oldest searches', dropped)
+        return 0
+    return len(rows)
+
+
+def _flush_in_background():
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        flush()
+    finally:
+        connection.close()
+
+
+def hour_of(moment):
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def summarize(rows):
+    """Group ``rows`` by city and hour: ``{(city, hour): totals}``."""
+    groups = {}
+    for row in rows:
+        key = (row.city_name, hour_of(row.searched_at))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                'searches': 0, 'temp_min': None, 'temp_max': None, 'temp_sum': 0.0, 'temp_count': 0,
+                'humidity_sum': 0.0, 'humidity_count': 0, 'latest': row,
+            }
+        group['searches'] += 1
+        temp = row.temperature
+        if temp is not None:
+            group['temp_sum'] += temp
+            group['temp_count'] += 1
+            group['temp_min'] = temp if group['temp_min'] is None else min(group['temp_min'], temp)
+            group['temp_max'] = temp if group['temp_max'] is None else max(group['temp_max'], temp)
+        if row.humidity is not None:
+            group['humidity_sum'] += row.humidity
+            group['humidity_count'] += 1
+        if row.searched_at >= group['latest'].searched_at:
+            group['latest'] = row
+    return groups
+
+
+def roll_up(rows):
+    """Add ``rows`` (saved ``SearchHistory`` rows) to their hourly rollups."""
+    for (city, hour), group in summarize(rows).items():
+        latest = group['latest']
+        hourly = CityWeatherHourly.objects.filter(city_name=city, hour=hour)
+        totals = {
+            'searches': F('searches') + group['searches'],
+            'temp_sum': F('temp_sum') + group['temp_sum'],
+            'temp_count': F('temp_count') + group['temp_count'],
+            'humidity_sum': F('humidity_sum') + group['humidity_sum'],
+            'humidity_count': F('humidity_count') + group['humidity_count'],
+        }
+        if group['temp_count']:
+            # Coalesce: SQLite's MIN()/MAX() of a NULL and a number is NULL.
+            totals['temp_min'] = Least(Coalesce('temp_min', Value(group['temp_min'])), Value(group['temp_min']))
+            totals['temp_max'] = Greatest(Coalesce('temp_max', Value(group['temp_max'])), Value(group['temp_max']))
+        if not hourly.update(**totals):
+            try:
+                with transaction.atomic():
+                    CityWeatherHourly.objects.create(
+                        city_name=city, hour=hour,
+                        **{name: group[name] for name in (
+                            'searches', 'temp_min', 'temp_max', 'temp_sum', 'temp_count',
+                            'humidity_sum', 'humidity_count',
+                        )},
+                        searched_at=latest.searched_at,
+                        **{name: getattr(latest, name) for name in LATEST_FIELDS},
+                    )
+                continue
+            except IntegrityError:
+                # Another process created the row first.
+                hourly.update(**totals)
+        hourly.filter(searched_at__lte=latest.searched_at).update(
+            searched_at=latest.searched_at, **{name: getattr(latest, name) for name in LATEST_FIELDS}
+        )
+    searches_recorded.send(sender=SearchHistory, count=len(rows))
+    transaction.on_commit(lambda: bump_header_version(WEATHER))
+
+
+def prune(before, chunk_size=DEFAULT_PRUNE_CHUNK, pause=0):
+    """
+    Delete raw searches made before ``before``, ``chunk_size`` rows per
+    statement so no single transaction holds locks for long; sleeps
+    ``pause`` seconds between chunks. Returns the number deleted.
+    """
+    old = SearchHistory.objects.filter(searched_at__lt=before)
+    deleted = 0
+    while True:
+        ids = list(old.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        count, _ = SearchHistory.objects.filter(pk__in=ids).delete()
+        deleted += count
+        if pause:
+            time.sleep(pause)
+
+
+def prune_rollups(before):
+    """Delete hourly rollups for hours before ``before``; returns the number deleted."""
+    count, _ = CityWeatherHourly.objects.filter(hour__lt=before).delete()
+    if count:
+        bump_header_version(WEATHER)
+    return count
+
+
+atexit.register(flush)
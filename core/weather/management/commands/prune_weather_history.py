@@ -0,0 +1,37 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from weather import history
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete weather searches older than --days in chunks. Their hourly rollups "
+        "are kept (for --rollup-days, if given)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Keep raw searches for this many days.")
+        parser.add_argument("--chunk-size", type=int, default=history.DEFAULT_PRUNE_CHUNK)
+        parser.add_argument("--pause", type=float, default=0, help="Seconds to sleep between chunks.")
+        parser.add_argument(
+            "--rollup-days",
+            type=int,
+            default=None,
+            help="Also delete hourly rollups older than this many days.",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        start = time.perf_counter()
+        deleted = history.prune(
+            now - timedelta(days=options["days"]), max(1, options["chunk_size"]), options["pause"]
+        )
+        self.stdout.write(f"Deleted {deleted} search(es) in {time.perf_counter() - start:.2f}s.")
+        if options["rollup_days"] is not None:
+            rollups = history.prune_rollups(now - timedelta(days=options["rollup_days"]))
+            self.stdout.write(f"Deleted {rollups} hourly rollup(s).")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from weather import popular
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch current weather for the most searched cities and store it for the "
+        "header. Runs once, or every --interval seconds with --loop. Needs a cache "
+        "shared with the web workers (not LocMemCache or DummyCache)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep refreshing.")
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=getattr(settings, "WEATHER_POPULAR_REFRESH", popular.DEFAULT_INTERVAL),
+            help="Seconds between refreshes.",
+        )
+        parser.add_argument("--cities", type=int, default=None, help="How many cities to keep fresh.")
+
+    def handle(self, *args, **options):
+        if not popular.cache_is_shared():
+            raise CommandError(
+                "The default cache is per-process, so the web workers would never see the "
+                "snapshot. Set CACHE_BACKEND to a shared cache (e.g. Redis) first."
+            )
+        while True:
+            start = time.monotonic()
+            cities = popular.popular_cities(options["cities"])
+            entries = popular.refresh(cities, interval=options["interval"])
+            self.stdout.write(
+                f"Refreshed {len(entries)} of {len(cities)} cities in {time.monotonic() - start:.2f}s: "
+                + ", ".join(entry["city_name"] for entry in entries)
+            )
+            if not options["loop"]:
+                break
+            close_old_connections()
+            time.sleep(max(0, options["interval"] - (time.monotonic() - start)))
+
+        self.stdout.write(self.style.SUCCESS("Done."))
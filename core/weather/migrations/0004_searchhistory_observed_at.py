@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0003_alter_searchhistory_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchhistory',
+            name='observed_at',
+            field=models.DateTimeField(blank=True, help_text='When the weather service reported these values (a search answered from cache repeats them)', null=True),
+        ),
+    ]
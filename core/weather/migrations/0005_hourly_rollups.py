@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:44
+
+from datetime import timezone
+
+import django.utils.timezone
+from django.db import migrations, models
+
+LATEST_FIELDS = ('temperature', 'feels_like', 'humidity', 'wind_speed', 'description', 'icon')
+
+
+def backfill_rollups(apps, schema_editor):
+    SearchHistory = apps.get_model('weather', 'SearchHistory')
+    CityWeatherHourly = apps.get_model('weather', 'CityWeatherHourly')
+    rollups = {}
+    for row in SearchHistory.objects.order_by('searched_at', 'pk').iterator(chunk_size=2000):
+        hour = row.searched_at.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        hourly = rollups.get((row.city_name, hour))
+        if hourly is None:
+            hourly = rollups[row.city_name, hour] = CityWeatherHourly(city_name=row.city_name, hour=hour)
+        hourly.searches += 1
+        if row.temperature is not None:
+            hourly.temp_sum += row.temperature
+            hourly.temp_count += 1
+            hourly.temp_min = min(row.temperature, hourly.temp_min if hourly.temp_min is not None else row.temperature)
+            hourly.temp_max = max(row.temperature, hourly.temp_max if hourly.temp_max is not None else row.temperature)
+        if row.humidity is not None:
+            hourly.humidity_sum += row.humidity
+            hourly.humidity_count += 1
+        hourly.searched_at = row.searched_at
+        for name in LATEST_FIELDS:
+            setattr(hourly, name, getattr(row, name))
+    CityWeatherHourly.objects.bulk_create(rollups.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0004_searchhistory_observed_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='searchhistory',
+            name='searched_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.CreateModel(
+            name='CityWeatherHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city_name', models.CharField(max_length=100)),
+                ('hour', models.DateTimeField(help_text='Start of the hour (UTC)')),
+                ('searches', models.PositiveIntegerField(default=0)),
+                ('temp_min', models.FloatField(blank=True, null=True)),
+                ('temp_max', models.FloatField(blank=True, null=True)),
+                ('temp_sum', models.FloatField(default=0)),
+                ('temp_count', models.PositiveIntegerField(default=0)),
+                ('humidity_sum', models.FloatField(default=0)),
+                ('humidity_count', models.PositiveIntegerField(default=0)),
+                ('searched_at', models.DateTimeField()),
+                ('temperature', models.FloatField(blank=True, null=True)),
+                ('feels_like', models.FloatField(blank=True, null=True)),
+                ('humidity', models.IntegerField(blank=True, null=True)),
+                ('wind_speed', models.FloatField(blank=True, null=True)),
+                ('description', models.CharField(blank=True, max_length=120, null=True)),
+                ('icon', models.CharField(blank=True, max_length=8, null=True)),
+            ],
+            options={
+                'verbose_name': 'Hourly city weather',
+                'verbose_name_plural': 'Hourly city weather',
+                'ordering': ['-hour'],
+                'indexes': [models.Index(fields=['-searched_at'], name='weather_cit_searche_4da1b4_idx'), models.Index(fields=['hour'], name='weather_cit_hour_c07b8a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('city_name', 'hour'), name='weather_hourly_city_hour')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
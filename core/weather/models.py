@@ -5,6 +5,7 @@ Stores user weather searches and associated weather metrics for
 reporting and caching purposes.
 """
 from django.db import models
+from django.utils import timezone
 
 
 class SearchHistory(models.Model):
@@ -31,7 +32,12 @@ class SearchHistory(models.Model):
     icon = models.CharField(
         max_length=8, null=True, blank=True, help_text="Weather icon code"
     )
-    searched_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Set when the search happens, not when the buffered row is written (weather/history.py).
+    searched_at = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
+    observed_at = models.DateTimeField(
+        null=True, blank=True,
+        help_text="When the weather service reported these values (a search answered from cache repeats them)",
+    )
 
     class Meta:
         ordering = ["-searched_at"]
@@ -42,3 +48,55 @@ class SearchHistory(models.Model):
 
     def __str__(self):
         return f"{self.city_name} - {self.searched_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class CityWeatherHourly(models.Model):
+    """
+    One city's searches in one hour, rolled up from ``SearchHistory``.
+
+    Holds the search count, the sums and bounds needed for mean, min and max
+    temperature and mean humidity, and the latest reading of the hour (under
+    the same field names as ``SearchHistory``, so templates can show either).
+    """
+
+    city_name = models.CharField(max_length=100)
+    hour = models.DateTimeField(help_text="Start of the hour (UTC)")
+    searches = models.PositiveIntegerField(default=0)
+    temp_min = models.FloatField(null=True, blank=True)
+    temp_max = models.FloatField(null=True, blank=True)
+    temp_sum = models.FloatField(default=0)
+    temp_count = models.PositiveIntegerField(default=0)
+    humidity_sum = models.FloatField(default=0)
+    humidity_count = models.PositiveIntegerField(default=0)
+
+    # Latest reading of the hour.
+    searched_at = models.DateTimeField()
+    temperature = models.FloatField(null=True, blank=True)
+    feels_like = models.FloatField(null=True, blank=True)
+    humidity = models.IntegerField(null=True, blank=True)
+    wind_speed = models.FloatField(null=True, blank=True)
+    description = models.CharField(max_length=120, null=True, blank=True)
+    icon = models.CharField(max_length=8, null=True, blank=True)
+
+    class Meta:
+        ordering = ["-hour"]
+        verbose_name = "Hourly city weather"
+        verbose_name_plural = "Hourly city weather"
+        constraints = [
+            models.UniqueConstraint(fields=["city_name", "hour"], name="weather_hourly_city_hour"),
+        ]
+        indexes = [
+            models.Index(fields=["-searched_at"]),
+            models.Index(fields=["hour"]),
+        ]
+
+    def __str__(self):
+        return f"{self.city_name} - {self.hour.strftime('%Y-%m-%d %H:00')}"
+
+    @property
+    def temp_mean(self):
+        return self.temp_sum / self.temp_count if self.temp_count else None
+
+    @property
+    def humidity_mean(self):
+        return self.humidity_sum / self.humidity_count if self.humidity_count else None
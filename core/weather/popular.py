@@ -0,0 +1,122 @@
+"""
+Fresh weather for the most searched cities, for the header.
+
+``refresh()`` (run by ``manage.py refresh_popular_weather --loop``) takes
+the ``WEATHER_POPULAR_CITIES`` cities searched most over the last
+``WEATHER_POPULAR_DAYS`` days, per the hourly rollups, fetches their
+current weather on a small thread pool, and stores the readings as one
+snapshot in the cache. The header shows that snapshot, so rendering a page
+costs a cache read and never waits on, or causes, a call to the weather
+service. Without a snapshot (the refresher is not running, or its last
+snapshot expired) the header falls back to the latest readings in the
+rollups.
+
+The refresher runs in its own process, so the snapshot and the header
+version it bumps only reach the web workers through a shared cache
+(Redis, Memcached, the database or files). The command refuses to run on
+a per-process backend (``LocMemCache``, ``DummyCache``), where they would
+never be seen.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Sum
+from django.utils import timezone
+
+from context_processors import WEATHER, bump_header_version
+from . import client
+from .models import CityWeatherHourly
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'weather:popular'
+DEFAULT_CITIES = 8
+DEFAULT_DAYS = 7
+DEFAULT_INTERVAL = 300
+DEFAULT_WORKERS = 4
+
+
+def cache_is_shared():
+    """Whether other processes see what this one stores in the default cache."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def popular_cities(limit=None, days=None):
+    """Names of the ``limit`` cities searched most in the last ``days`` days, most searched first."""
+    limit = limit or getattr(settings, 'WEATHER_POPULAR_CITIES', DEFAULT_CITIES)
+    days = days or getattr(settings, 'WEATHER_POPULAR_DAYS', DEFAULT_DAYS)
+    return list(
+        CityWeatherHourly.objects.filter(hour__gte=timezone.now() - timedelta(days=days))
+        .values('city_name')
+        .annotate(total=Sum('searches'))
+        .order_by('-total', 'city_name')
+        .values_list('city_name', flat=True)[:limit]
+    )
+
+
+def _entry(reading):
+    """A reading under the field names the header templates use for ``SearchHistory``."""
+    return {
+        'city_name': reading['city'],
+        'temperature': reading['temp'],
+        'feels_like': reading['feels_like'],
+        'humidity': reading['humidity'],
+        'wind_speed': reading['wind_speed'],
+        'description': reading['condition'],
+        'icon': reading['icon'],
+        'searched_at': reading['observed_at'],
+    }
+
+
+def refresh(cities=None, workers=None, interval=None):
+    """
+    Fetch current weather for ``cities`` (default: the popular ones) and store
+    the snapshot, expecting the next refresh in ``interval`` seconds
+    (default ``WEATHER_POPULAR_REFRESH``).
+    """
+    if cities is None:
+        cities = popular_cities()
+    workers = workers or getattr(settings, 'WEATHER_POPULAR_WORKERS', DEFAULT_WORKERS)
+    weather = client.get_client()
+    previous = {entry['city_name']: entry for entry in snapshot() or []}
+
+    def fetch(city):
+        try:
+            return _entry(weather.fetch(city))
+        except client.WeatherError as exc:
+            logger.warning('Could not refresh weather for %s: %s', city, exc)
+            # Keep the last good reading rather than dropping the city from the header.
+            return previous.get(client.normalize(city))
+
+    if cities:
+        with ThreadPoolExecutor(max_workers=min(workers, len(cities)), thread_name_prefix='weather') as pool:
+            entries = [entry for entry in pool.map(fetch, cities) if entry is not None]
+    else:
+        entries = []
+    if interval is None:
+        interval = getattr(settings, 'WEATHER_POPULAR_REFRESH', DEFAULT_INTERVAL)
+    # Outlive a missed refresh or two, but not a stopped refresher.
+    cache.set(SNAPSHOT_KEY, entries, interval * 3)
+    bump_header_version(WEATHER)
+    return entries
+
+
+def snapshot():
+    """The last stored snapshot, or ``None``."""
+    return cache.get(SNAPSHOT_KEY)
+
+
+def header_weather(count=5):
+    """What the header shows: the snapshot, else the latest rollup of recently searched cities."""
+    entries = snapshot()
+    if entries:
+        return entries[:count]
+    latest = {}
+    for hourly in CityWeatherHourly.objects.filter(temperature__isnull=False).order_by('-searched_at')[:count * 4]:
+        latest.setdefault(hourly.city_name, hourly)
+    return list(latest.values())[:count]
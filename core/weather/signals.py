@@ -0,0 +1,18 @@
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import client, history
+from .models import SearchHistory
+
+
+@receiver(post_save, sender=SearchHistory)
+def roll_up_saved_search(sender, instance, created, raw=False, **kwargs):
+    # Buffered searches are bulk-inserted and rolled up by history.flush().
+    if created and not raw:
+        history.roll_up([instance])
+
+
+@receiver(setting_changed)
+def reset_weather_client(**kwargs):
+    client.reset_client(**kwargs)
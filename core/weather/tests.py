@@ -1,3 +1,276 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from context_processors import global_header_data
+from . import client, history, popular
+from .models import CityWeatherHourly, SearchHistory
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients that gave up on a slow response
+
+
+class FakeWeatherService:
+    """A local stand-in for OpenWeatherMap that counts its requests."""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.requests = []
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                city = parse_qs(urlparse(self.path).query)['q'][0]
+                service.requests.append(city)
+                time.sleep(service.delay)
+                if city.lower() == 'atlantis':
+                    status, body = 404, {'cod': '404', 'message': 'city not found'}
+                else:
+                    status, body = 200, {
+                        'main': {'temp': 21.5, 'feels_like': 20.0, 'humidity': 40},
+                        'wind': {'speed': 3.2},
+                        'weather': [{'description': 'clear sky', 'icon': '01d'}],
+                    }
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _Server(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/weather'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class WeatherClientTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = FakeWeatherService()
+        self.addCleanup(self.service.close)
+        settings = override_settings(WEATHER_API_URL=self.service.url, WEATHER_API_KEY='test')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_readings_are_cached(self):
+        first = client.lookup('  cairo ')
+        second = client.lookup('Cairo')
+        self.assertEqual(first['city'], 'Cairo')
+        self.assertEqual(second['temp'], 21.5)
+        self.assertEqual(self.service.requests, ['Cairo'])
+
+    def test_fresh_history_is_served_without_calling_the_service(self):
+        SearchHistory.objects.create(city_name='Giza', temperature=30, observed_at=timezone.now())
+        self.assertEqual(client.lookup('giza')['temp'], 30)
+        self.assertEqual(self.service.requests, [])
+
+        SearchHistory.objects.create(
+            city_name='Luxor', temperature=35, observed_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(client.lookup('luxor')['temp'], 21.5)
+        self.assertEqual(self.service.requests, ['Luxor'])
+
+    def test_concurrent_lookups_share_one_request(self):
+        self.service.delay = 0.3
+        weather = client.WeatherClient()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(weather.fetch('Aswan'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 8)
+        self.assertEqual(self.service.requests, ['Aswan'])
+
+    def test_unknown_city(self):
+        with self.assertRaisesMessage(client.CityNotFound, 'City not found'):
+            client.lookup('Atlantis')
+
+    @override_settings(WEATHER_TIMEOUT=(0.5, 0.2), WEATHER_FAILURE_THRESHOLD=2, WEATHER_FAILURE_COOLDOWN=60)
+    def test_slow_service_times_out_then_is_left_alone(self):
+        self.service.delay = 1
+        for _ in range(2):
+            start = time.monotonic()
+            with self.assertRaises(client.WeatherUnavailable):
+                client.lookup('Alexandria')
+            self.assertLess(time.monotonic() - start, 0.9)
+        with self.assertRaises(client.WeatherUnavailable):
+            client.lookup('Alexandria')
+        self.assertEqual(len(self.service.requests), 2)
+
+        # While the service is down, an older reading is better than none.
+        SearchHistory.objects.create(
+            city_name='Alexandria', temperature=18, observed_at=timezone.now() - timedelta(hours=1)
+        )
+        reading = client.lookup('Alexandria')
+        self.assertEqual(reading['temp'], 18)
+        self.assertTrue(reading['stale'])
+
+    def test_search_page_records_the_search(self):
+        response = self.client.post(reverse('weather:search'), {'city': 'tanta'}, secure=True)
+        self.assertContains(response, 'Weather in Tanta')
+        self.assertEqual(history.flush(), 1)
+        row = SearchHistory.objects.get()
+        self.assertEqual((row.city_name, row.temperature), ('Tanta', 21.5))
+        self.assertIsNotNone(row.observed_at)
+
+        response = self.client.post(reverse('weather:search'), {'city': 'atlantis'}, secure=True)
+        self.assertContains(response, 'City not found')
+
+
+class SearchHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(history.flush)
+
+    def search(self, city, temperature, humidity=None, at=None):
+        history.record(
+            city_name=city, temperature=temperature, humidity=humidity, searched_at=at or timezone.now()
+        )
+
+    def test_searches_are_written_in_batches_and_rolled_up(self):
+        hour = history.hour_of(timezone.now())
+        for temperature, humidity in ((20, 40), (26, 60), (23, None)):
+            self.search('Cairo', temperature, humidity, at=hour + timedelta(minutes=temperature))
+        self.assertEqual(SearchHistory.objects.count(), 0)
+        # One INSERT for the batch, UPDATE-or-INSERT of its rollup, savepoints, the searches counter.
+        with self.assertNumQueries(8):
+            self.assertEqual(history.flush(), 3)
+        self.assertEqual(SearchHistory.objects.count(), 3)
+
+        hourly = CityWeatherHourly.objects.get()
+        self.assertEqual((hourly.searches, hourly.temp_min, hourly.temp_max), (3, 20, 26))
+        self.assertAlmostEqual(hourly.temp_mean, 23)
+        self.assertAlmostEqual(hourly.humidity_mean, 50)
+        self.assertEqual(hourly.temperature, 26)  # the latest reading
+
+        self.search('Cairo', 10, at=hour + timedelta(minutes=1))
+        history.flush()
+        hourly.refresh_from_db()
+        self.assertEqual((hourly.searches, hourly.temp_min, hourly.temperature), (4, 10, 26))
+
+    def test_header_falls_back_to_the_rollups(self):
+        for city in ('Cairo', 'Giza', 'Cairo'):
+            self.search(city, 25)
+        history.flush()
+        with self.assertNumQueries(1):
+            recent = [hourly.city_name for hourly in global_header_data(None)['recent_weather_list']]
+        self.assertEqual(recent, ['Cairo', 'Giza'])
+
+    def test_entries_added_from_the_dashboard_are_rolled_up(self):
+        SearchHistory.objects.create(city_name='Aswan', temperature=38)
+        self.assertEqual(CityWeatherHourly.objects.get().searches, 1)
+
+    def test_failed_flush_keeps_rows_for_the_next(self):
+        for temperature in (20, 21):
+            self.search('Cairo', temperature)
+        with mock.patch.object(history, 'roll_up', side_effect=OperationalError('locked')), \
+                self.assertLogs('weather.history', 'ERROR'):
+            self.assertEqual(history.flush(), 0)
+        self.assertEqual(history.pending(), 2)
+        self.assertEqual([row.pk for row in history._buffer], [None, None])
+        self.assertEqual(history.flush(), 2)
+        self.assertEqual(SearchHistory.objects.count(), 2)
+        self.assertEqual(CityWeatherHourly.objects.get().searches, 2)
+
+    @override_settings(WEATHER_HISTORY_MAX_BUFFER=3)
+    def test_failed_flushes_keep_a_bounded_buffer(self):
+        for temperature in range(5):
+            self.search('Cairo', temperature)
+        with mock.patch.object(history, 'roll_up', side_effect=OperationalError('locked')), \
+                self.assertLogs('weather.history', 'WARNING') as logs:
+            history.flush()
+        self.assertIn('dropped the 2 oldest', logs.output[-1])
+        self.assertEqual([row.temperature for row in history._buffer], [2, 3, 4])
+
+    def test_prune(self):
+        old = history.hour_of(timezone.now() - timedelta(days=40))  # all in one hourly rollup
+        for i in range(7):
+            self.search('Cairo', 20, at=old + timedelta(minutes=i))
+        self.search('Cairo', 21)
+        history.flush()
+        self.assertEqual(history.prune(timezone.now() - timedelta(days=30), chunk_size=3), 7)
+        self.assertEqual(SearchHistory.objects.count(), 1)
+        self.assertEqual(sum(CityWeatherHourly.objects.values_list('searches', flat=True)), 8)
+        self.assertEqual(history.prune_rollups(timezone.now() - timedelta(days=30)), 1)
+
+
+class PopularCityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = FakeWeatherService(delay=0.2)
+        self.addCleanup(self.service.close)
+        settings = override_settings(WEATHER_API_URL=self.service.url, WEATHER_API_KEY='test')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for city, searches in (('Cairo', 5), ('Giza', 3), ('Luxor', 2), ('Aswan', 1)):
+            for _ in range(searches):
+                history.record(city_name=city, temperature=10)
+        history.flush()
+
+    def test_most_searched_cities_are_refreshed_concurrently(self):
+        self.assertEqual(popular.popular_cities(3), ['Cairo', 'Giza', 'Luxor'])
+        start = time.monotonic()
+        entries = popular.refresh(['Cairo', 'Giza', 'Luxor'], workers=3)
+        self.assertLess(time.monotonic() - start, 0.5)  # not 3 x 0.2s one after another
+        self.assertEqual([entry['city_name'] for entry in entries], ['Cairo', 'Giza', 'Luxor'])
+        self.assertEqual(entries[0]['temperature'], 21.5)
+
+    def test_header_never_calls_the_weather_service(self):
+        popular.refresh(['Cairo', 'Giza'])
+        requests_before = len(self.service.requests)
+        with self.assertNumQueries(0):
+            header = global_header_data(None)
+            cities = [entry['city_name'] for entry in header['recent_weather_list']]
+        self.assertEqual(cities, ['Cairo', 'Giza'])
+        self.assertEqual(header['recent_weather']['city_name'], 'Cairo')
+        self.assertEqual(len(self.service.requests), requests_before)
+
+    def test_failed_refresh_keeps_the_last_reading(self):
+        popular.refresh(['Cairo'])
+        self.service.close()
+        client.reset_client()
+        with self.assertLogs('weather.popular', 'WARNING'):
+            entries = popular.refresh(['Cairo'])
+        self.assertEqual([entry['city_name'] for entry in entries], ['Cairo'])
+
+    def test_snapshot_outlives_the_refresh_interval(self):
+        with mock.patch.object(popular, 'cache', wraps=cache) as wrapped:
+            entries = popular.refresh(['Cairo'], interval=10)
+        wrapped.set.assert_called_once_with(popular.SNAPSHOT_KEY, entries, 30)
+
+    def test_command_needs_a_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, 'per-process'):
+            call_command('refresh_popular_weather', stdout=io.StringIO())
+
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+        with override_settings(CACHES=shared), mock.patch.object(popular, 'refresh', return_value=[]) as refresh:
+            call_command('refresh_popular_weather', '--interval=42', '--cities=2', stdout=io.StringIO())
+        refresh.assert_called_once_with(['Cairo', 'Giza'], interval=42.0)
@@ -0,0 +1,66 @@
+#!/usr/bin/env bash
+# Run the test suite against SQLite and against a throwaway local Postgres.
+#
+#   scripts/test_matrix.sh                  # every app
+#   scripts/test_matrix.sh shop payments    # arguments go to `manage.py test`
+#
+# The Postgres leg needs the server binaries (initdb, pg_ctl) on PATH, in
+# PG_BIN, or reported by pg_config; it creates a cluster in a temporary
+# directory, listens only on a Unix socket there, and deletes it on exit.
+# Set MATRIX=sqlite or MATRIX=postgres to run a single leg.
+set -euo pipefail
+
+cd "$(dirname "$0")/../core"
+MATRIX="${MATRIX:-sqlite postgres}"
+PG_DIR=""
+status=0
+
+cleanup() {
+    if [[ -n "$PG_DIR" ]]; then
+        "$PG_BIN/pg_ctl" -D "$PG_DIR/data" -m immediate stop >/dev/null 2>&1 || true
+        rm -rf "$PG_DIR"
+    fi
+}
+trap cleanup EXIT
+
+run_sqlite() {
+    echo "== sqlite"
+    DB_ENGINE=sqlite python manage.py test --noinput "$@"
+}
+
+run_postgres() {
+    if [[ -z "${PG_BIN:-}" ]]; then
+        if command -v initdb >/dev/null; then
+            PG_BIN="$(dirname "$(command -v initdb)")"
+        elif command -v pg_config >/dev/null; then
+            PG_BIN="$(pg_config --bindir)"
+        fi
+    fi
+    local bin="${PG_BIN:-}"
+    if [[ ! -x "$bin/initdb" || ! -x "$bin/pg_ctl" ]]; then
+        echo "== postgres: initdb/pg_ctl not found${bin:+ in $bin} (set PG_BIN)" >&2
+        return 1
+    fi
+
+    PG_DIR="$(mktemp -d)"
+    local dir="$PG_DIR"
+    "$bin/initdb" -D "$dir/data" -U postgres -A trust -E UTF8 --locale=C >/dev/null || return 1
+    # Durability is irrelevant for a throwaway test cluster.
+    "$bin/pg_ctl" -D "$dir/data" -l "$dir/server.log" -w \
+        -o "-k $dir -c listen_addresses='' -c fsync=off -c synchronous_commit=off -c full_page_writes=off" \
+        start >/dev/null || { cat "$dir/server.log" >&2; return 1; }
+
+    echo "== postgres ($("$bin/postgres" --version))"
+    # The replica alias points at the same server, which exercises routing.
+    DB_ENGINE=postgres DB_HOST="$dir" DB_PORT=5432 DB_USER=postgres DB_NAME=postgres \
+        DB_REPLICA_HOST="$dir" \
+        python manage.py test --noinput "$@"
+}
+
+for leg in $MATRIX; do
+    if ! "run_$leg" "$@"; then
+        echo "== $leg: FAILED" >&2
+        status=1
+    fi
+done
+exit $status